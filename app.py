@@ -5,14 +5,46 @@
 シンプルな認証システムを持つ試験問題管理システム
 """
 
+import atexit
+import click
+import base64
+import functools
+import hashlib
+import json
+import mimetypes
+import re
 import sqlite3
-from typing import Final, Optional
+import threading
+from typing import Callable, Final, Iterator, Optional
 import unicodedata
 import os
-from datetime import datetime
+import secrets
+import tempfile
+import time
+import zipfile
+import concurrent.futures
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
-from flask import Flask, g, redirect, render_template, request, url_for, flash, session, send_from_directory
+from flask import Flask, abort, g, redirect, render_template, request, url_for, flash, session, send_from_directory
+from flask import before_render_template, template_rendered
+from flask import Request as FlaskRequest
 from werkzeug import Response
+from markupsafe import escape
+from werkzeug.security import safe_join
+from build_assets import (BUNDLES, DIST_FOLDER_NAME, FINGERPRINT_LENGTH, MANIFEST_NAME, SOURCE_FOLDER_NAME,
+                          VENDOR_ASSETS, VENDOR_FOLDER_NAME, load_manifest)
+from compression import COMPRESS_ENABLED, CompressionMiddleware
+from init_db import apply_db_profile, upgrade_database
+from metrics import (METRICS_ENABLED, SLOW_REQUEST_THRESHOLD, InstrumentedConnection, dump_snapshot, query_stats,
+                     registry, render_metrics)
+from passwords import hash_password, needs_rehash, run_password_task, verify_password
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow がない環境では縮小画像を作らず元画像をそのまま返す
+    Image = None
 
 # データベースのファイル名（相対パス）
 DATABASE: Final[str] = os.environ.get('DATABASE_PATH', 'database.db')
@@ -21,19 +53,109 @@ DATABASE: Final[str] = os.environ.get('DATABASE_PATH', 'database.db')
 UPLOAD_FOLDER = os.path.join('static', 'uploads')
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # ファイルを読み書きする単位（1MB）
+
+# 分割アップロード（大きな PDF など）の設定
+MAX_UPLOAD_SIZE: Final[int] = int(os.environ.get('MAX_UPLOAD_SIZE', 200 * 1024 * 1024))  # 200MB
+UPLOAD_PART_SIZE: Final[int] = 4 * 1024 * 1024  # ブラウザから1回に送る大きさ（4MB）
+PARTIAL_FOLDER_NAME: Final[str] = '.partial'
+UPLOAD_SESSION_TTL: Final[int] = 24 * 60 * 60  # 完了しなかったアップロードを残す秒数
+
+# 参照がなくなったアップロードファイルの削除（PendingFileDeletions）の設定
+FILE_DELETE_WORKERS: Final[int] = int(os.environ.get('FILE_DELETE_WORKERS', 4))
+FILE_DELETE_BATCH_SIZE: Final[int] = 100
+TRASH_FOLDER_NAME: Final[str] = '.trash'
+ORPHAN_SWEEP_INTERVAL: Final[int] = int(os.environ.get('ORPHAN_SWEEP_INTERVAL', 6 * 60 * 60))  # 孤立ファイルを掃除する間隔
+ORPHAN_GRACE_PERIOD: Final[int] = 60 * 60  # 保存直後（コミット前かもしれない）のファイルを掃除しない秒数
+
+# ログインの試行回数の制限（直近 LOGIN_RATE_WINDOW 秒間の回数）と試行履歴の書き込み
+LOGIN_RATE_WINDOW: Final[int] = int(os.environ.get('LOGIN_RATE_WINDOW', 15 * 60))
+LOGIN_MAX_FAILURES_PER_EMAIL: Final[int] = int(os.environ.get('LOGIN_MAX_FAILURES_PER_EMAIL', 10))
+LOGIN_MAX_ATTEMPTS_PER_IP: Final[int] = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50))
+LOGIN_ATTEMPT_BATCH_SIZE: Final[int] = 100
+LOGIN_ATTEMPT_FLUSH_INTERVAL: Final[float] = 5.0
+
+# セッションのユーザーを確かめるとき、Users の行をメモリに置いておく秒数
+# （ユーザーを無効化してから、発行済みのセッションが使えなくなるまでの最大の秒数）
+USER_CACHE_TTL: Final[float] = float(os.environ.get('USER_CACHE_TTL', 30))
+USER_CACHE_SIZE: Final[int] = 10000
+
+# 試験詳細・一覧ページのキャッシュ（描画済みの HTML）の合計サイズの上限（0 でキャッシュしない）
+PAGE_CACHE_MAX_BYTES: Final[int] = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# 一括登録で受け付ける manifest とアーカイブの合計サイズ
+MAX_IMPORT_SIZE: Final[int] = int(os.environ.get('MAX_IMPORT_SIZE', 1024 * 1024 * 1024))  # 1GB
+
+# 拡張子ごとのファイル先頭のシグネチャ
+FILE_SIGNATURES: Final[dict[str, tuple[bytes, ...]]] = {
+    'pdf': (b'%PDF-',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+    'bmp': (b'BM',),
+    'tiff': (b'II*\x00', b'MM\x00*'),
+}
+
+# 縮小画像の種類と最大サイズ（幅, 高さ）
+IMAGE_DERIVATIVES: Final[dict[str, tuple[int, int]]] = {
+    'thumb': (480, 480),    # 詳細ページの一覧表示用サムネイル
+    'web': (1600, 1600),    # 拡大表示・印刷用
+}
+DERIVED_FOLDER_NAME: Final[str] = 'derived'
+
+# 内容の SHA-256 をファイル名にしたアップロードファイル（内容が変わらないので長期キャッシュできる）
+CONTENT_ADDRESSED_NAME: Final[re.Pattern] = re.compile(r'[0-9a-f]{64}\.[0-9a-z]+')
+IMMUTABLE_MAX_AGE: Final[int] = 365 * 24 * 60 * 60  # 1年
+
+# アップロードファイルの送信をフロントのサーバーに任せる場合の設定
+#   x-sendfile:       Apache の mod_xsendfile（X-Sendfile ヘッダーに絶対パスを返す）
+#   x-accel-redirect: nginx の internal location（UPLOAD_ACCEL_PREFIX + 相対パスを返す）
+# 未設定の場合は Flask が送信する
+UPLOAD_SENDFILE: Final[str] = os.environ.get('UPLOAD_SENDFILE', '').lower()
+UPLOAD_ACCEL_PREFIX: Final[str] = os.environ.get('UPLOAD_ACCEL_PREFIX', '/_uploads/')
+
+# Bootstrap / Font Awesome を static/vendor に取得していないときに CDN から読み込むか。
+# 学内の閉じたネットワークでは CDN に届かないので、既定では起動時（require_vendor_assets）にエラーにする
+ASSET_CDN_FALLBACK: Final[bool] = os.environ.get('ASSET_CDN_FALLBACK', '0') == '1'
+
+# 既定（MAX_CONTENT_LENGTH）より大きな本文を受け付けるエンドポイント -> 上限（バイト）
+ENDPOINT_MAX_CONTENT_LENGTH: Final[dict[str, int]] = {
+    'admin_import_execute': MAX_IMPORT_SIZE,
+}
+
+class AppRequest(FlaskRequest):
+    """エンドポイントごとに本文の大きさの上限を変えるリクエスト
+
+    request.max_content_length への代入は Flask 3.1 以降でしか使えないので、
+    ENDPOINT_MAX_CONTENT_LENGTH を参照するプロパティで上書きする（本文を読む時点では
+    URL の照合が済んでいて endpoint が決まっている）。
+    """
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        limit = ENDPOINT_MAX_CONTENT_LENGTH.get(self.endpoint or '')
+        return limit if limit is not None else super().max_content_length
 
 # Flask クラスのインスタンス
 app = Flask(__name__)
+app.request_class = AppRequest
 app.secret_key = os.environ.get('SECRET_KEY', 'exam_management_secret_key_2024')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+app.config['MAX_UPLOAD_SIZE'] = MAX_UPLOAD_SIZE
+app.config['UPLOAD_PART_SIZE'] = UPLOAD_PART_SIZE
+app.config['USE_X_SENDFILE'] = UPLOAD_SENDFILE == 'x-sendfile'
+
+# テキストのレスポンスを Accept-Encoding に応じて gzip / brotli で圧縮する
+if COMPRESS_ENABLED:
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
 # アップロードフォルダが存在しない場合は作成
 try:
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 except Exception as e:
     # 権限がない場合は一時的なフォルダを使用
-    import tempfile
     UPLOAD_FOLDER = tempfile.mkdtemp()
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
@@ -59,40 +181,218 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def stage_upload(stream, original_filename: str) -> tuple[str, str]:
+    """アップロードファイルを一時ファイルに書き出し、(一時ファイルのパス, 保存名) を返す
+
+    保存名は内容の SHA-256 に元の拡張子を付けたもの。書き込みとハッシュ計算は
+    トランザクションの外で行い、commit_upload で保存名に移す。
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    extension = original_filename.rsplit('.', 1)[1].lower()
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard_staged_upload(temp_path)
+        raise
+    return temp_path, f'{digest.hexdigest()}.{extension}'
+
+def commit_upload(temp_path: str, filename: str) -> None:
+    """stage_upload で書き出したファイルを保存名に移す
+
+    同じ内容のファイルが1つだけ保存され、ExamQuestions.picture が同じ値の行の数が
+    そのファイルの参照数になる。drain_file_deletions と競合しないよう、ExamQuestions に
+    行を追加する書き込みトランザクションを開始した後に呼ぶこと。
+    """
+    try:
+        # 既に同じ内容のファイルがあっても置き換えるだけなので結果は変わらない
+        os.replace(temp_path, os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    except BaseException:
+        discard_staged_upload(temp_path)
+        raise
+
+def discard_staged_upload(temp_path: str) -> None:
+    """stage_upload で書き出した一時ファイルを削除"""
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+def store_upload(stream, original_filename: str) -> str:
+    """アップロードファイルを内容の SHA-256 をファイル名として保存し、保存名を返す
+
+    commit_upload と同じく、書き込みトランザクションを開始した後に呼ぶこと。
+    """
+    temp_path, filename = stage_upload(stream, original_filename)
+    commit_upload(temp_path, filename)
+    return filename
+
+def matches_signature(filename: str, head: bytes) -> bool:
+    """ファイル先頭の内容が拡張子の形式と矛盾しないか判定
+
+    head が短くまだ判定できない場合は True を返す。
+    """
+    extension = filename.rsplit('.', 1)[1].lower()
+    return any(head.startswith(sig) or sig.startswith(head)
+               for sig in FILE_SIGNATURES[extension])
+
+class ConnectionPool:
+    """SQLite 接続プール
+
+    接続はプロセス単位で保持し（fork 後は親プロセスの接続を使わない）、
+    同じスレッドには前回そのスレッドが返却した接続を優先して貸し出す。
+    チューニングプロファイル（init_db.DB_PROFILE）は接続の作成時に一度だけ
+    適用し、接続ごとのプリペアドステートメントキャッシュを再利用できるようにする。
+    """
+
+    def __init__(self, database: str, max_idle: int = 8, cached_statements: int = 256) -> None:
+        self.database = database
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # スレッド識別子 -> 返却済みの接続
+        self._idle: dict[int, sqlite3.Connection] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        """新しい接続を作成して設定を適用"""
+        con = sqlite3.connect(self.database, cached_statements=self.cached_statements,
+                              check_same_thread=False,
+                              factory=InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection)
+        apply_db_profile(con)
+        upgrade_database(con)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def _check_pid(self) -> None:
+        """fork 後であれば親プロセスから引き継いだ接続を破棄（ロック取得中に呼ぶ）"""
+        if self._pid != os.getpid():
+            # 親プロセスと共有している接続は close せずに参照だけ捨てる
+            self._idle = {}
+            self._pid = os.getpid()
+
+    def checkout(self) -> sqlite3.Connection:
+        """接続を借りる"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._check_pid()
+            con = self._idle.pop(ident, None)
+            if con is None and self._idle:
+                # 同じスレッドの接続がなければ最も新しく返却された接続を使う
+                _, con = self._idle.popitem()
+        if con is None:
+            con = self._connect()
+        return con
+
+    def checkin(self, con: sqlite3.Connection) -> None:
+        """接続を返却（未確定のトランザクションは破棄）"""
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            con.close()
+            return
+        with self._lock:
+            self._check_pid()
+            ident = threading.get_ident()
+            if ident not in self._idle and len(self._idle) < self.max_idle:
+                self._idle[ident] = con
+                return
+        con.close()
+
+    def close_all(self) -> None:
+        """プール中の接続をすべて閉じる"""
+        with self._lock:
+            self._check_pid()
+            idle, self._idle = self._idle, {}
+        for con in idle.values():
+            con.close()
+
+db_pool = ConnectionPool(DATABASE)
+
 def get_db() -> sqlite3.Connection:
-    """データベース接続を得る"""
+    """データベース接続を得る（プールから借りる）"""
     db = getattr(g, '_database', None)
     if db is None:
         try:
-            db = g._database = sqlite3.connect(DATABASE)
-            db.execute('PRAGMA foreign_keys = ON')
-            db.row_factory = sqlite3.Row
+            db = g._database = db_pool.checkout()
         except Exception as e:
             # データベース接続エラーの場合、詳細をログに出力
-            import sys
-            print(f"Database connection error: {e}", file=sys.stderr)
+            app.logger.error("Database connection error: %s", e)
             raise
     return db
 
 @app.teardown_appcontext
 def close_connection(exception: Optional[BaseException]) -> None:
-    """データベース接続を閉じる"""
+    """データベース接続をプールに返却する"""
     db = getattr(g, '_database', None)
     if db is not None:
-        db.close()
+        db_pool.checkin(db)
+
+# ===== 計測 =====
+#
+# ルートごとの処理時間、テンプレートの描画時間、SQL 文ごとの実行時間を metrics.registry に
+# 集計し、/metrics で Prometheus のテキスト形式で返す（SQL は InstrumentedConnection が数える）。
+
+# /metrics を参照するためのトークン（未設定なら同じホストからのアクセスのみ許可）
+METRICS_TOKEN: Final[str] = os.environ.get('METRICS_TOKEN', '')
 
-def hash_password(password: str) -> str:
-    """パスワードをそのまま返す（平文版）"""
-    return password
+if METRICS_ENABLED:
+    @app.before_request
+    def start_request_timer() -> None:
+        """リクエストの計測を開始"""
+        g._request_started = time.perf_counter()
+        query_stats.reset()
 
-def verify_password(password: str, password_hash: str) -> bool:
-    """パスワードを検証（平文版）"""
-    return password == password_hash
+    @app.after_request
+    def record_request_timer(response: Response) -> Response:
+        """ルートごとの処理時間と SQL の実行数を記録（遅いリクエストはログに出力）"""
+        started = g.pop('_request_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        registry.observe('http_request_duration_seconds', elapsed,
+                         (('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))))
+        registry.inc('http_request_queries_total', (('endpoint', endpoint),), query_stats.count)
+        registry.inc('http_request_query_seconds_total', (('endpoint', endpoint),), query_stats.seconds)
+        if elapsed >= SLOW_REQUEST_THRESHOLD:
+            app.logger.warning('slow request (%.1fms): %s %s, %d queries (%.1fms)', elapsed * 1000,
+                               request.method, request.path, query_stats.count, query_stats.seconds * 1000)
+        dump_snapshot()
+        return response
+
+    @before_render_template.connect_via(app)
+    def start_template_timer(sender: Flask, template, context: dict, **extra) -> None:
+        """テンプレートの描画時間の計測を開始"""
+        g.setdefault('_template_started', []).append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def record_template_timer(sender: Flask, template, context: dict, **extra) -> None:
+        """テンプレートの描画時間を記録"""
+        started = g.get('_template_started')
+        if started:
+            registry.observe('template_render_duration_seconds', time.perf_counter() - started.pop(),
+                             (('template', template.name or 'string'),))
+
+@app.route('/metrics')
+def metrics() -> Response:
+    """計測値（Prometheus のテキスト形式）"""
+    if METRICS_TOKEN:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+            abort(403)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 def login_required(f):
     """ログイン必須デコレータ"""
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_user() is None:
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     # 手動でメタデータを設定
@@ -101,10 +401,256 @@ def login_required(f):
     decorated_function.__module__ = f.__module__
     return decorated_function
 
+def admin_required(f):
+    """管理者（admin / staff）必須デコレータ"""
+    def decorated_function(*args, **kwargs):
+        user = current_user()
+        if user is None:
+            return redirect(url_for('login'))
+        if user['user_type'] not in ('admin', 'staff'):
+            abort(403)
+        return f(*args, **kwargs)
+    # 手動でメタデータを設定
+    decorated_function.__name__ = f.__name__
+    decorated_function.__doc__ = f.__doc__
+    decorated_function.__module__ = f.__module__
+    return decorated_function
+
 def has_control_character(s: str) -> bool:
     """文字列に制御文字が含まれているか判定"""
     return any(map(lambda c: unicodedata.category(c) == 'Cc', s))
 
+# ===== ログイン試行の記録と制限 =====
+
+class SlidingWindowLimiter:
+    """キーごとに直近 window 秒間の回数を数え、limit 回に達したキーを拒否する（スライディングウィンドウ）
+
+    キーごとに最大 limit 個の時刻だけを保持し、キーの数も max_keys までに抑える
+    （古いキーから捨てる）。プロセスごとのメモリ上のカウンターで、DB には触れない。
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100000) -> None:
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._hits: OrderedDict[str, deque] = OrderedDict()
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """次に許可されるまでの秒数（今すぐ許可される場合は 0）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None or len(hits) < self.limit:
+                return 0.0
+            return max(0.0, hits[0] + self.window - now)
+
+    def hit(self, key: str, now: Optional[float] = None) -> None:
+        """1回分を記録"""
+        now = time.time() if now is None else now
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                hits = self._hits[key] = deque(maxlen=self.limit)
+                while len(self._hits) > self.max_keys:
+                    self._hits.popitem(last=False)
+            else:
+                self._hits.move_to_end(key)
+            hits.append(now)
+
+    def reset(self, key: str) -> None:
+        """記録を消す"""
+        with self._lock:
+            self._hits.pop(key, None)
+
+class LoginAttemptLog:
+    """ログイン試行をメモリにため、LoginAttempts にまとめて書き込む
+
+    書き込みはバックグラウンドのスレッドが flush_interval 秒ごと、または batch_size 件
+    たまったときに executemany で行うので、ログイン処理は記録のために DB を待たない。
+    """
+
+    def __init__(self, pool: ConnectionPool, batch_size: int, flush_interval: float) -> None:
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._buffer: list[tuple] = []
+        self._wakeup = threading.Event()
+        self._pid: Optional[int] = None
+
+    def start(self) -> None:
+        """このプロセスで未起動なら、直近の試行を制限に読み込んでから書き込みスレッドを起動する
+
+        再起動や fork の直後に制限が空の状態で判定しないよう、制限を確認する前に呼ぶ。
+        fork 後は親プロセスの未書き込み分を引き継がずに起動し直す。
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            try:
+                load_recent_login_attempts(self.pool)
+            except sqlite3.Error as e:
+                app.logger.error("Login attempt load error: %s", e)
+            with self._lock:
+                self._buffer = []
+            threading.Thread(target=self._run, name='login-attempt-log', daemon=True).start()
+            # 読み込みが終わってから起動済みにする（他のスレッドは読み込みの完了を待つ）
+            self._pid = os.getpid()
+
+    def record(self, email: str, success: bool, user_id: Optional[int], failure_reason: Optional[str],
+               ip_address: Optional[str], user_agent: Optional[str]) -> None:
+        """試行を1件記録"""
+        row = (email, int(success), user_id, failure_reason, ip_address, user_agent,
+               datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+        self.start()
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        """書き込みスレッド: 定期的に、または batch_size 件たまったら書き込む"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        """たまった試行を書き込み、書き込んだ件数を返す"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        con = self.pool.checkout()
+        try:
+            con.executemany('''
+                INSERT INTO LoginAttempts
+                    (email, success, user_id, failure_reason, ip_address, user_agent, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            # 成功したログインは Users の最終ログイン日時にも反映する
+            con.executemany('''
+                UPDATE Users SET last_login_at = ?1
+                WHERE user_id = ?2 AND (last_login_at IS NULL OR last_login_at < ?1)
+            ''', [(row[6], row[2]) for row in rows if row[1] and row[2] is not None])
+            con.commit()
+            return len(rows)
+        except sqlite3.Error as e:
+            con.rollback()
+            app.logger.error("Login attempt flush error: %s", e)
+            return 0
+        finally:
+            self.pool.checkin(con)
+
+# 同じメールアドレスへのログイン失敗と、同じ IP アドレスからのログイン試行の上限
+login_email_limiter = SlidingWindowLimiter(LOGIN_MAX_FAILURES_PER_EMAIL, LOGIN_RATE_WINDOW)
+login_ip_limiter = SlidingWindowLimiter(LOGIN_MAX_ATTEMPTS_PER_IP, LOGIN_RATE_WINDOW)
+login_attempts = LoginAttemptLog(db_pool, LOGIN_ATTEMPT_BATCH_SIZE, LOGIN_ATTEMPT_FLUSH_INTERVAL)
+
+def shutdown() -> None:
+    """プロセスの終了時に未書き込みのログイン試行を書き出し、プールの接続を閉じる
+
+    atexit で呼ばれるほか、serve.py のワーカーは os._exit で終了するので終了前に run_worker が呼ぶ。
+    """
+    login_attempts.flush()
+    db_pool.close_all()
+
+atexit.register(shutdown)
+
+def load_recent_login_attempts(pool: ConnectionPool) -> None:
+    """再起動しても制限が解けないよう、LoginAttempts の直近の試行を制限に読み込む"""
+    con = pool.checkout()
+    try:
+        rows = con.execute('''
+            SELECT email, ip_address, success, failure_reason, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM LoginAttempts
+            WHERE timestamp >= datetime('now', ?)
+            ORDER BY timestamp
+        ''', (f'-{LOGIN_RATE_WINDOW} seconds',)).fetchall()
+    finally:
+        pool.checkin(con)
+    for email, ip_address, success, failure_reason, at in rows:
+        if failure_reason == 'rate_limited':
+            continue
+        if ip_address:
+            login_ip_limiter.hit(ip_address, at)
+        if success:
+            login_email_limiter.reset(email)
+        else:
+            login_email_limiter.hit(email, at)
+
+# ===== セッションのユーザー =====
+#
+# セッション（署名付きの Cookie）には user_id と、ログインした時点の Users.session_version を
+# 記録する。リクエストごとに Users を読まずに済むよう、行は USER_CACHE_TTL 秒だけメモリに置き、
+# 無効化（is_active = 0）や session_version の変更はその時間内に反映される。
+
+class UserCache:
+    """user_id ごとに Users の行を ttl 秒だけ保持する（プロセスごと、最大 max_size 件）"""
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._rows: OrderedDict[int, tuple[float, Optional[dict]]] = OrderedDict()
+
+    def get(self, user_id: int, connect: Callable[[], sqlite3.Connection]) -> Optional[dict]:
+        """ユーザーの行を返す（存在しなければ None）。保持していないときだけ connect() の接続で読む"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._rows.get(user_id)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+        row = connect().execute('''
+            SELECT user_id, email, user_type, full_name, is_active, session_version
+            FROM Users WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        user = dict(row) if row is not None else None
+        with self._lock:
+            self._rows[user_id] = (now + self.ttl, user)
+            self._rows.move_to_end(user_id)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """保持している行を捨てる（user_id を省略するとすべて）"""
+        with self._lock:
+            if user_id is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(user_id, None)
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE)
+
+def current_user() -> Optional[dict]:
+    """ログイン中のユーザーの行を返す（未ログインやセッションが無効なら None）
+
+    ユーザーが削除・無効化されているか、session_version がログイン時と異なる場合は
+    セッションを消す。名前や種別が変わっていればセッションの表示用の値も更新する。
+    """
+    if 'user' in g:
+        return g.user
+    user = None
+    user_id = session.get('user_id')
+    if user_id is not None:
+        user = user_cache.get(user_id, get_db)
+        if (user is None or not user['is_active']
+                or user['session_version'] != session.get('session_version')):
+            session.clear()
+            user = None
+        else:
+            for key in ('email', 'user_type', 'full_name'):
+                if session.get(key) != user[key]:
+                    session[key] = user[key]
+    g.user = user
+    return user
+
 # ===== 認証関連のルート =====
 
 @app.route('/')
@@ -115,8 +661,7 @@ def index() -> Response:
             return redirect(url_for('home'))
         return redirect(url_for('login'))
     except Exception as e:
-        import sys
-        print(f"Index route error: {e}", file=sys.stderr)
+        app.logger.error("Index route error: %s", e)
         return render_template('error/500.html'), 500
 
 @app.route('/login')
@@ -127,8 +672,7 @@ def login() -> str:
             return redirect(url_for('home'))
         return render_template('auth/login.html')
     except Exception as e:
-        import sys
-        print(f"Login route error: {e}", file=sys.stderr)
+        app.logger.error("Login route error: %s", e)
         return render_template('error/500.html'), 500
 
 @app.route('/login', methods=['POST'])
@@ -146,25 +690,62 @@ def login_execute() -> Response:
         flash('keio.jpドメインのメールアドレスを使用してください', 'error')
         return redirect(url_for('login'))
     
+    # 試行回数の上限を超えていれば DB やパスワードの検証に進まず拒否する
+    login_attempts.start()
+    ip_address = request.remote_addr
+    user_agent = request.user_agent.string[:255] or None
+    retry_after = max(login_ip_limiter.retry_after(ip_address or ''), login_email_limiter.retry_after(email))
+    if retry_after > 0:
+        login_attempts.record(email, False, None, 'rate_limited', ip_address, user_agent)
+        flash(f'ログイン試行回数が多すぎます。{int(retry_after) // 60 + 1}分ほど待ってから再度お試しください', 'error')
+        return render_template('auth/login.html'), 429, {'Retry-After': str(int(retry_after) + 1)}
+    login_ip_limiter.hit(ip_address or '')
+    
     try:
         con = get_db()
         cur = con.cursor()
         
         user = cur.execute('''
-            SELECT user_id, email, password_hash, user_type, full_name
+            SELECT user_id, email, password_hash, user_type, full_name, is_active, session_version
             FROM Users WHERE email = ?
         ''', (email,)).fetchone()
         
-        if user is None or not verify_password(password, user['password_hash']):
+        if user is None:
+            # 存在しないアドレスでも同じだけ時間をかけ、応答時間から登録の有無を推測されないようにする
+            run_password_task(hash_password, password)
+            login_email_limiter.hit(email)
+            login_attempts.record(email, False, None, 'unknown_email', ip_address, user_agent)
             flash('メールアドレスまたはパスワードが正しくありません', 'error')
             return redirect(url_for('login'))
+        if not run_password_task(verify_password, password, user['password_hash']):
+            login_email_limiter.hit(email)
+            login_attempts.record(email, False, user['user_id'], 'invalid_password', ip_address, user_agent)
+            flash('メールアドレスまたはパスワードが正しくありません', 'error')
+            return redirect(url_for('login'))
+        
+        if not user['is_active']:
+            login_attempts.record(email, False, user['user_id'], 'inactive', ip_address, user_agent)
+            flash('このアカウントは利用停止されています', 'error')
+            return redirect(url_for('login'))
+        
+        login_email_limiter.reset(email)
+        login_attempts.record(email, True, user['user_id'], None, ip_address, user_agent)
+        
+        # 平文や古いコスト設定のハッシュは現在の設定でハッシュし直す
+        if needs_rehash(user['password_hash']):
+            cur.execute('UPDATE Users SET password_hash = ? WHERE user_id = ? AND password_hash = ?',
+                        (run_password_task(hash_password, password), user['user_id'], user['password_hash']))
+            con.commit()
         
         # ログイン成功
+        session.clear()
         session['user_id'] = user['user_id']
+        session['session_version'] = user['session_version']
         session['email'] = user['email']
         session['user_type'] = user['user_type']
         session['full_name'] = user['full_name']
         session['login_time'] = datetime.now().isoformat()
+        user_cache.invalidate(user['user_id'])
         
         flash(f'ようこそ、{user["full_name"]}さん', 'success')
         return redirect(url_for('home'))
@@ -224,7 +805,7 @@ def register_execute() -> Response:
             return redirect(url_for('register'))
         
         # ユーザー登録
-        password_hash = hash_password(password)
+        password_hash = run_password_task(hash_password, password)
         cur.execute('''
             INSERT INTO Users (email, password_hash, user_type, full_name)
             VALUES (?, ?, ?, ?)
@@ -252,149 +833,551 @@ def logout() -> Response:
 def home() -> str:
     """ホームページ"""
     try:
-        cur = get_db().cursor()
-        
-        # 統計情報を取得
-        total_exams = cur.execute('SELECT COUNT(*) FROM Exams').fetchone()[0]
-        total_subjects = cur.execute('SELECT COUNT(*) FROM Subjects').fetchone()[0]
-        total_professors = cur.execute('SELECT COUNT(*) FROM Professors').fetchone()[0]
-        total_faculties = cur.execute('SELECT COUNT(*) FROM Faculties').fetchone()[0]
-        
+        # 統計情報を取得（トリガーで更新されるカウンターを1回で読み込む）
+        rows = get_db().execute('''
+            SELECT st.scope, st.key, st.value, f.faculty_name
+            FROM Statistics st
+            LEFT JOIN Faculties f ON st.scope = 'faculty' AND f.faculty_id = st.key
+            WHERE st.value > 0
+        ''').fetchall()
+    except sqlite3.Error:
+        stats = None
+    else:
+        totals = {row['key']: row['value'] for row in rows if row['scope'] == 'total'}
         stats = {
-            'exams': total_exams,
-            'subjects': total_subjects,
-            'professors': total_professors,
-            'faculties': total_faculties
+            'exams': totals.get('exams', 0),
+            'subjects': totals.get('subjects', 0),
+            'professors': totals.get('professors', 0),
+            'faculties': totals.get('faculties', 0),
+            # 学部別・年度別の試験数（多い順・新しい順）
+            'by_faculty': sorted(((row['faculty_name'], row['value']) for row in rows
+                                  if row['scope'] == 'faculty' and row['faculty_name']),
+                                 key=lambda item: -item[1]),
+            'by_year': sorted(((int(row['key']), row['value']) for row in rows if row['scope'] == 'year'),
+                              reverse=True),
         }
-    except:
-        stats = None
     
     return render_template('home.html', stats=stats)
 
-@app.route('/exams')
+# ===== ページキャッシュ =====
+#
+# 試験詳細・一覧ページの描画結果を、試験データと参照データの版（Statistics の 'version' 行、
+# 試験の追加・編集・削除でトリガーが上げる）ごとにメモリに置く。ページ中の利用者ごとの値
+# （名前・メールアドレス・user_id）は目印の文字列で描画しておき、返すときに置き換えるので、
+# 同じ種別（user_type）の利用者でキャッシュを共有できる。利用者が作成した試験を含むページ
+# （編集・削除のボタンが出る）だけは利用者ごとに描画する。
+#
+# GET のページには、同じ版と利用者の値から作る弱い ETag を付ける。If-None-Match が一致すれば
+# 版を読むだけで（一覧・詳細の結合クエリを実行せずに）304 を返す。
+
+# 利用者ごとの値の目印（プロセスごとに変える）
+VIEWER_PLACEHOLDER: Final[str] = f'viewer-{secrets.token_hex(8)}-'
+VIEWER_FIELDS: Final[tuple[str, ...]] = ('user_id', 'full_name', 'email')
+
+class PageCache:
+    """描画済みのページを (キー, 利用者の種別, 作成者として描画した user_id) ごとに保持する
+
+    版が変わるとすべて捨てる。合計 max_bytes を超えたら古く使われたものから捨てる。
+    各ページには、そのページに表示されている試験の作成者（owners）を添えておく。
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._version: Optional[tuple] = None
+        self._pages: OrderedDict[tuple, tuple[frozenset, str, int]] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: tuple, version: tuple, user_type: str, user_id: int) -> Optional[str]:
+        """保持しているページを返す（なければ None）"""
+        with self._lock:
+            if version != self._version:
+                return None
+            owner = None
+            page = self._pages.get((key, user_type, owner))
+            if page is None or user_id in page[0]:
+                owner = user_id
+                page = self._pages.get((key, user_type, owner))
+            if page is None:
+                return None
+            self._pages.move_to_end((key, user_type, owner))
+            return page[1]
+
+    def put(self, key: tuple, version: tuple, user_type: str, owner: Optional[int],
+            owners: frozenset, html: str) -> None:
+        """ページを保持（owner は作成者として描画した場合の user_id）"""
+        size = len(html.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version != self._version:
+                self._pages.clear()
+                self._size = 0
+                self._version = version
+            old = self._pages.pop((key, user_type, owner), None)
+            if old is not None:
+                self._size -= old[2]
+            self._pages[(key, user_type, owner)] = (owners, html, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, _, evicted) = self._pages.popitem(last=False)
+                self._size -= evicted
+
+page_cache = PageCache(PAGE_CACHE_MAX_BYTES)
+
+def data_version() -> tuple[int, int]:
+    """(試験データの版, 参照データの版)（リクエスト中は最初に読んだ値を使う）"""
+    if 'data_version' not in g:
+        versions = dict(get_db().execute('''
+            SELECT key, value FROM Statistics WHERE scope = 'version' AND key IN ('exams', 'reference')
+        ''').fetchall())
+        g.data_version = (versions.get('exams', 0), versions.get('reference', 0))
+    return g.data_version
+
+def page_cache_user() -> Optional[dict]:
+    """ページキャッシュを使えるときはログイン中のユーザーを返す
+
+    表示待ちのメッセージ（flash）があるときは、ページに埋め込まれるので使わない。
+    """
+    if PAGE_CACHE_MAX_BYTES <= 0 or '_flashes' in session:
+        return None
+    return current_user()
+
+def fill_viewer(html: str, user: dict) -> str:
+    """目印の文字列を利用者ごとの値に置き換える"""
+    for field in VIEWER_FIELDS:
+        html = html.replace(VIEWER_PLACEHOLDER + field, escape(str(user[field])))
+    return html
+
+_page_etag_salt: Optional[str] = None
+
+def page_etag_salt() -> str:
+    """テンプレート・静的ファイル・app.py の版（更新日時から作る。デバッグ時は毎回計算し直す）"""
+    global _page_etag_salt
+    if _page_etag_salt is None or app.debug:
+        digest = hashlib.sha1(json.dumps(asset_manifest(), sort_keys=True).encode('utf-8'))
+        folders = (os.path.join(app.root_path, app.template_folder),
+                   os.path.join(app.static_folder, SOURCE_FOLDER_NAME))
+        paths = [os.path.abspath(__file__)]
+        for folder in folders:
+            for root, _, files in os.walk(folder):
+                paths.extend(os.path.join(root, name) for name in files)
+        for path in sorted(paths):
+            digest.update(f'{path}:{os.path.getmtime(path)}'.encode('utf-8'))
+        _page_etag_salt = digest.hexdigest()[:16]
+    return _page_etag_salt
+
+def page_etag(key: tuple) -> Optional[str]:
+    """ページの弱い ETag の値（データの版・テンプレートの版・閲覧者の値から作る）
+
+    GET 以外のリクエストと、表示待ちのメッセージ（flash）があるときは None。
+    """
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        return None
+    user = current_user()
+    if user is None:
+        return None
+    stamp = repr((key, data_version(), page_etag_salt(), user['user_id'], user['user_type'],
+                  user['full_name'], user['email'], user['session_version']))
+    return 'page-' + hashlib.sha1(stamp.encode('utf-8')).hexdigest()[:20]
+
+def cached_page(key: tuple) -> Optional[str | Response]:
+    """キャッシュ済みのページを返す（なければ None。その場合は render_cached_page で描画する）
+
+    ブラウザが同じ ETag のページを持っていれば 304 の Response を返す。
+    """
+    etag = page_etag(key)
+    if etag is not None:
+        g.page_etag = etag
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304)
+    user = page_cache_user()
+    if user is None:
+        return None
+    html = page_cache.get(key, data_version(), user['user_type'], user['user_id'])
+    return None if html is None else fill_viewer(html, user)
+
+def render_cached_page(key: tuple, owners, template: str, **context) -> str:
+    """ページを描画してキャッシュに入れる（owners: ページに表示する試験の作成者の user_id）"""
+    user = page_cache_user()
+    if user is None:
+        return render_template(template, **context)
+    owners = frozenset(owners)
+    owner = user['user_id'] if user['user_id'] in owners else None
+    viewer = {field: VIEWER_PLACEHOLDER + field for field in VIEWER_FIELDS}
+    viewer['user_type'] = user['user_type']
+    if owner is not None:
+        viewer['user_id'] = owner
+    # テンプレートの session.* はこの値で描画する（利用者の値は fill_viewer で埋める）
+    html = render_template(template, session=viewer, **context)
+    page_cache.put(key, data_version(), user['user_type'], owner, owners, html)
+    return fill_viewer(html, user)
+
+@app.after_request
+def set_cache_headers(response: Response) -> Response:
+    """ページに ETag を付け、キャッシュの指定のない JSON はキャッシュさせない"""
+    etag = g.pop('page_etag', None)
+    if etag is not None and response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    elif response.is_json and 'Cache-Control' not in response.headers:
+        response.cache_control.no_store = True
+    return response
+
+# ===== 参照データ API =====
+
+# 版ごとに組み立て済みの参照データ JSON（プロセス内キャッシュ）
+_reference_cache: dict[int, bytes] = {}
+_reference_cache_lock = threading.Lock()
+
+def reference_version(cur: sqlite3.Cursor) -> int:
+    """参照データの版（学部・学科・試験種別・教員が変更されるとトリガーで上がる）"""
+    row = cur.execute('''
+        SELECT value FROM Statistics WHERE scope = 'version' AND key = 'reference'
+    ''').fetchone()
+    return row[0] if row else 0
+
+def build_reference_data(cur: sqlite3.Cursor, version: int) -> bytes:
+    """フォーム用の参照データを JSON にする"""
+    data = {
+        'version': version,
+        'faculties': [{'id': row[0], 'name': row[1]} for row in cur.execute(
+            'SELECT faculty_id, faculty_name FROM Faculties ORDER BY faculty_id')],
+        'departments': [{'id': row[0], 'faculty_id': row[1], 'name': row[2]} for row in cur.execute(
+            'SELECT department_id, faculty_id, department_name FROM Departments ORDER BY department_id')],
+        'exam_types': [{'id': row[0], 'name': row[1]} for row in cur.execute(
+            'SELECT exam_type_id, exam_type_name FROM ExamTypes ORDER BY exam_type_id')],
+        'professors': [row[0] for row in cur.execute(
+            'SELECT professor_name FROM Professors ORDER BY professor_name')],
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def reference_data_url() -> str:
+    """版を含む参照データの URL（版が変わるまでブラウザのキャッシュから読み込まれる）"""
+    return url_for('reference_data', v=reference_version(get_db().cursor()))
+
+def reference_data_body(cur: sqlite3.Cursor) -> tuple[int, bytes]:
+    """(参照データの版, JSON)（版ごとにプロセス内にキャッシュする）"""
+    version = reference_version(cur)
+    with _reference_cache_lock:
+        body = _reference_cache.get(version)
+    if body is None:
+        body = build_reference_data(cur, version)
+        with _reference_cache_lock:
+            _reference_cache.clear()
+            _reference_cache[version] = body
+    return version, body
+
+@app.route('/api/reference')
 @login_required
-def exams() -> str:
-    """試験一覧のページ"""
+def reference_data() -> Response:
+    """学部・学科・試験種別・教員の一覧を JSON で返す"""
     cur = get_db().cursor()
-    
-    # 明示的なJOINを使用してデータを取得（作成者情報も含める）
-    exam_list = cur.execute('''
-        SELECT 
-            e.exam_id,
-            f.faculty_name,
-            d.department_name,
-            s.subject_name,
-            et.exam_type_name,
-            e.exam_year,
-            GROUP_CONCAT(p.professor_name, ', ') AS professors,
-            e.created_by
-        FROM Exams e
-        JOIN Subjects s ON e.subject_id = s.subject_id
-        JOIN Departments d ON s.department_id = d.department_id
-        JOIN Faculties f ON d.faculty_id = f.faculty_id
-        JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
-        LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
-        LEFT JOIN Professors p ON ep.professor_id = p.professor_id
-        GROUP BY e.exam_id, f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year, e.created_by
-        ORDER BY e.exam_year DESC, f.faculty_name, d.department_name, s.subject_name
-    ''').fetchall()
-    
-    return render_template('exams/list.html', exam_list=exam_list)
+    version = reference_version(cur)
+    etag = f'reference-{version}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        _, body = reference_data_body(cur)
+        response = Response(body, mimetype='application/json')
+    # 圧縮すると CompressionMiddleware が弱い ETag にするので、304 でも同じ弱い ETag を返す
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    if request.args.get('v') == str(version):
+        # 版付きの URL は内容が変わらないので再検証しない
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
-@app.route('/exams', methods=['POST'])
-@login_required
-def exams_filtered() -> str:
-    """試験一覧のページ（絞り込み）"""
-    con = get_db()
-    cur = con.cursor()
-    
-    faculty_filter = request.form.get('faculty_filter', '').strip()
-    department_filter = request.form.get('department_filter', '').strip()
-    year_filter = request.form.get('year_filter', '').strip()
-    subject_filter = request.form.get('subject_filter', '').strip()
+# 試験一覧の1ページあたりの件数
+EXAMS_PER_PAGE: Final[int] = 50
+
+# 試験一覧の表示順（キーセットページングのキーと同じ列の並び）
+EXAM_LIST_ORDER: Final[str] = 'exam_year DESC, faculty_name, department_name, subject_name, exam_id'
+EXAM_LIST_ORDER_REVERSED: Final[str] = \
+    'exam_year ASC, faculty_name DESC, department_name DESC, subject_name DESC, exam_id DESC'
+
+# trigram トークナイザで検索できる最短の語の長さ
+FTS_MIN_TERM_LENGTH: Final[int] = 3
+
+# キーワード検索（関連度順）で表示する最大件数
+SEARCH_RESULT_LIMIT: Final[int] = 100
+
+EXAM_LIST_COLUMNS: Final[str] = \
+    'exam_id, faculty_name, department_name, subject_name, exam_type_name, exam_year, professors, created_by'
+
+def encode_cursor(exam: sqlite3.Row) -> str:
+    """一覧の行からページングカーソルを作成"""
+    key = [exam['exam_year'], exam['faculty_name'], exam['department_name'],
+           exam['subject_name'], exam['exam_id']]
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Optional[tuple]:
+    """ページングカーソルを (年度, 学部名, 学科名, 科目名, 試験ID) に戻す（不正な場合は None）"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        year, faculty_name, department_name, subject_name, exam_id = key
+        return (int(year), str(faculty_name), str(department_name), str(subject_name), int(exam_id))
+    except (ValueError, TypeError):
+        return None
+
+def fetch_exam_page(cur: sqlite3.Cursor, where: str, params: list,
+                    after: Optional[tuple] = None, before: Optional[tuple] = None,
+                    limit: int = EXAMS_PER_PAGE) -> tuple[list, Optional[str], Optional[str]]:
+    """ExamListing から1ページ分を取得し、(行, 前ページのカーソル, 次ページのカーソル) を返す
+
+    OFFSET は使わず、直前のページの端の行をキーにして表示順インデックスを
+    その位置から読み始める（キーセットページング）。年度だけ降順のため、
+    「同じ年度でキーより後ろ」と「それより前の年度」の2つの範囲検索に分けて
+    UNION ALL する。どちらもインデックスのシークになるので深いページでも
+    1ページ目と同じコストで取得できる。
+    """
+    key = before or after
+    if key is None:
+        rows = cur.execute(f'''
+            SELECT {EXAM_LIST_COLUMNS} FROM ExamListing
+            WHERE {where}
+            ORDER BY {EXAM_LIST_ORDER}
+            LIMIT ?
+        ''', [*params, limit + 1]).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, None, encode_cursor(rows[-1]) if has_more else None
+
+    if before is not None:
+        # 前のページ: 逆順に読んでから並べ直す
+        order, year_cmp, rest_cmp = EXAM_LIST_ORDER_REVERSED, '>', '<'
+    else:
+        order, year_cmp, rest_cmp = EXAM_LIST_ORDER, '<', '>'
+
+    rows = cur.execute(f'''
+        SELECT * FROM (
+            SELECT {EXAM_LIST_COLUMNS} FROM ExamListing
+            WHERE {where} AND exam_year = ?
+              AND (faculty_name, department_name, subject_name, exam_id) {rest_cmp} (?, ?, ?, ?)
+            ORDER BY {order} LIMIT ?
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT {EXAM_LIST_COLUMNS} FROM ExamListing
+            WHERE {where} AND exam_year {year_cmp} ?
+            ORDER BY {order} LIMIT ?
+        )
+        ORDER BY {order}
+        LIMIT ?
+    ''', [*params, *key, limit + 1, *params, key[0], limit + 1, limit + 1]).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    if before is not None:
+        rows.reverse()
+        prev_cursor = encode_cursor(rows[0]) if has_more and rows else None
+        next_cursor = encode_cursor(rows[-1]) if rows else None
+    else:
+        prev_cursor = encode_cursor(rows[0]) if rows else None
+        next_cursor = encode_cursor(rows[-1]) if has_more and rows else None
+    return rows, prev_cursor, next_cursor
+
+def fetch_ranked_exams(cur: sqlite3.Cursor, where: str, params: list, match: str,
+                       limit: int = SEARCH_RESULT_LIMIT) -> list:
+    """ExamSearch の MATCH 式に合う試験を関連度順に上位 limit 件取得"""
+    return cur.execute(f'''
+        SELECT {EXAM_LIST_COLUMNS} FROM ExamListing
+        JOIN (
+            SELECT rowid AS hit_id, rank AS hit_rank FROM ExamSearch WHERE ExamSearch MATCH ?
+        ) ON exam_id = hit_id
+        WHERE {where}
+        ORDER BY hit_rank
+        LIMIT ?
+    ''', [match, *params, limit]).fetchall()
+
+def fts_phrase(term: str) -> str:
+    """検索語を FTS5 のフレーズとして引用"""
+    return '"' + term.replace('"', '""') + '"'
+
+# 参照テーブルの ID で絞り込む条件（ExamListing の同名の列と idx_exam_listing_* で検索する）
+EXAM_ID_FILTERS: Final[tuple[str, ...]] = ('faculty_id', 'department_id', 'subject_id', 'exam_type_id')
+
+# 年度の条件と ExamListing.exam_year の比較
+EXAM_YEAR_FILTERS: Final[dict[str, str]] = {'year_filter': '=', 'year_from': '>=', 'year_to': '<='}
+
+def build_exam_filter(source) -> tuple[dict, str, list, str, bool]:
+    """絞り込み条件（source: request.args / request.form または同じキーの dict）から検索条件を作る
+
+    (絞り込み条件, ExamListing に対する WHERE 句, パラメータ, ExamSearch の MATCH 式, 関連度順か) を返す。
+    年度・ID が数値でない場合はその条件を空にする。
+    """
+    filters = {name: (source.get(name) or '').strip()
+               for name in ('faculty_filter', 'department_filter', 'subject_filter', 'q',
+                            *EXAM_YEAR_FILTERS, *EXAM_ID_FILTERS, 'professor_id')}
+    for name in (*EXAM_YEAR_FILTERS, *EXAM_ID_FILTERS, 'professor_id'):
+        try:
+            filters[name] = str(int(filters[name])) if filters[name] else ''
+        except ValueError:
+            filters[name] = ''
     
-    # 明示的なJOINを使用してデータを取得（作成者情報も含める）
-    query = '''
-        SELECT 
-            e.exam_id,
-            f.faculty_name,
-            d.department_name,
-            s.subject_name,
-            et.exam_type_name,
-            e.exam_year,
-            GROUP_CONCAT(p.professor_name, ', ') AS professors,
-            e.created_by
-        FROM Exams e
-        JOIN Subjects s ON e.subject_id = s.subject_id
-        JOIN Departments d ON s.department_id = d.department_id
-        JOIN Faculties f ON d.faculty_id = f.faculty_id
-        JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
-        LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
-        LEFT JOIN Professors p ON ep.professor_id = p.professor_id
-        WHERE 1=1
-    '''
+    where = '1=1'
     params = []
+    # 全文検索インデックス ExamSearch に対する MATCH 条件
+    match_terms = []
     
-    if faculty_filter:
-        query += ' AND f.faculty_name LIKE ?'
-        params.append(f'%{faculty_filter}%')
+    # 参照テーブルの ID と年度は ExamListing のインデックス（教員は ExamProfessors のインデックス）で絞り込む
+    for column in EXAM_ID_FILTERS:
+        if filters[column]:
+            where += f' AND {column} = ?'
+            params.append(int(filters[column]))
+    if filters['professor_id']:
+        where += ' AND exam_id IN (SELECT exam_id FROM ExamProfessors WHERE professor_id = ?)'
+        params.append(int(filters['professor_id']))
+    for name, operator in EXAM_YEAR_FILTERS.items():
+        if filters[name]:
+            where += f' AND exam_year {operator} ?'
+            params.append(int(filters[name]))
     
-    if department_filter:
-        query += ' AND d.department_name LIKE ?'
-        params.append(f'%{department_filter}%')
+    # 学部・学科・科目名は全文検索インデックスの列指定で絞り込む
+    # （trigram は3文字未満の語を検索できないため、その場合のみ LIKE を使う）
+    for column, value in (('faculty_name', filters['faculty_filter']),
+                          ('department_name', filters['department_filter']),
+                          ('subject_name', filters['subject_filter'])):
+        if not value:
+            continue
+        if len(value) >= FTS_MIN_TERM_LENGTH:
+            match_terms.append(f'{column} : {fts_phrase(value)}')
+        else:
+            where += f' AND {column} LIKE ?'
+            params.append(f'%{value}%')
     
-    if subject_filter:
-        query += ' AND s.subject_name LIKE ?'
-        params.append(f'%{subject_filter}%')
+    # キーワードは担当教員名・注意事項も含めたすべての列から検索し、関連度順に並べる
+    ranked = False
+    for term in filters['q'].split():
+        if len(term) >= FTS_MIN_TERM_LENGTH:
+            match_terms.append(fts_phrase(term))
+            ranked = True
+        else:
+            where += ''' AND exam_id IN (
+                SELECT rowid FROM ExamSearch
+                WHERE faculty_name LIKE ? OR department_name LIKE ? OR subject_name LIKE ?
+                   OR professors LIKE ? OR instructions LIKE ?
+            )'''
+            params.extend([f'%{term}%'] * 5)
     
-    if year_filter:
-        try:
-            year = int(year_filter)
-            query += ' AND e.exam_year = ?'
-            params.append(year)
-        except ValueError:
-            flash('年度は数値で入力してください', 'error')
+    return filters, where, params, ' AND '.join(match_terms), ranked
+
+def render_exam_list(source) -> str:
+    """絞り込み条件とカーソル（source: request.args または request.form）に応じて一覧を表示"""
+    filters, where, params, match, ranked = build_exam_filter(source)
+    if any((source.get(name) or '').strip() and not filters[name] for name in EXAM_YEAR_FILTERS):
+        flash('年度は数値で入力してください', 'error')
     
-    query += '''
-        GROUP BY e.exam_id, f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year, e.created_by
-        ORDER BY e.exam_year DESC, f.faculty_name, d.department_name, s.subject_name
-    '''
+    key = ('exams', tuple(filters.values()), source.get('after', ''), source.get('before', ''))
+    page = cached_page(key)
+    if page is not None:
+        return page
+    cur = get_db().cursor()
+    
+    if ranked:
+        # 関連度順の上位のみ表示（キーセットページングは行わない）
+        exam_list = fetch_ranked_exams(cur, where, params, match)
+        prev_cursor = next_cursor = None
+    else:
+        if match:
+            where += ' AND exam_id IN (SELECT rowid FROM ExamSearch WHERE ExamSearch MATCH ?)'
+            params.append(match)
+        after = decode_cursor(source.get('after', ''))
+        before = decode_cursor(source.get('before', ''))
+        exam_list, prev_cursor, next_cursor = fetch_exam_page(cur, where, params, after=after, before=before)
     
-    exam_list = cur.execute(query, params).fetchall()
+    # ページ移動リンクに引き継ぐ絞り込み条件
+    filter_args = {name: value for name, value in filters.items() if value}
     
-    return render_template('exams/list.html', exam_list=exam_list,
-                         faculty_filter=faculty_filter,
-                         department_filter=department_filter,
-                         year_filter=year_filter,
-                         subject_filter=subject_filter)
+    # 学部・学科・試験種別の選択肢
+    reference = json.loads(reference_data_body(cur)[1])
+    
+    return render_cached_page(key, [exam['created_by'] for exam in exam_list],
+                         'exams/list.html', exam_list=exam_list,
+                         filters=filters,
+                         faculties=reference['faculties'],
+                         departments=reference['departments'],
+                         exam_types=reference['exam_types'],
+                         subject_filter=filters['subject_filter'],
+                         keyword=filters['q'],
+                         filter_args=filter_args,
+                         prev_cursor=prev_cursor,
+                         next_cursor=next_cursor)
+
+@app.route('/exams')
+@login_required
+def exams() -> str:
+    """試験一覧のページ（ページ移動・絞り込み条件はクエリ文字列で受け取る）"""
+    return render_exam_list(request.args)
+
+@app.route('/exams', methods=['POST'])
+@login_required
+def exams_filtered() -> str:
+    """試験一覧のページ（絞り込み）"""
+    return render_exam_list(request.form)
+
+def export_response(export_format: str, filename: str, where: str, params: list, match: str = '') -> Response:
+    """書き出し（export_exams.py のジェネレータ）をそのままストリーミングで返す
+
+    レスポンスの送信はビュー関数が返った後（get_db の接続を返却した後）も続くため、
+    書き出し用の接続をプールから別に借り、送信し終えたら返却する。
+    """
+    from export_exams import EXPORT_MIMETYPES, iter_export
+
+    def generate():
+        con = db_pool.checkout()
+        try:
+            yield from iter_export(con.cursor(), export_format, where, params, match)
+        finally:
+            db_pool.checkin(con)
+
+    response = Response(generate(), mimetype=EXPORT_MIMETYPES[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # nginx などのプロキシでバッファリングせず、書き出した分から送る
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/exams/export.<export_format>')
+@login_required
+def exams_export(export_format: str) -> Response:
+    """絞り込み条件（クエリ文字列）に合う試験を CSV / JSON Lines / ZIP（manifest と問題ファイル）で書き出す"""
+    from export_exams import EXPORT_MIMETYPES
+    if export_format not in EXPORT_MIMETYPES:
+        abort(404)
+    _, where, params, match, _ = build_exam_filter(request.args)
+    return export_response(export_format, f'exams.{export_format}', where, params, match)
 
 @app.route('/exam/<int:exam_id>')
 @login_required
 def exam_detail(exam_id: int) -> str:
     """試験詳細ページ"""
+    key = ('exam_detail', exam_id)
+    page = cached_page(key)
+    if page is not None:
+        return page
     cur = get_db().cursor()
     
     # 試験詳細情報を取得
     exam = cur.execute('''
         SELECT 
-            e.exam_id,
-            f.faculty_name,
-            d.department_name,
-            s.subject_name,
-            et.exam_type_name,
-            e.exam_year,
+            l.exam_id,
+            l.faculty_name,
+            l.department_name,
+            l.subject_name,
+            l.exam_type_name,
+            l.exam_year,
             e.instructions,
-            GROUP_CONCAT(p.professor_name, ', ') AS professors,
-            e.created_by
-        FROM Exams e
-        JOIN Subjects s ON e.subject_id = s.subject_id
-        JOIN Departments d ON s.department_id = d.department_id
-        JOIN Faculties f ON d.faculty_id = f.faculty_id
-        JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
-        LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
-        LEFT JOIN Professors p ON ep.professor_id = p.professor_id
-        WHERE e.exam_id = ?
-        GROUP BY e.exam_id, f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year, e.instructions, e.created_by
+            l.professors,
+            l.created_by
+        FROM ExamListing l
+        JOIN Exams e ON l.exam_id = e.exam_id
+        WHERE l.exam_id = ?
     ''', (exam_id,)).fetchone()
     
     if exam is None:
@@ -402,16 +1385,286 @@ def exam_detail(exam_id: int) -> str:
         return redirect(url_for('exams'))
     
     questions = cur.execute('''
-        SELECT question_id, picture FROM ExamQuestions WHERE exam_id = ?
+        SELECT question_id, picture, original_filename FROM ExamQuestions WHERE exam_id = ?
     ''', (exam_id,)).fetchall()
     
-    return render_template('exams/detail.html', exam=exam, questions=questions)
+    return render_cached_page(key, [exam['created_by']], 'exams/detail.html', exam=exam, questions=questions)
+
+@app.route('/exam/<int:exam_id>/export.zip')
+@login_required
+def exam_export(exam_id: int) -> Response:
+    """試験1件の問題ファイルを ZIP で書き出す"""
+    cur = get_db().cursor()
+    if cur.execute('SELECT 1 FROM ExamListing WHERE exam_id = ?', (exam_id,)).fetchone() is None:
+        flash('指定された試験が見つかりません', 'error')
+        return redirect(url_for('exams'))
+    return export_response('zip', f'exam-{exam_id}.zip', 'exam_id = ?', [exam_id])
+
+# ===== 試験データ API =====
+#
+# /api/exams は試験を JSON（ページ単位）または JSON Lines（条件に合うすべてをストリーミング）で
+# 返す。fields で返す項目を選べ、注意事項（instructions）と問題ファイル（questions）は指定した
+# ときだけ Exams・ExamQuestions を読む。ids を指定すると複数の試験を1回のクエリで取得する。
+# 絞り込み条件は /exams と同じ（build_exam_filter）。
+
+# 返せる項目と値の式（l は ExamListing、e は Exams）
+API_EXAM_FIELDS: Final[dict[str, str]] = {
+    'exam_id': 'l.exam_id',
+    'faculty_id': 'l.faculty_id',
+    'faculty_name': 'l.faculty_name',
+    'department_id': 'l.department_id',
+    'department_name': 'l.department_name',
+    'subject_id': 'l.subject_id',
+    'subject_name': 'l.subject_name',
+    'exam_type_id': 'l.exam_type_id',
+    'exam_type_name': 'l.exam_type_name',
+    'exam_year': 'l.exam_year',
+    'professors': 'l.professors',
+    'created_by': 'l.created_by',
+    'instructions': 'e.instructions',
+    'questions': '''(
+        SELECT json_group_array(json_object(
+            'question_id', question_id, 'filename', picture, 'original_filename', original_filename))
+        FROM (SELECT question_id, picture, original_filename FROM ExamQuestions
+              WHERE exam_id = l.exam_id AND picture IS NOT NULL ORDER BY question_id)
+    )''',
+}
+
+# fields を省略したときに返す項目（一覧ページと同じ）
+API_EXAM_DEFAULT_FIELDS: Final[tuple[str, ...]] = (
+    'exam_id', 'faculty_name', 'department_name', 'subject_name', 'exam_type_name', 'exam_year', 'professors',
+)
+
+# 1ページの件数（limit）の既定値と上限、ids に指定できる最大数
+API_EXAMS_PER_PAGE: Final[int] = 100
+API_MAX_EXAMS_PER_PAGE: Final[int] = 1000
+API_MAX_IDS: Final[int] = 1000
+
+def parse_api_exam_fields(value: str) -> Optional[tuple[str, ...]]:
+    """fields（カンマ区切り）を項目のタプルにする（exam_id は常に先頭に含める。不明な項目があれば None）"""
+    if not value.strip():
+        return API_EXAM_DEFAULT_FIELDS
+    fields = ['exam_id']
+    for name in value.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in API_EXAM_FIELDS:
+            return None
+        fields.append(name)
+    return tuple(fields)
+
+def parse_id_list(value: str, max_count: int) -> Optional[list[int]]:
+    """カンマ区切りの ID を重複を除いた整数のリストにする（不正な値や max_count 個を超える場合は None）"""
+    try:
+        ids = list(dict.fromkeys(int(item) for item in value.split(',') if item.strip()))
+    except ValueError:
+        return None
+    return ids if len(ids) <= max_count else None
+
+def api_exam_query(fields: tuple[str, ...], where: str, limit: bool) -> str:
+    """ExamListing の WHERE 句（where）に合う試験の fields を試験 ID 順に読む SQL
+
+    絞り込みと件数の制限は ExamListing だけで行い、Exams の結合と問題ファイルの副問い合わせは
+    残った行に対してのみ行う。limit が真なら最後のパラメータを件数とする。
+    """
+    columns = ', '.join(f'{API_EXAM_FIELDS[field]} AS {field}' for field in fields)
+    join = 'JOIN Exams e ON e.exam_id = l.exam_id' if 'instructions' in fields else ''
+    return f'''
+        SELECT {columns}
+        FROM (SELECT * FROM ExamListing WHERE {where} ORDER BY exam_id{' LIMIT ?' if limit else ''}) l
+        {join}
+        ORDER BY l.exam_id
+    '''
+
+def api_exam_dicts(rows: Iterator[sqlite3.Row]) -> Iterator[dict]:
+    """行を dict にする（questions は JSON の文字列からリストに戻す）"""
+    for row in rows:
+        exam = dict(row)
+        if 'questions' in exam:
+            exam['questions'] = json.loads(exam['questions'])
+        yield exam
+
+def api_error(message: str, status: int = 400) -> tuple[dict, int]:
+    """API のエラー応答"""
+    return {'success': False, 'message': message}, status
+
+@app.route('/api/exams')
+@login_required
+def api_exams():
+    """試験を JSON（format=jsonl なら JSON Lines）で返す
+
+    クエリ文字列:
+      fields  返す項目（カンマ区切り、API_EXAM_FIELDS のキー。省略時は API_EXAM_DEFAULT_FIELDS）
+      ids     取得する試験 ID（カンマ区切り）。JSON では指定した順に返し、見つからない ID は missing に入れる
+      after   前のページの next_cursor（ids・jsonl の場合は使わない）
+      limit   1ページの件数（API_MAX_EXAMS_PER_PAGE まで）
+      format  json（既定）または jsonl（条件に合うすべてを試験 ID 順にストリーミング）
+    ほかに /exams と同じ絞り込み条件（faculty_filter など）を受け付ける。
+    """
+    fields = parse_api_exam_fields(request.args.get('fields', ''))
+    if fields is None:
+        return api_error(f'fields に指定できる項目は {", ".join(API_EXAM_FIELDS)} です')
+    export_format = request.args.get('format', 'json')
+    if export_format not in ('json', 'jsonl'):
+        return api_error('format は json または jsonl を指定してください')
+    try:
+        limit = int(request.args.get('limit', API_EXAMS_PER_PAGE))
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return api_error('limit と after は数値で指定してください')
+    if not 1 <= limit <= API_MAX_EXAMS_PER_PAGE:
+        return api_error(f'limit は 1 から {API_MAX_EXAMS_PER_PAGE} の間で指定してください')
+
+    _, where, params, match, _ = build_exam_filter(request.args)
+    if match:
+        where += ' AND exam_id IN (SELECT rowid FROM ExamSearch WHERE ExamSearch MATCH ?)'
+        params.append(match)
+    ids = None
+    if 'ids' in request.args:
+        ids = parse_id_list(request.args['ids'], API_MAX_IDS)
+        if ids is None:
+            return api_error(f'ids は {API_MAX_IDS} 個までの試験 ID をカンマ区切りで指定してください')
+        where += ' AND exam_id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(ids))
+
+    # 内容は条件とデータの版だけで決まるので、版が変わっていなければ試験を読まずに 304 を返す
+    stamp = repr((data_version(), sorted(request.args.items(multi=True))))
+    etag = 'exams-' + hashlib.sha1(stamp.encode('utf-8')).hexdigest()[:20]
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif export_format == 'jsonl':
+        response = Response(stream_api_exams(fields, where, params), mimetype='application/x-ndjson; charset=utf-8')
+        # nginx などのプロキシでバッファリングせず、読んだ分から送る
+        response.headers['X-Accel-Buffering'] = 'no'
+    elif ids is not None:
+        found = {exam['exam_id']: exam for exam in api_exam_dicts(
+            get_db().execute(api_exam_query(fields, where, limit=False), params))}
+        body = {'exams': [found[exam_id] for exam_id in ids if exam_id in found],
+                'missing': [exam_id for exam_id in ids if exam_id not in found]}
+        response = Response(json.dumps(body, ensure_ascii=False, separators=(',', ':')),
+                            mimetype='application/json')
+    else:
+        exams = list(api_exam_dicts(get_db().execute(
+            api_exam_query(fields, where + ' AND exam_id > ?', limit=True), [*params, after, limit + 1])))
+        next_cursor = str(exams[limit - 1]['exam_id']) if len(exams) > limit else None
+        body = {'exams': exams[:limit], 'next_cursor': next_cursor}
+        response = Response(json.dumps(body, ensure_ascii=False, separators=(',', ':')),
+                            mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def stream_api_exams(fields: tuple[str, ...], where: str, params: list) -> Iterator[bytes]:
+    """条件に合う試験を JSON Lines で少しずつ返す
+
+    送信はビュー関数が返った後も続くため、export_response と同じく接続をプールから別に借りる。
+    """
+    from export_exams import iter_jsonl
+
+    con = db_pool.checkout()
+    try:
+        yield from iter_jsonl(api_exam_dicts(con.execute(api_exam_query(fields, where, limit=False), params)),
+                              fields)
+    finally:
+        db_pool.checkin(con)
 
 @app.route('/exam-add')
 @login_required
 def exam_add() -> str:
     """試験追加ページ"""
-    return render_template('exams/add.html')
+    return render_template('exams/add.html', reference_url=reference_data_url())
+
+# 科目種別と学期の選択肢（Subjects テーブルの CHECK 制約と一致させる）
+SUBJECT_TYPES: Final[tuple[str, ...]] = ('必修', '選択必修', '一般教養')
+SEMESTERS: Final[tuple[str, ...]] = ('春学期', '春学期前半', '春学期後半', '秋学期', '秋学期前半', '秋学期後半')
+
+def parse_exam_form(form, require_professor: bool = True) -> tuple[Optional[dict], Optional[str]]:
+    """試験の追加・編集フォームを検証し、(値, エラーメッセージ) を返す
+
+    require_professor が False なら担当教員の名前は空でもよい（一括登録で担当教員のない試験を扱うため）。
+    """
+    values = {
+        'faculty_id': form.get('faculty_id'),
+        'department_id': form.get('department_id'),
+        'subject_name': form.get('subject_name', '').strip(),
+        'subject_type': form.get('subject_type', '').strip(),
+        'semester': form.get('semester', '').strip(),
+        'grade_level': form.get('grade_level'),
+        'professor_name': form.get('professor_name', '').strip(),
+        'exam_type_id': form.get('exam_type_id'),
+        'exam_year': form.get('exam_year'),
+    }
+    
+    # バリデーション
+    if not all(value for key, value in values.items() if require_professor or key != 'professor_name'):
+        return None, 'すべての必須項目を入力してください'
+    values['instructions'] = form.get('instructions', '').strip()
+    
+    try:
+        for key in ('faculty_id', 'department_id', 'grade_level', 'exam_type_id', 'exam_year'):
+            values[key] = int(values[key])
+    except ValueError:
+        return None, '入力値に不正な値が含まれています'
+    
+    # 年度の妥当性チェック
+    if values['exam_year'] < 2000 or values['exam_year'] > 2030:
+        return None, '年度は2000年から2030年の間で入力してください'
+    
+    # 制御文字チェック
+    if any(has_control_character(values[key]) for key in ('subject_name', 'professor_name', 'instructions')):
+        return None, '入力値に制御文字が含まれています'
+    
+    # 科目種別と学期の妥当性チェック
+    if values['subject_type'] not in SUBJECT_TYPES:
+        return None, '不正な科目種別です'
+    if values['semester'] not in SEMESTERS:
+        return None, '不正な学期です'
+    
+    return values, None
+
+def save_exam_references(cur: sqlite3.Cursor, values: dict) -> Optional[tuple[int, int]]:
+    """科目と教員を取得または作成し、(subject_id, professor_id) を返す
+
+    一意インデックスへの UPSERT で、検索と作成を1文ずつで行う。学部と学科の
+    組み合わせが正しくない場合は科目を作成せずに None を返す。
+    """
+    # DO UPDATE は値を変えないが、既存の行でも RETURNING で ID を返すために必要
+    subject = cur.execute('''
+        INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
+        SELECT ?, ?, ?, ?, ?
+        WHERE EXISTS (SELECT 1 FROM Departments WHERE department_id = ? AND faculty_id = ?)
+        ON CONFLICT (department_id, subject_name, subject_type, semester, grade_level)
+        DO UPDATE SET department_id = excluded.department_id
+        RETURNING subject_id
+    ''', (values['department_id'], values['subject_name'], values['subject_type'], values['semester'],
+          values['grade_level'], values['department_id'], values['faculty_id'])).fetchall()
+    if not subject:
+        return None
+    
+    professor = cur.execute('''
+        INSERT INTO Professors (professor_name) VALUES (?)
+        ON CONFLICT (professor_name) DO UPDATE SET professor_name = excluded.professor_name
+        RETURNING professor_id
+    ''', (values['professor_name'],)).fetchall()
+    return subject[0]['subject_id'], professor[0]['professor_id']
+
+def save_exam_assignments(cur: sqlite3.Cursor, exam_id: int, subject_id: int, professor_id: int,
+                          values: dict, questions: list[tuple[int, str, str]]) -> None:
+    """試験担当教員・科目担当教員・問題ファイルを登録"""
+    cur.execute('''
+        INSERT INTO ExamProfessors (exam_id, professor_id) VALUES (?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (exam_id, professor_id))
+    cur.execute('''
+        INSERT INTO SubjectProfessors (subject_id, professor_id, assignment_year, assignment_semester)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (subject_id, professor_id, values['exam_year'], values['semester']))
+    cur.executemany('''
+        INSERT INTO ExamQuestions (exam_id, picture, original_filename) VALUES (?, ?, ?)
+    ''', questions)
 
 @app.route('/exam-add', methods=['POST'])
 @login_required
@@ -420,163 +1673,46 @@ def exam_add_execute() -> Response:
     con = get_db()
     cur = con.cursor()
     
+    values, error = parse_exam_form(request.form)
+    if error:
+        flash(error, 'error')
+        return redirect(url_for('exam_add'))
+    
+    # ファイルの書き出しは書き込みロックを取る前に済ませる
+    file_upload_errors = []
+    staged, attached_uploads = stage_exam_questions(file_upload_errors)
     try:
-        # フォームデータ取得
-        faculty_id = request.form.get('faculty_id')
-        department_id = request.form.get('department_id')
-        subject_name = request.form.get('subject_name', '').strip()
-        subject_type = request.form.get('subject_type', '').strip()
-        semester = request.form.get('semester', '').strip()
-        grade_level = request.form.get('grade_level')
-        professor_name = request.form.get('professor_name', '').strip()
-        exam_type_id = request.form.get('exam_type_id')
-        exam_year = request.form.get('exam_year')
-        instructions = request.form.get('instructions', '').strip()
-        
-        # バリデーション
-        if not all([faculty_id, department_id, subject_name, subject_type, 
-                   semester, grade_level, professor_name, exam_type_id, exam_year]):
-            flash('すべての必須項目を入力してください', 'error')
-            return redirect(url_for('exam_add'))
-        
-        try:
-            faculty_id = int(faculty_id)
-            department_id = int(department_id)
-            grade_level = int(grade_level)
-            exam_type_id = int(exam_type_id)
-            exam_year = int(exam_year)
-        except ValueError:
-            flash('入力値に不正な値が含まれています', 'error')
-            return redirect(url_for('exam_add'))
+        # 書き込みロックを取り、検索・作成・ファイル登録を1つのトランザクションで行う
+        con.execute('BEGIN IMMEDIATE')
         
-        # 年度の妥当性チェック
-        if exam_year < 2000 or exam_year > 2030:
-            flash('年度は2000年から2030年の間で入力してください', 'error')
-            return redirect(url_for('exam_add'))
-        
-        # 制御文字チェック
-        if any(has_control_character(s) for s in [subject_name, professor_name, instructions]):
-            flash('入力値に制御文字が含まれています', 'error')
-            return redirect(url_for('exam_add'))
-        
-        # 科目種別と学期の妥当性チェック
-        valid_subject_types = ['必修', '選択必修', '一般教養']
-        valid_semesters = ['春学期', '春学期前半', '春学期後半', '秋学期', '秋学期前半', '秋学期後半']
-        
-        if subject_type not in valid_subject_types:
-            flash('不正な科目種別です', 'error')
-            return redirect(url_for('exam_add'))
-        
-        if semester not in valid_semesters:
-            flash('不正な学期です', 'error')
-            return redirect(url_for('exam_add'))
-        
-        # 学科の存在確認
-        dept_check = cur.execute('''
-            SELECT department_id FROM Departments 
-            WHERE department_id = ? AND faculty_id = ?
-        ''', (department_id, faculty_id)).fetchone()
-        
-        if not dept_check:
+        references = save_exam_references(cur, values)
+        if references is None:
+            con.rollback()
             flash('選択された学部・学科の組み合わせが正しくありません', 'error')
             return redirect(url_for('exam_add'))
+        subject_id, professor_id = references
         
-        # 科目を検索または新規作成
-        existing_subject = cur.execute('''
-            SELECT subject_id FROM Subjects 
-            WHERE department_id = ? AND subject_name = ? AND subject_type = ? 
-            AND semester = ? AND grade_level = ?
-        ''', (department_id, subject_name, subject_type, semester, grade_level)).fetchone()
-        
-        if existing_subject:
-            subject_id = existing_subject['subject_id']
-        else:
-            # 新しい科目を作成
-            cur.execute('''
-                INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (department_id, subject_name, subject_type, semester, grade_level))
-            subject_id = cur.lastrowid
-        
-        # 教員を検索または新規作成
-        existing_professor = cur.execute('''
-            SELECT professor_id FROM Professors WHERE professor_name = ?
-        ''', (professor_name,)).fetchone()
-        
-        if existing_professor:
-            professor_id = existing_professor['professor_id']
-        else:
-            # 新しい教員を作成
-            cur.execute('''
-                INSERT INTO Professors (professor_name) VALUES (?)
-            ''', (professor_name,))
-            professor_id = cur.lastrowid
-        
-        # 同じ科目・試験種別・年度の組み合わせが既に存在するかチェック
-        existing_exam = cur.execute('''
-            SELECT exam_id FROM Exams 
-            WHERE subject_id = ? AND exam_type_id = ? AND exam_year = ?
-        ''', (subject_id, exam_type_id, exam_year)).fetchone()
-        
-        if existing_exam:
-            flash('同じ科目・試験種別・年度の試験が既に存在します', 'error')
-            return redirect(url_for('exam_add'))
-        
-        # 試験を作成（created_byを設定）
-        cur.execute('''
+        # 試験を作成（同じ科目・試験種別・年度の試験が既にあれば作成しない）
+        exam = cur.execute('''
             INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions, created_by)
             VALUES (?, ?, ?, ?, ?)
-        ''', (subject_id, exam_type_id, exam_year, instructions, session['user_id']))
-        exam_id = cur.lastrowid
-        
-        # 試験担当教員を設定
-        cur.execute('''
-            INSERT INTO ExamProfessors (exam_id, professor_id)
-            VALUES (?, ?)
-        ''', (exam_id, professor_id))
-        
-        # 科目担当教員も設定（存在しない場合のみ）
-        existing_assignment = cur.execute('''
-            SELECT 1 FROM SubjectProfessors 
-            WHERE subject_id = ? AND professor_id = ? AND assignment_year = ? AND assignment_semester = ?
-        ''', (subject_id, professor_id, exam_year, semester)).fetchone()
-        
-        if not existing_assignment:
-            cur.execute('''
-                INSERT INTO SubjectProfessors (subject_id, professor_id, assignment_year, assignment_semester)
-                VALUES (?, ?, ?, ?)
-            ''', (subject_id, professor_id, exam_year, semester))
-        
-        # ファイルアップロード処理
-        uploaded_files = request.files.getlist('exam_files')
-        file_upload_errors = []
-        
-        for file in uploaded_files:
-            if file and file.filename:
-                if allowed_file(file.filename):
-                    try:
-                        filename = secure_filename(file.filename)
-                        # ファイル名の重複を避けるためタイムスタンプを付加
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        name, ext = os.path.splitext(filename)
-                        filename = f"{name}_{timestamp}{ext}"
-                        
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                        file.save(filepath)
-                        
-                        # データベースに問題画像を登録
-                        cur.execute('''
-                            INSERT INTO ExamQuestions (exam_id, picture)
-                            VALUES (?, ?)
-                        ''', (exam_id, filename))
-                        
-                    except Exception as e:
-                        file_upload_errors.append(f"ファイル '{file.filename}' のアップロードに失敗しました: {str(e)}")
-                else:
-                    file_upload_errors.append(f"ファイル '{file.filename}' は許可されていない形式です")
+            ON CONFLICT (subject_id, exam_type_id, exam_year) DO NOTHING
+            RETURNING exam_id
+        ''', (subject_id, values['exam_type_id'], values['exam_year'], values['instructions'],
+              session['user_id'])).fetchall()
+        if not exam:
+            con.rollback()
+            flash('同じ科目・試験種別・年度の試験が既に存在します', 'error')
+            return redirect(url_for('exam_add'))
+        exam_id = exam[0]['exam_id']
         
+        questions = commit_exam_questions(exam_id, staged)
+        save_exam_assignments(cur, exam_id, subject_id, professor_id, values, questions)
         con.commit()
         
+        for upload_id in attached_uploads:
+            discard_upload_session(upload_id)
+        
         # アップロードエラーがあれば警告として表示
         if file_upload_errors:
             flash('試験は正常に作成されましたが、一部のファイルでエラーが発生しました: ' + 
@@ -594,12 +1730,398 @@ def exam_add_execute() -> Response:
         con.rollback()
         flash(f'予期しないエラーが発生しました: {e}', 'error')
         return redirect(url_for('exam_add'))
+    finally:
+        # 登録しなかったファイルの一時ファイルを削除
+        for temp_path, _, _ in staged:
+            discard_staged_upload(temp_path)
+
+# ===== 分割アップロード =====
+# 大きなファイルは複数回の PUT に分けて .partial 以下に追記し、試験の追加・更新時に
+# upload_ids として受け取って stage_exam_questions で保存する。PUT の本文は request.stream から
+# UPLOAD_CHUNK_SIZE ずつ書き出すので、ファイルの大きさによらずメモリ使用量は一定。
+
+def upload_session_paths(upload_id: str) -> tuple[str, str]:
+    """分割アップロードのデータファイルと情報ファイルのパスを返す"""
+    if len(upload_id) != 32 or not all(c in '0123456789abcdef' for c in upload_id):
+        raise ValueError('アップロードIDが不正です')
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], PARTIAL_FOLDER_NAME)
+    return os.path.join(folder, upload_id + '.part'), os.path.join(folder, upload_id + '.json')
+
+def load_upload_session(upload_id: str) -> Optional[dict]:
+    """ログイン中のユーザーの分割アップロード情報を返す（なければ None）"""
+    try:
+        data_path, info_path = upload_session_paths(upload_id)
+        with open(info_path, encoding='utf-8') as f:
+            info = json.load(f)
+        info['offset'] = os.path.getsize(data_path)
+    except (ValueError, OSError):
+        return None
+    if info['user_id'] != session.get('user_id'):
+        return None
+    return info
+
+def discard_upload_session(upload_id: str) -> None:
+    """分割アップロードの一時ファイルを削除"""
+    for path in upload_session_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def sweep_upload_sessions() -> None:
+    """UPLOAD_SESSION_TTL を過ぎても完了しなかった分割アップロードを削除"""
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], PARTIAL_FOLDER_NAME)
+    expires = time.time() - UPLOAD_SESSION_TTL
+    for entry in os.scandir(folder):
+        try:
+            if entry.stat().st_mtime < expires:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def stage_exam_questions(errors: list[str]) -> tuple[list[tuple[str, str, str]], list[str]]:
+    """フォームで送られたファイルを一時ファイルに書き出す
+
+    通常の multipart のファイル（exam_files）と、upload_ids で指定された分割アップロードの
+    両方を扱い、(一時ファイルのパス, 保存名, 元のファイル名) のリストと使用した upload_id の
+    リストを返す。ファイルの書き出しとハッシュ計算に時間がかかるので、書き込みロックを取る前に
+    呼び、commit_exam_questions で保存名に移す。移さなかった一時ファイルは
+    discard_staged_upload で削除し、分割アップロードの一時ファイルはコミット後に
+    discard_upload_session で削除すること。
+    """
+    staged = []
+    for file in request.files.getlist('exam_files'):
+        if file and file.filename:
+            if allowed_file(file.filename):
+                try:
+                    # 内容ハッシュをファイル名にして保存（同じ内容のファイルは共有）
+                    temp_path, filename = stage_upload(file.stream, file.filename)
+                    staged.append((temp_path, filename, file.filename))
+                except Exception as e:
+                    errors.append(f"ファイル '{file.filename}' のアップロードに失敗しました: {str(e)}")
+            else:
+                errors.append(f"ファイル '{file.filename}' は許可されていない形式です")
+
+    attached = []
+    for upload_id in request.form.getlist('upload_ids'):
+        info = load_upload_session(upload_id)
+        if info is None:
+            errors.append('アップロード済みのファイルが見つかりません（期限切れの可能性があります）')
+            continue
+        if info['offset'] != info['size']:
+            errors.append(f"ファイル '{info['filename']}' のアップロードが完了していません")
+            continue
+        data_path, _ = upload_session_paths(upload_id)
+        try:
+            with open(data_path, 'rb') as f:
+                if not matches_signature(info['filename'], f.read(16)):
+                    errors.append(f"ファイル '{info['filename']}' の内容が拡張子と一致しません")
+                    continue
+                f.seek(0)
+                temp_path, filename = stage_upload(f, info['filename'])
+            staged.append((temp_path, filename, info['filename']))
+            attached.append(upload_id)
+        except OSError as e:
+            errors.append(f"ファイル '{info['filename']}' のアップロードに失敗しました: {str(e)}")
+    return staged, attached
+
+def commit_exam_questions(exam_id: int, staged: list[tuple[str, str, str]]) -> list[tuple[int, str, str]]:
+    """stage_exam_questions で書き出したファイルを保存名に移し、ExamQuestions に登録する行を返す
+
+    書き込みトランザクションの中で呼ぶ。移したファイルは staged から取り除く。
+    """
+    questions = []
+    while staged:
+        temp_path, filename, original_filename = staged.pop(0)
+        commit_upload(temp_path, filename)
+        questions.append((exam_id, filename, original_filename))
+    return questions
+
+@app.route('/upload-sessions', methods=['POST'])
+@login_required
+def upload_session_create():
+    """分割アップロードを開始（JSON で filename と size を受け取る）"""
+    params = request.get_json(silent=True) or {}
+    filename = params.get('filename')
+    size = params.get('size')
+    if not isinstance(filename, str) or not allowed_file(filename) or has_control_character(filename):
+        return {'success': False, 'message': RESULT_MESSAGES['invalid-file-type']}, 400
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return {'success': False, 'message': 'ファイルサイズが不正です'}, 400
+    if size > MAX_UPLOAD_SIZE:
+        return {'success': False,
+                'message': f'ファイルサイズが大きすぎます（最大{MAX_UPLOAD_SIZE // (1024 * 1024)}MB）'}, 413
+
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], PARTIAL_FOLDER_NAME)
+    os.makedirs(folder, exist_ok=True)
+    sweep_upload_sessions()
+
+    upload_id = secrets.token_hex(16)
+    data_path, info_path = upload_session_paths(upload_id)
+    open(data_path, 'xb').close()
+    with open(info_path, 'x', encoding='utf-8') as f:
+        json.dump({'user_id': session['user_id'], 'filename': filename[:255], 'size': size}, f)
+    return {'success': True, 'upload_id': upload_id, 'offset': 0,
+            'part_size': UPLOAD_PART_SIZE}, 201
+
+@app.route('/upload-sessions/<upload_id>')
+@login_required
+def upload_session_status(upload_id: str):
+    """分割アップロードの受信済みバイト数を返す（中断後の再開用）"""
+    info = load_upload_session(upload_id)
+    if info is None:
+        return {'success': False, 'message': 'アップロードが見つかりません'}, 404
+    return {'success': True, 'offset': info['offset'], 'size': info['size']}
+
+@app.route('/upload-sessions/<upload_id>', methods=['PUT'])
+@login_required
+def upload_session_append(upload_id: str):
+    """分割アップロードの続きを受け取る
+
+    Upload-Offset ヘッダーには受信済みバイト数（GET で得られる offset）を指定する。
+    本文は UPLOAD_CHUNK_SIZE ずつ読み、サイズと先頭のシグネチャを読みながら確認する。
+    """
+    info = load_upload_session(upload_id)
+    if info is None:
+        return {'success': False, 'message': 'アップロードが見つかりません'}, 404
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset != info['offset']:
+        return {'success': False, 'message': '送信位置が一致しません', 'offset': info['offset']}, 409
+
+    data_path, _ = upload_session_paths(upload_id)
+    received = offset
+    with open(data_path, 'r+b') as f:
+        # 形式の判定に使う先頭部分（判定が済んでいれば空）
+        head = f.read(offset) if offset < 16 else b''
+        f.seek(offset)
+        try:
+            for chunk in iter(lambda: request.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                if received + len(chunk) > info['size']:
+                    raise ValueError('宣言されたサイズを超えています')
+                if received < 16:
+                    head += chunk[:16 - received]
+                    if not matches_signature(info['filename'], head):
+                        f.close()
+                        discard_upload_session(upload_id)
+                        return {'success': False, 'message': RESULT_MESSAGES['invalid-file-type']}, 415
+                f.write(chunk)
+                received += len(chunk)
+        except ValueError as e:
+            # 受け取った分を捨てて送信前の状態に戻す
+            f.truncate(offset)
+            return {'success': False, 'message': str(e), 'offset': offset}, 413
+        f.truncate(received)
+    return {'success': True, 'offset': received, 'complete': received == info['size']}
+
+@app.route('/upload-sessions/<upload_id>', methods=['DELETE'])
+@login_required
+def upload_session_cancel(upload_id: str):
+    """分割アップロードを中止"""
+    if load_upload_session(upload_id) is None:
+        return {'success': False, 'message': 'アップロードが見つかりません'}, 404
+    discard_upload_session(upload_id)
+    return {'success': True}
+
+# ===== 静的ファイル =====
+#
+# CSS / JavaScript は build_assets.py が static/dist に内容ハッシュ付きの名前で書き出し、
+# Bootstrap と Font Awesome は static/vendor にバージョン付きのパスで置く。どちらも
+# URL が内容ごとに変わるので、1年間の immutable を付けて配信する。
+
+_asset_manifest: Optional[tuple[float, dict[str, str]]] = None
+
+def asset_manifest() -> dict[str, str]:
+    """static/dist/manifest.json（プロセス内で保持し、デバッグ時は更新されたら読み直す）"""
+    global _asset_manifest
+    if _asset_manifest is None or app.debug:
+        path = os.path.join(app.static_folder, DIST_FOLDER_NAME, MANIFEST_NAME)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = 0.0
+        if _asset_manifest is None or _asset_manifest[0] != mtime:
+            _asset_manifest = (mtime, load_manifest(app.static_folder))
+    return _asset_manifest[1]
+
+def missing_vendor_assets() -> list[str]:
+    """manifest にない（static/vendor に取得していない）ライブラリの論理名"""
+    manifest = asset_manifest()
+    return [name for name in VENDOR_ASSETS if name not in manifest]
+
+def require_vendor_assets() -> None:
+    """ライブラリが取得済みでなければ RuntimeError（ASSET_CDN_FALLBACK=1 なら警告のみ）
+
+    サーバーの起動時（wsgi.py・index.cgi・index.fcgi・serve.py）に呼ぶ。
+    """
+    missing = missing_vendor_assets()
+    if not missing:
+        return
+    message = (f"{', '.join(missing)} が static/vendor にありません。"
+               "ネットワークに接続できる環境で python build_assets.py --vendor を実行してください")
+    if not ASSET_CDN_FALLBACK:
+        raise RuntimeError(message + '（CDN から読み込む場合は ASSET_CDN_FALLBACK=1）')
+    app.logger.warning("%s（CDN から読み込みます）", message)
+
+@functools.lru_cache(maxsize=256)
+def _source_fingerprint(path: str, mtime_ns: int, size: int) -> str:
+    """static/src のファイルの内容ハッシュ（更新日時と大きさが変わったら計算し直す）"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:FINGERPRINT_LENGTH]
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    """静的ファイル（build_assets の BUNDLES / VENDOR_ASSETS の論理名）の URL
+
+    ビルド済みなら manifest のファイルを使う。未ビルドの場合、自前の束は static/src の
+    元のファイル（内容ハッシュを版 v として付ける）、ライブラリは ASSET_CDN_FALLBACK=1 の
+    ときだけ CDN の URL にする。
+    """
+    filename = asset_manifest().get(name)
+    if filename is not None:
+        return url_for('static', filename=filename)
+    if name in VENDOR_ASSETS:
+        if not ASSET_CDN_FALLBACK:
+            raise RuntimeError(f'{name} が static/vendor にありません。python build_assets.py --vendor を実行してください')
+        return VENDOR_ASSETS[name][1]
+    sources = BUNDLES[name]
+    if len(sources) != 1:
+        raise RuntimeError(f'{name} は複数のファイルの束です。python build_assets.py でビルドしてください')
+    filename = f'{SOURCE_FOLDER_NAME}/{sources[0]}'
+    path = os.path.join(app.static_folder, filename)
+    stat = os.stat(path)
+    return url_for('static', filename=filename, v=_source_fingerprint(path, stat.st_mtime_ns, stat.st_size))
+
+@app.after_request
+def cache_static_assets(response: Response) -> Response:
+    """内容ごとに URL が変わる静的ファイル（dist・vendor・v 付き）に1年間の immutable を付ける"""
+    if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+        return response
+    filename = (request.view_args or {}).get('filename', '')
+    if filename.startswith((f'{DIST_FOLDER_NAME}/', f'{VENDOR_FOLDER_NAME}/')) or 'v' in request.args:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
 
 # ファイル提供用のルート
+@app.template_global()
+def upload_url(filename: str, size: Optional[str] = None) -> str:
+    """アップロードファイル（size を指定すると縮小画像）の URL
+
+    内容が変わると URL も変わるので、ブラウザは再検証せずにキャッシュを使える。
+    内容ハッシュ名でない旧形式のファイルには更新日時を版（v）として付ける。
+    """
+    values = {'filename': filename}
+    if not CONTENT_ADDRESSED_NAME.fullmatch(filename):
+        try:
+            values['v'] = int(os.path.getmtime(os.path.join(app.config['UPLOAD_FOLDER'], filename)))
+        except OSError:
+            pass
+    if size is None:
+        return url_for('uploaded_file', **values)
+    return url_for('uploaded_derivative', size=size, **values)
+
+def send_upload(path: str, filename: str, mimetype: Optional[str] = None) -> Response:
+    """UPLOAD_FOLDER 以下のファイルを送信し、キャッシュ用のヘッダーを付ける
+
+    ETag・If-None-Match・Range は send_from_directory（x-accel-redirect の場合は nginx）が
+    処理する。内容が変わらない URL には1年間の immutable を、それ以外には再検証を指定する。
+    """
+    directory, name = os.path.split(path)
+    immutable = CONTENT_ADDRESSED_NAME.fullmatch(filename) is not None or 'v' in request.args
+    if UPLOAD_SENDFILE == 'x-accel-redirect':
+        if not os.path.isfile(path):
+            abort(404)
+        relative = os.path.relpath(path, app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response = Response(mimetype=mimetype or mimetypes.guess_type(name)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = UPLOAD_ACCEL_PREFIX + relative
+    else:
+        # 内容ハッシュ名のファイルはハッシュをそのまま強い ETag にする
+        etag = filename.split('.', 1)[0] if CONTENT_ADDRESSED_NAME.fullmatch(filename) else True
+        response = send_from_directory(directory, name, mimetype=mimetype, etag=etag)
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     """アップロードされたファイルを提供"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if path is None:
+        abort(404)
+    return send_upload(path, filename)
+
+def derivative_path(filename: str, size: str) -> str:
+    """縮小画像の保存先パス"""
+    return os.path.join(app.config['UPLOAD_FOLDER'], DERIVED_FOLDER_NAME, size, filename + '.jpg')
+
+def build_derivative(filename: str, size: str) -> Optional[str]:
+    """縮小画像を作成してパスを返す（作成済みならそのまま、作成できなければ None）"""
+    if Image is None:
+        return None
+    source = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    target = derivative_path(filename, size)
+    try:
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail(IMAGE_DERIVATIVES[size])
+            if image.mode in ('RGBA', 'LA', 'P'):
+                # 透過部分は白背景で合成
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            # 同時アクセスで書きかけのファイルを返さないよう一時ファイル経由で置き換える
+            temp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                image.save(temp_path, 'JPEG', quality=82, optimize=True, progressive=True)
+                os.replace(temp_path, target)
+            except BaseException:
+                # 書きかけの一時ファイルを残さない（孤立ファイルの掃除は内容ハッシュ名しか扱わない）
+                try:
+                    os.unlink(temp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+        return target
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+def remove_derivatives(filename: str) -> None:
+    """縮小画像のキャッシュを削除"""
+    for size in IMAGE_DERIVATIVES:
+        try:
+            os.remove(derivative_path(filename, size))
+        except OSError:
+            pass
+
+@app.route('/uploads/<size>/<filename>')
+def uploaded_derivative(size: str, filename: str):
+    """アップロード画像の縮小版を提供（初回アクセス時に作成してディスクにキャッシュ）"""
+    if size not in IMAGE_DERIVATIVES:
+        abort(404)
+    source = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if source is None or not os.path.isfile(source):
+        abort(404)
+    
+    # PDF など画像以外、または縮小できなかった場合は元ファイルを返す
+    path = None
+    if allowed_file(filename) and not filename.lower().endswith('.pdf'):
+        path = build_derivative(filename, size)
+    if path is None:
+        return send_upload(source, filename)
+    return send_upload(path, filename, mimetype='image/jpeg')
 
 @app.route('/exam-edit/<int:exam_id>')
 @login_required
@@ -654,13 +2176,14 @@ def exam_edit(exam_id: int) -> str:
     
     # 試験問題ファイルを取得
     questions = cur.execute('''
-        SELECT question_id, picture FROM ExamQuestions WHERE exam_id = ?
+        SELECT question_id, picture, original_filename FROM ExamQuestions WHERE exam_id = ?
     ''', (exam_id,)).fetchall()
     
     return render_template('exams/edit.html', 
                          exam=exam, 
                          professor_names=professor_names,
-                         questions=questions)
+                         questions=questions,
+                         reference_url=reference_data_url())
 
 # app.pyに追加する試験編集更新処理
 
@@ -670,6 +2193,7 @@ def exam_edit_update(exam_id: int) -> Response:
     """試験編集更新実行"""
     con = get_db()
     cur = con.cursor()
+    staged = []
     
     try:
         # 試験の存在と権限チェック
@@ -686,170 +2210,53 @@ def exam_edit_update(exam_id: int) -> Response:
             flash('この試験を編集する権限がありません', 'error')
             return redirect(url_for('exam_detail', exam_id=exam_id))
         
-        # フォームデータ取得
-        faculty_id = request.form.get('faculty_id')
-        department_id = request.form.get('department_id')
-        subject_name = request.form.get('subject_name', '').strip()
-        subject_type = request.form.get('subject_type', '').strip()
-        semester = request.form.get('semester', '').strip()
-        grade_level = request.form.get('grade_level')
-        professor_name = request.form.get('professor_name', '').strip()
-        exam_type_id = request.form.get('exam_type_id')
-        exam_year = request.form.get('exam_year')
-        instructions = request.form.get('instructions', '').strip()
-        
-        # バリデーション
-        if not all([faculty_id, department_id, subject_name, subject_type, 
-                   semester, grade_level, professor_name, exam_type_id, exam_year]):
-            flash('すべての必須項目を入力してください', 'error')
-            return redirect(url_for('exam_edit', exam_id=exam_id))
-        
-        try:
-            faculty_id = int(faculty_id)
-            department_id = int(department_id)
-            grade_level = int(grade_level)
-            exam_type_id = int(exam_type_id)
-            exam_year = int(exam_year)
-        except ValueError:
-            flash('入力値に不正な値が含まれています', 'error')
-            return redirect(url_for('exam_edit', exam_id=exam_id))
-        
-        # 年度の妥当性チェック
-        if exam_year < 2000 or exam_year > 2030:
-            flash('年度は2000年から2030年の間で入力してください', 'error')
+        values, error = parse_exam_form(request.form)
+        if error:
+            flash(error, 'error')
             return redirect(url_for('exam_edit', exam_id=exam_id))
         
-        # 制御文字チェック
-        if any(has_control_character(s) for s in [subject_name, professor_name, instructions]):
-            flash('入力値に制御文字が含まれています', 'error')
-            return redirect(url_for('exam_edit', exam_id=exam_id))
-        
-        # 科目種別と学期の妥当性チェック
-        valid_subject_types = ['必修', '選択必修', '一般教養']
-        valid_semesters = ['春学期', '春学期前半', '春学期後半', '秋学期', '秋学期前半', '秋学期後半']
-        
-        if subject_type not in valid_subject_types:
-            flash('不正な科目種別です', 'error')
-            return redirect(url_for('exam_edit', exam_id=exam_id))
-        
-        if semester not in valid_semesters:
-            flash('不正な学期です', 'error')
-            return redirect(url_for('exam_edit', exam_id=exam_id))
+        # ファイルの書き出しは書き込みロックを取る前に済ませる
+        file_upload_errors = []
+        staged, attached_uploads = stage_exam_questions(file_upload_errors)
         
-        # 学科の存在確認
-        dept_check = cur.execute('''
-            SELECT department_id FROM Departments 
-            WHERE department_id = ? AND faculty_id = ?
-        ''', (department_id, faculty_id)).fetchone()
+        # 書き込みロックを取り、検索・更新・ファイル登録を1つのトランザクションで行う
+        con.execute('BEGIN IMMEDIATE')
         
-        if not dept_check:
+        references = save_exam_references(cur, values)
+        if references is None:
+            con.rollback()
             flash('選択された学部・学科の組み合わせが正しくありません', 'error')
             return redirect(url_for('exam_edit', exam_id=exam_id))
+        subject_id, professor_id = references
         
-        # 現在の試験に関連する科目IDを取得
-        current_exam = cur.execute('''
-            SELECT subject_id FROM Exams WHERE exam_id = ?
-        ''', (exam_id,)).fetchone()
-        
-        current_subject_id = current_exam['subject_id']
-        
-        # 科目を検索または新規作成（現在の科目と異なる場合のみ）
-        existing_subject = cur.execute('''
-            SELECT subject_id FROM Subjects 
-            WHERE department_id = ? AND subject_name = ? AND subject_type = ? 
-            AND semester = ? AND grade_level = ?
-        ''', (department_id, subject_name, subject_type, semester, grade_level)).fetchone()
-        
-        if existing_subject:
-            subject_id = existing_subject['subject_id']
-        else:
-            # 新しい科目を作成
-            cur.execute('''
-                INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (department_id, subject_name, subject_type, semester, grade_level))
-            subject_id = cur.lastrowid
-        
-        # 教員を検索または新規作成
-        existing_professor = cur.execute('''
-            SELECT professor_id FROM Professors WHERE professor_name = ?
-        ''', (professor_name,)).fetchone()
-        
-        if existing_professor:
-            professor_id = existing_professor['professor_id']
-        else:
-            # 新しい教員を作成
-            cur.execute('''
-                INSERT INTO Professors (professor_name) VALUES (?)
-            ''', (professor_name,))
-            professor_id = cur.lastrowid
-        
-        # 同じ科目・試験種別・年度の組み合わせが他に存在するかチェック（自分以外）
-        existing_exam = cur.execute('''
-            SELECT exam_id FROM Exams 
-            WHERE subject_id = ? AND exam_type_id = ? AND exam_year = ? AND exam_id != ?
-        ''', (subject_id, exam_type_id, exam_year, exam_id)).fetchone()
-        
-        if existing_exam:
-            flash('同じ科目・試験種別・年度の試験が既に存在します', 'error')
-            return redirect(url_for('exam_edit', exam_id=exam_id))
-        
-        # 試験情報を更新
+        # 試験情報を更新（同じ科目・試験種別・年度の試験が他にあれば更新しない）
         cur.execute('''
             UPDATE Exams 
             SET subject_id = ?, exam_type_id = ?, exam_year = ?, instructions = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE exam_id = ?
-        ''', (subject_id, exam_type_id, exam_year, instructions, exam_id))
+            WHERE exam_id = ? AND NOT EXISTS (
+                SELECT 1 FROM Exams
+                WHERE subject_id = ? AND exam_type_id = ? AND exam_year = ? AND exam_id != ?
+            )
+        ''', (subject_id, values['exam_type_id'], values['exam_year'], values['instructions'], exam_id,
+              subject_id, values['exam_type_id'], values['exam_year'], exam_id))
+        if cur.rowcount == 0:
+            con.rollback()
+            flash('同じ科目・試験種別・年度の試験が既に存在します', 'error')
+            return redirect(url_for('exam_edit', exam_id=exam_id))
         
-        # 既存の試験担当教員を削除して新しく設定
-        cur.execute('DELETE FROM ExamProfessors WHERE exam_id = ?', (exam_id,))
+        # 担当教員が変わった場合だけ入れ替える（変わらなければ一覧の作り直しも起きない）
         cur.execute('''
-            INSERT INTO ExamProfessors (exam_id, professor_id)
-            VALUES (?, ?)
+            DELETE FROM ExamProfessors WHERE exam_id = ? AND professor_id != ?
         ''', (exam_id, professor_id))
         
-        # 科目担当教員も設定（存在しない場合のみ）
-        existing_assignment = cur.execute('''
-            SELECT 1 FROM SubjectProfessors 
-            WHERE subject_id = ? AND professor_id = ? AND assignment_year = ? AND assignment_semester = ?
-        ''', (subject_id, professor_id, exam_year, semester)).fetchone()
-        
-        if not existing_assignment:
-            cur.execute('''
-                INSERT INTO SubjectProfessors (subject_id, professor_id, assignment_year, assignment_semester)
-                VALUES (?, ?, ?, ?)
-            ''', (subject_id, professor_id, exam_year, semester))
-        
-        # 新しいファイルのアップロード処理
-        uploaded_files = request.files.getlist('exam_files')
-        file_upload_errors = []
-        
-        for file in uploaded_files:
-            if file and file.filename:
-                if allowed_file(file.filename):
-                    try:
-                        filename = secure_filename(file.filename)
-                        # ファイル名の重複を避けるためタイムスタンプを付加
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        name, ext = os.path.splitext(filename)
-                        filename = f"{name}_{timestamp}{ext}"
-                        
-                        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                        file.save(filepath)
-                        
-                        # データベースに問題画像を登録
-                        cur.execute('''
-                            INSERT INTO ExamQuestions (exam_id, picture)
-                            VALUES (?, ?)
-                        ''', (exam_id, filename))
-                        
-                    except Exception as e:
-                        file_upload_errors.append(f"ファイル '{file.filename}' のアップロードに失敗しました: {str(e)}")
-                else:
-                    file_upload_errors.append(f"ファイル '{file.filename}' は許可されていない形式です")
-        
+        # 新しいファイルを保存名に移す
+        questions = commit_exam_questions(exam_id, staged)
+        save_exam_assignments(cur, exam_id, subject_id, professor_id, values, questions)
         con.commit()
         
+        for upload_id in attached_uploads:
+            discard_upload_session(upload_id)
+        
         # アップロードエラーがあれば警告として表示
         if file_upload_errors:
             flash('試験は正常に更新されましたが、一部のファイルでエラーが発生しました: ' + 
@@ -868,6 +2275,10 @@ def exam_edit_update(exam_id: int) -> Response:
         con.rollback()
         flash(f'予期しないエラーが発生しました: {e}', 'error')
         return redirect(url_for('exam_edit', exam_id=exam_id))
+    finally:
+        # 登録しなかったファイルの一時ファイルを削除
+        for temp_path, _, _ in staged:
+            discard_staged_upload(temp_path)
 
 @app.route('/exam-file-delete/<int:question_id>', methods=['DELETE'])
 @login_required
@@ -892,20 +2303,10 @@ def exam_file_delete(question_id: int):
         if question_info['created_by'] != session['user_id']:
             return {'success': False, 'message': 'このファイルを削除する権限がありません'}, 403
         
-        # データベースから削除
+        # データベースから削除（他の問題から参照されていなければファイルは削除待ちに登録される）
         cur.execute('DELETE FROM ExamQuestions WHERE question_id = ?', (question_id,))
-        
-        # 物理ファイルを削除
-        if question_info['picture']:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], question_info['picture'])
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except OSError:
-                    # ファイル削除に失敗してもデータベースからは削除済みなので続行
-                    pass
-        
         con.commit()
+        schedule_file_deletions()
         return {'success': True, 'message': 'ファイルを削除しました'}
         
     except Exception as e:
@@ -921,24 +2322,18 @@ def exam_delete(exam_id: int) -> str:
     # 試験情報を取得
     exam = cur.execute('''
         SELECT 
-            e.exam_id,
-            f.faculty_name,
-            d.department_name,
-            s.subject_name,
-            et.exam_type_name,
-            e.exam_year,
+            l.exam_id,
+            l.faculty_name,
+            l.department_name,
+            l.subject_name,
+            l.exam_type_name,
+            l.exam_year,
             e.instructions,
-            e.created_by,
-            GROUP_CONCAT(DISTINCT p.professor_name, ', ') AS professors
-        FROM Exams e
-        JOIN Subjects s ON e.subject_id = s.subject_id
-        JOIN Departments d ON s.department_id = d.department_id
-        JOIN Faculties f ON d.faculty_id = f.faculty_id
-        JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
-        LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
-        LEFT JOIN Professors p ON ep.professor_id = p.professor_id
-        WHERE e.exam_id = ?
-        GROUP BY e.exam_id, f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year, e.instructions, e.created_by
+            l.created_by,
+            l.professors
+        FROM ExamListing l
+        JOIN Exams e ON l.exam_id = e.exam_id
+        WHERE l.exam_id = ?
     ''', (exam_id,)).fetchone()
     
     if exam is None:
@@ -952,7 +2347,7 @@ def exam_delete(exam_id: int) -> str:
     
     # 試験問題ファイルを取得
     questions = cur.execute('''
-        SELECT question_id, picture FROM ExamQuestions WHERE exam_id = ?
+        SELECT question_id, picture, original_filename FROM ExamQuestions WHERE exam_id = ?
     ''', (exam_id,)).fetchall()
     
     return render_template('exams/delete.html', exam=exam, questions=questions)
@@ -991,22 +2386,6 @@ def exam_delete_execute(exam_id: int) -> Response:
             SELECT picture FROM ExamQuestions WHERE exam_id = ?
         ''', (exam_id,)).fetchall()
         
-        # 関連ファイルの物理削除
-        deleted_files = []
-        failed_files = []
-        
-        for question in questions:
-            if question['picture']:
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], question['picture'])
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        deleted_files.append(question['picture'])
-                    except OSError as e:
-                        failed_files.append(question['picture'])
-                        # ファイル削除に失敗してもデータベースからは削除続行
-                        print(f"ファイル削除失敗: {question['picture']}, エラー: {e}")
-        
         # 関連データを正しい順序で削除（外部キー制約を考慮）
         # 1. 試験問題ファイルを削除
         cur.execute('DELETE FROM ExamQuestions WHERE exam_id = ?', (exam_id,))
@@ -1017,14 +2396,20 @@ def exam_delete_execute(exam_id: int) -> Response:
         # 3. 最後に試験を削除
         cur.execute('DELETE FROM Exams WHERE exam_id = ?', (exam_id,))
         
+        # 参照がなくなったファイル（同じ内容を他の試験が使っていないもの）は
+        # トリガーで削除待ちに登録され、コミット後にバックグラウンドで削除する
+        deleted_files = cur.execute('''
+            SELECT COUNT(*) FROM PendingFileDeletions
+            WHERE filename IN (SELECT value FROM json_each(?))
+        ''', (json.dumps([q['picture'] for q in questions if q['picture']]),)).fetchone()[0]
+        
         con.commit()
+        schedule_file_deletions()
         
         # 削除結果のメッセージ作成
         success_message = f'試験「{exam_info}」を削除しました'
         if deleted_files:
-            success_message += f'（{len(deleted_files)}個のファイルも削除）'
-        if failed_files:
-            success_message += f'（注意: {len(failed_files)}個のファイルの削除に失敗）'
+            success_message += f'（{deleted_files}個のファイルも削除）'
         
         flash(success_message, 'success')
         return redirect(url_for('exams'))
@@ -1070,21 +2455,6 @@ def exam_delete_ajax(exam_id: int):
             SELECT picture FROM ExamQuestions WHERE exam_id = ?
         ''', (exam_id,)).fetchall()
         
-        # 関連ファイルの物理削除
-        deleted_files = []
-        failed_files = []
-        
-        for question in questions:
-            if question['picture']:
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], question['picture'])
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                        deleted_files.append(question['picture'])
-                    except OSError:
-                        failed_files.append(question['picture'])
-                        # ファイル削除に失敗してもデータベースからは削除続行
-        
         # 関連データを正しい順序で削除（外部キー制約を考慮）
         # 1. 試験問題ファイルを削除
         cur.execute('DELETE FROM ExamQuestions WHERE exam_id = ?', (exam_id,))
@@ -1095,20 +2465,25 @@ def exam_delete_ajax(exam_id: int):
         # 3. 最後に試験を削除
         cur.execute('DELETE FROM Exams WHERE exam_id = ?', (exam_id,))
         
+        # 参照がなくなったファイル（同じ内容を他の試験が使っていないもの）は
+        # トリガーで削除待ちに登録され、コミット後にバックグラウンドで削除する
+        deleted_files = cur.execute('''
+            SELECT COUNT(*) FROM PendingFileDeletions
+            WHERE filename IN (SELECT value FROM json_each(?))
+        ''', (json.dumps([q['picture'] for q in questions if q['picture']]),)).fetchone()[0]
+        
         con.commit()
+        schedule_file_deletions()
         
         # 削除結果のメッセージ作成
         success_message = f'試験「{exam_info}」を削除しました'
         if deleted_files:
-            success_message += f'（{len(deleted_files)}個のファイルも削除）'
-        if failed_files:
-            success_message += f'（注意: {len(failed_files)}個のファイルの削除に失敗）'
+            success_message += f'（{deleted_files}個のファイルも削除）'
         
         return {
             'success': True, 
             'message': success_message,
-            'deleted_files': len(deleted_files),
-            'failed_files': len(failed_files)
+            'deleted_files': deleted_files
         }
         
     except sqlite3.Error as e:
@@ -1118,5 +2493,297 @@ def exam_delete_ajax(exam_id: int):
         con.rollback()
         return {'success': False, 'message': f'予期しないエラーが発生しました: {str(e)}'}, 500
 
+# ===== アップロードファイルの削除 =====
+#
+# ExamQuestions の行を削除して参照がなくなったファイルは、トリガーが同じトランザクションで
+# PendingFileDeletions に登録する。削除処理はコミット後に schedule_file_deletions で
+# バックグラウンドに回すので、リクエストも書き込みロックもファイル削除を待たない。
+
+file_deletion_executor = concurrent.futures.ThreadPoolExecutor(max_workers=FILE_DELETE_WORKERS,
+                                                               thread_name_prefix='file-delete')
+_file_deletion_lock = threading.Lock()
+_file_deletion_scheduled = False
+_last_orphan_sweep: Optional[float] = None
+
+def drain_file_deletions(con: sqlite3.Connection, batch_size: int = FILE_DELETE_BATCH_SIZE,
+                         wait: bool = False) -> int:
+    """PendingFileDeletions のファイルを削除し、削除したファイルの数を返す（wait なら削除し終えるまで待つ）
+
+    書き込みロックを取っている間は、再び参照されていないことを確かめてファイルを
+    .trash に移すだけにする（commit_upload で同じ内容が保存し直されても消さないため）。
+    .trash からの削除と縮小画像の削除はロックを解放してからワーカースレッドで行う。
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    trash = os.path.join(folder, TRASH_FOLDER_NAME)
+    os.makedirs(trash, exist_ok=True)
+    removed = 0
+    futures = []
+    while True:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            rows = con.execute('''
+                SELECT filename FROM PendingFileDeletions ORDER BY queued_at LIMIT ?
+            ''', (batch_size,)).fetchall()
+            done = []
+            trashed = []
+            for row in rows:
+                filename = row[0]
+                referenced = con.execute('SELECT 1 FROM ExamQuestions WHERE picture = ? LIMIT 1',
+                                         (filename,)).fetchone()
+                if not referenced:
+                    target = os.path.join(trash, f'{filename}.{secrets.token_hex(4)}')
+                    try:
+                        os.replace(os.path.join(folder, filename), target)
+                    except FileNotFoundError:
+                        target = None
+                    except OSError as e:
+                        # 削除待ちに残して次回もう一度試す
+                        app.logger.error("ファイル削除失敗: %s, エラー: %s", filename, e)
+                        continue
+                    trashed.append((filename, target))
+                done.append((filename,))
+            con.executemany('DELETE FROM PendingFileDeletions WHERE filename = ?', done)
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+        futures += [file_deletion_executor.submit(remove_trashed_upload, filename, target)
+                    for filename, target in trashed]
+        removed += sum(1 for _, target in trashed if target)
+        if len(rows) < batch_size or not done:
+            break
+    if wait:
+        concurrent.futures.wait(futures)
+    return removed
+
+def remove_trashed_upload(filename: str, path: Optional[str]) -> None:
+    """.trash に移したファイルと縮小画像を削除（失敗したものは sweep_orphan_uploads が消す）"""
+    remove_derivatives(filename)
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def sweep_orphan_uploads(con: sqlite3.Connection) -> int:
+    """アップロードフォルダと ExamQuestions を突き合わせ、参照されていないファイルを削除待ちに登録
+
+    登録した数を返す。保存から ORPHAN_GRACE_PERIOD 経っていないファイルはコミット前の
+    アップロードかもしれないので対象にしない。削除途中で残った .trash のファイル、
+    期限切れの一時ファイル（.part と分割アップロード）、元のファイルがない縮小画像も削除する。
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    now = time.time()
+    referenced = {row[0] for row in con.execute('''
+        SELECT DISTINCT picture FROM ExamQuestions WHERE picture IS NOT NULL
+    ''')}
+    orphans = []
+    for entry in os.scandir(folder):
+        try:
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            mtime = entry.stat().st_mtime
+            if entry.name.endswith('.part'):
+                if mtime < now - UPLOAD_SESSION_TTL:
+                    os.remove(entry.path)
+            elif entry.name not in referenced and mtime < now - ORPHAN_GRACE_PERIOD:
+                orphans.append((entry.name,))
+        except OSError:
+            pass
+
+    # .trash に残ったファイルと、元のファイル（「元のファイル名.jpg」の元）がない縮小画像
+    leftovers = [(os.path.join(folder, TRASH_FOLDER_NAME), False)]
+    leftovers += [(os.path.join(folder, DERIVED_FOLDER_NAME, size), True) for size in IMAGE_DERIVATIVES]
+    for subfolder, derived in leftovers:
+        if not os.path.isdir(subfolder):
+            continue
+        for entry in os.scandir(subfolder):
+            try:
+                if not derived or not os.path.exists(os.path.join(folder, entry.name[:-len('.jpg')])):
+                    os.remove(entry.path)
+            except OSError:
+                pass
+    if os.path.isdir(os.path.join(folder, PARTIAL_FOLDER_NAME)):
+        sweep_upload_sessions()
+
+    if orphans:
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            con.executemany('''
+                INSERT INTO PendingFileDeletions (filename) VALUES (?) ON CONFLICT DO NOTHING
+            ''', orphans)
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+    return len(orphans)
+
+def schedule_file_deletions() -> None:
+    """削除待ちのファイルをバックグラウンドで削除する（ExamQuestions の行を削除してコミットした後に呼ぶ）
+
+    実行待ちの削除処理があれば新たに登録しない。前回から ORPHAN_SWEEP_INTERVAL 経っていれば
+    sweep_orphan_uploads も合わせて実行する。
+    """
+    global _file_deletion_scheduled, _last_orphan_sweep
+    with _file_deletion_lock:
+        now = time.monotonic()
+        sweep = _last_orphan_sweep is None or now - _last_orphan_sweep >= ORPHAN_SWEEP_INTERVAL
+        if sweep:
+            _last_orphan_sweep = now
+        elif _file_deletion_scheduled:
+            return
+        _file_deletion_scheduled = True
+    file_deletion_executor.submit(_run_file_deletions, sweep)
+
+def _run_file_deletions(sweep: bool) -> None:
+    """schedule_file_deletions から登録される処理（接続はプールから借りる）"""
+    global _file_deletion_scheduled
+    with _file_deletion_lock:
+        _file_deletion_scheduled = False
+    con = db_pool.checkout()
+    try:
+        if sweep:
+            sweep_orphan_uploads(con)
+        drain_file_deletions(con)
+    except Exception as e:
+        app.logger.error("File deletion error: %s", e)
+    finally:
+        db_pool.checkin(con)
+
+# ===== 一括登録 =====
+
+@app.route('/admin/import')
+@admin_required
+def admin_import() -> str:
+    """試験の一括登録ページ"""
+    return render_template('admin/import.html', result=None)
+
+@app.route('/admin/import', methods=['POST'])
+@admin_required
+def admin_import_execute():
+    """manifest と問題ファイルの ZIP を受け取り、import_exams.py と同じ処理で一括登録する
+
+    本文の上限は MAX_IMPORT_SIZE（ENDPOINT_MAX_CONTENT_LENGTH）。
+    """
+    from import_exams import ScanArchive, import_exams, read_manifest
+
+    manifest = request.files.get('manifest')
+    if manifest is None or not manifest.filename:
+        flash('manifest ファイルを選択してください', 'error')
+        return redirect(url_for('admin_import'))
+    archive_file = request.files.get('archive')
+
+    try:
+        rows = read_manifest(manifest.stream, manifest.filename)
+        with ScanArchive(archive_file.stream if archive_file and archive_file.filename else None) as archive:
+            result = import_exams(get_db(), rows, archive, session['user_id'])
+    except (ValueError, UnicodeDecodeError, zipfile.BadZipFile) as e:
+        flash(f'ファイルを読み込めません: {e}', 'error')
+        return redirect(url_for('admin_import'))
+    except sqlite3.Error as e:
+        flash(f'データベースエラーが発生しました: {e}', 'error')
+        return redirect(url_for('admin_import'))
+
+    seconds = max(result['seconds'], 1e-9)
+    result['rows_per_second'] = result['inserted'] / seconds
+    result['files_per_second'] = result['files'] / seconds
+    return render_template('admin/import.html', result=result)
+
+@app.cli.command('dedupe-uploads')
+def dedupe_uploads_command() -> None:
+    """既存のアップロードファイルを内容ハッシュ名に移し、重複を1つにまとめる
+
+        flask --app app dedupe-uploads
+    """
+    con = get_db()
+    cur = con.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    renamed = 0
+    try:
+        pictures = cur.execute('''
+            SELECT DISTINCT picture FROM ExamQuestions WHERE picture IS NOT NULL
+        ''').fetchall()
+        for row in pictures:
+            picture = row['picture']
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], picture)
+            if not os.path.isfile(file_path) or '.' not in picture:
+                continue
+            with open(file_path, 'rb') as f:
+                filename = store_upload(f, picture)
+            if filename == picture:
+                continue
+            # 元のファイル名は表示用に残しておく
+            cur.execute('''
+                UPDATE ExamQuestions
+                SET picture = ?, original_filename = COALESCE(original_filename, ?)
+                WHERE picture = ?
+            ''', (filename, picture, picture))
+            renamed += 1
+        con.commit()
+    except Exception:
+        con.rollback()
+        raise
+    # 参照がなくなった旧ファイルはトリガーで削除待ちに登録されている
+    removed = drain_file_deletions(con, wait=True)
+    print(f"{renamed}個のファイル名を更新し、{removed}個の旧ファイルを削除しました")
+
+@app.cli.command('sweep-uploads')
+def sweep_uploads_command() -> None:
+    """参照されていないアップロードファイルと削除待ちのファイルを削除する
+
+        flask --app app sweep-uploads
+    """
+    con = get_db()
+    orphans = sweep_orphan_uploads(con)
+    removed = drain_file_deletions(con, wait=True)
+    print(f"{orphans}個の孤立ファイルを見つけ、削除待ちを含めて{removed}個のファイルを削除しました")
+
+@app.cli.command('deactivate-user')
+@click.argument('email')
+def deactivate_user_command(email: str) -> None:
+    """ユーザーを無効化し、発行済みのセッションを使えなくする
+
+        flask --app app deactivate-user someone@keio.jp
+    """
+    set_user_active(email, False)
+
+@app.cli.command('activate-user')
+@click.argument('email')
+def activate_user_command(email: str) -> None:
+    """無効化したユーザーを再び有効にする
+
+        flask --app app activate-user someone@keio.jp
+    """
+    set_user_active(email, True)
+
+@app.cli.command('revoke-sessions')
+@click.argument('email')
+def revoke_sessions_command(email: str) -> None:
+    """ユーザーの発行済みのセッションをすべて無効にする（ユーザーは有効なまま）
+
+        flask --app app revoke-sessions someone@keio.jp
+    """
+    con = get_db()
+    cur = con.execute('UPDATE Users SET session_version = session_version + 1 WHERE email = ?',
+                      (email.strip().lower(),))
+    con.commit()
+    if cur.rowcount == 0:
+        raise click.ClickException(f'ユーザーが見つかりません: {email}')
+    user_cache.invalidate()
+    print(f"{email} のセッションを無効にしました（他のプロセスでは最大{USER_CACHE_TTL:g}秒後に反映されます）")
+
+def set_user_active(email: str, active: bool) -> None:
+    """Users.is_active を変更（トリガーで session_version も上がる）"""
+    con = get_db()
+    cur = con.execute('''
+        UPDATE Users SET is_active = ? WHERE email = ?
+    ''', (int(active), email.strip().lower()))
+    con.commit()
+    if cur.rowcount == 0:
+        raise click.ClickException(f'ユーザーが見つかりません: {email}')
+    user_cache.invalidate()
+    print(f"{email} を{'有効' if active else '無効'}にしました")
+
 if __name__ == '__main__':
+    require_vendor_assets()
     app.run(debug=True)
\ No newline at end of file
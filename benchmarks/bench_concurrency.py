@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+同時読み書き負荷テスト
+
+試験一覧の読み込みを行うスレッドと、試験の追加・削除を行うスレッドを同時に走らせ、
+従来のロールバックジャーナル設定と init_db.DB_PROFILE（WAL）のスループットと
+ロックエラー数を比較する。データベースは一時ディレクトリにコピーして使用する。
+
+    python benchmarks/bench_concurrency.py --readers 8 --writers 2 --seconds 5
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from init_db import DB_PROFILE, apply_db_profile
+
+# 変更前の設定（ロールバックジャーナル、既定の同期レベル）
+LEGACY_PROFILE: dict[str, object] = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'foreign_keys': 'ON',
+}
+
+LIST_QUERY = '''
+    SELECT
+        e.exam_id, f.faculty_name, d.department_name, s.subject_name,
+        et.exam_type_name, e.exam_year,
+        GROUP_CONCAT(p.professor_name, ', ') AS professors, e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    GROUP BY e.exam_id
+    ORDER BY e.exam_year DESC, f.faculty_name, d.department_name, s.subject_name
+'''
+
+
+def run(database: str, profile: dict[str, object], readers: int, writers: int,
+        seconds: float, hold: float) -> dict[str, int]:
+    """指定プロファイルで負荷をかけ、操作数とエラー数を返す"""
+    setup = sqlite3.connect(database)
+    apply_db_profile(setup, profile)
+    subject_id, exam_type_id = setup.execute(
+        'SELECT subject_id, (SELECT MIN(exam_type_id) FROM ExamTypes) FROM Subjects LIMIT 1').fetchone()
+    setup.close()
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def add(key: str) -> None:
+        with lock:
+            counts[key] += 1
+
+    def reader() -> None:
+        con = sqlite3.connect(database, timeout=1.0)
+        apply_db_profile(con, {k: v for k, v in profile.items() if k != 'journal_mode'})
+        while not stop.is_set():
+            try:
+                con.execute(LIST_QUERY).fetchall()
+                add('reads')
+            except sqlite3.OperationalError:
+                add('errors')
+        con.close()
+
+    def writer(index: int) -> None:
+        con = sqlite3.connect(database, timeout=1.0)
+        apply_db_profile(con, {k: v for k, v in profile.items() if k != 'journal_mode'})
+        year = 3000 + index * 1000
+        while not stop.is_set():
+            year += 1
+            try:
+                cur = con.cursor()
+                cur.execute('''
+                    INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions)
+                    VALUES (?, ?, ?, ?)
+                ''', (subject_id, exam_type_id, year, 'load test'))
+                exam_id = cur.lastrowid
+                cur.execute('INSERT INTO ExamQuestions (exam_id, picture) VALUES (?, ?)',
+                            (exam_id, 'load.jpg'))
+                # アップロード処理などでトランザクションを保持している時間を模擬
+                time.sleep(hold)
+                cur.execute('DELETE FROM ExamQuestions WHERE exam_id = ?', (exam_id,))
+                cur.execute('DELETE FROM Exams WHERE exam_id = ?', (exam_id,))
+                con.commit()
+                add('writes')
+            except sqlite3.OperationalError:
+                con.rollback()
+                add('errors')
+        con.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--hold', type=float, default=0.005,
+                        help='書き込みトランザクション中の待ち時間（秒）')
+    args = parser.parse_args()
+
+    print(f"readers={args.readers} writers={args.writers} seconds={args.seconds}")
+    for label, profile in (('legacy', LEGACY_PROFILE), ('tuned', DB_PROFILE)):
+        with tempfile.TemporaryDirectory() as work:
+            database = os.path.join(work, 'database.db')
+            shutil.copy(args.database, database)
+            counts = run(database, profile, args.readers, args.writers, args.seconds, args.hold)
+        print(f"{label:<7} reads/s={counts['reads'] / args.seconds:9.1f} "
+              f"writes/s={counts['writes'] / args.seconds:8.1f} "
+              f"lock errors={counts['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+試験追加処理の SQL 文の数と所要時間の比較ベンチマーク
+
+変更前の試験追加処理（検索してから作成する SELECT と INSERT の組み合わせ、ファイルごとの
+INSERT）と、app.py の UPSERT・executemany を使った処理を同じ入力で実行し、
+1件あたりの SQL の実行回数（execute / executemany の呼び出し数。トリガー内の文や
+executemany の各行は数えない）と時間を比較する。
+データベースは一時ディレクトリにコピーして使用する。
+
+    python benchmarks/bench_exam_write.py --exams 300 --files 3
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import save_exam_assignments, save_exam_references
+from init_db import apply_db_profile, upgrade_database
+
+
+class CountingCursor(sqlite3.Cursor):
+    """execute / executemany の呼び出し回数を数えるカーソル"""
+
+    calls = 0
+
+    def execute(self, *args):
+        CountingCursor.calls += 1
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        CountingCursor.calls += 1
+        return super().executemany(*args)
+
+
+def legacy_add(cur: sqlite3.Cursor, values: dict, pictures: list[str]) -> None:
+    """変更前の exam_add_execute と同じ順序で SQL を発行"""
+    cur.execute('SELECT department_id FROM Departments WHERE department_id = ? AND faculty_id = ?',
+                (values['department_id'], values['faculty_id'])).fetchone()
+    row = cur.execute('''
+        SELECT subject_id FROM Subjects
+        WHERE department_id = ? AND subject_name = ? AND subject_type = ? AND semester = ? AND grade_level = ?
+    ''', (values['department_id'], values['subject_name'], values['subject_type'], values['semester'],
+          values['grade_level'])).fetchone()
+    if row:
+        subject_id = row[0]
+    else:
+        cur.execute('''
+            INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (values['department_id'], values['subject_name'], values['subject_type'], values['semester'],
+              values['grade_level']))
+        subject_id = cur.lastrowid
+    row = cur.execute('SELECT professor_id FROM Professors WHERE professor_name = ?',
+                      (values['professor_name'],)).fetchone()
+    if row:
+        professor_id = row[0]
+    else:
+        cur.execute('INSERT INTO Professors (professor_name) VALUES (?)', (values['professor_name'],))
+        professor_id = cur.lastrowid
+    cur.execute('SELECT exam_id FROM Exams WHERE subject_id = ? AND exam_type_id = ? AND exam_year = ?',
+                (subject_id, values['exam_type_id'], values['exam_year'])).fetchone()
+    cur.execute('''
+        INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions, created_by)
+        VALUES (?, ?, ?, ?, NULL)
+    ''', (subject_id, values['exam_type_id'], values['exam_year'], values['instructions']))
+    exam_id = cur.lastrowid
+    cur.execute('INSERT INTO ExamProfessors (exam_id, professor_id) VALUES (?, ?)', (exam_id, professor_id))
+    row = cur.execute('''
+        SELECT 1 FROM SubjectProfessors
+        WHERE subject_id = ? AND professor_id = ? AND assignment_year = ? AND assignment_semester = ?
+    ''', (subject_id, professor_id, values['exam_year'], values['semester'])).fetchone()
+    if not row:
+        cur.execute('''
+            INSERT INTO SubjectProfessors (subject_id, professor_id, assignment_year, assignment_semester)
+            VALUES (?, ?, ?, ?)
+        ''', (subject_id, professor_id, values['exam_year'], values['semester']))
+    for picture in pictures:
+        cur.execute('INSERT INTO ExamQuestions (exam_id, picture) VALUES (?, ?)', (exam_id, picture))
+
+
+def current_add(cur: sqlite3.Cursor, values: dict, pictures: list[str]) -> None:
+    """app.py の exam_add_execute と同じ処理"""
+    subject_id, professor_id = save_exam_references(cur, values)
+    exam_id = cur.execute('''
+        INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions, created_by)
+        VALUES (?, ?, ?, ?, NULL)
+        ON CONFLICT (subject_id, exam_type_id, exam_year) DO NOTHING
+        RETURNING exam_id
+    ''', (subject_id, values['exam_type_id'], values['exam_year'], values['instructions'])).fetchall()[0][0]
+    save_exam_assignments(cur, exam_id, subject_id, professor_id, values,
+                          [(exam_id, picture, picture) for picture in pictures])
+
+
+def run(database: str, add, exams: int, files: int) -> tuple[float, float]:
+    """試験を exams 件追加し、1件あたりの SQL の実行回数と時間（ミリ秒）を返す"""
+    con = sqlite3.connect(database)
+    apply_db_profile(con)
+    upgrade_database(con)
+    con.row_factory = sqlite3.Row
+    department_id, faculty_id = con.execute('SELECT department_id, faculty_id FROM Departments LIMIT 1').fetchone()
+    exam_type_id = con.execute('SELECT MIN(exam_type_id) FROM ExamTypes').fetchone()[0]
+
+    CountingCursor.calls = 0
+    start = time.perf_counter()
+    for i in range(exams):
+        values = {
+            'faculty_id': faculty_id, 'department_id': department_id,
+            # 半分は既存の科目・教員を再利用する
+            'subject_name': f'ベンチマーク科目{i // 2}', 'subject_type': '必修', 'semester': '春学期',
+            'grade_level': 1, 'professor_name': f'ベンチマーク教員{i // 2}',
+            'exam_type_id': exam_type_id, 'exam_year': 2000 + i % 2, 'instructions': 'bench',
+        }
+        con.execute('BEGIN IMMEDIATE')
+        add(con.cursor(CountingCursor), values, [f'bench_{i}_{n}.jpg' for n in range(files)])
+        con.commit()
+    elapsed = time.perf_counter() - start
+    con.close()
+    return CountingCursor.calls / exams, elapsed / exams * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    parser.add_argument('--exams', type=int, default=300)
+    parser.add_argument('--files', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"exams={args.exams} files/exam={args.files}")
+    for label, add in (('legacy', legacy_add), ('upsert', current_add)):
+        with tempfile.TemporaryDirectory() as work:
+            database = os.path.join(work, 'database.db')
+            shutil.copy(args.database, database)
+            statements, ms = run(database, add, args.exams, args.files)
+        print(f"{label:<7} statements/exam={statements:5.1f}  {ms:7.3f}ms/exam")
+
+
+if __name__ == '__main__':
+    main()
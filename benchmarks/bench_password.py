@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+パスワード検証のスループット（logins/s）ベンチマーク
+
+passwords.py の方式・コスト設定ごとに、複数のクライアントスレッドから
+同時にログイン（run_password_task による verify_password）を行い、
+1秒あたりの検証数と1回あたりの待ち時間を計測する。
+
+    python benchmarks/bench_password.py --clients 16 --seconds 3
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from passwords import PASSWORD_HASH_WORKERS, hash_password, run_password_task, verify_password
+
+# 計測する方式とパラメータ
+SETTINGS: list[tuple[str, tuple[int, ...]]] = [
+    ('scrypt', (2 ** 13, 8, 1)),
+    ('scrypt', (2 ** 14, 8, 1)),
+    ('scrypt', (2 ** 15, 8, 1)),
+    ('pbkdf2_sha256', (200000,)),
+    ('pbkdf2_sha256', (600000,)),
+]
+
+PASSWORD = 'keio123'
+
+
+def run(password_hash: str, clients: int, seconds: float) -> tuple[int, float]:
+    """clients 個のスレッドで検証を繰り返し、(検証数, 平均待ち時間ミリ秒) を返す"""
+    count = 0
+    waited = 0.0
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client() -> None:
+        nonlocal count, waited
+        while not stop.is_set():
+            start = time.perf_counter()
+            assert run_password_task(verify_password, PASSWORD, password_hash)
+            elapsed = time.perf_counter() - start
+            with lock:
+                count += 1
+                waited += elapsed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return count, waited / max(count, 1) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"clients={args.clients} workers={PASSWORD_HASH_WORKERS} seconds={args.seconds}")
+    for scheme, params in SETTINGS:
+        password_hash = hash_password(PASSWORD, scheme, params)
+        count, latency = run(password_hash, args.clients, args.seconds)
+        label = f"{scheme}{params}"
+        print(f"{label:<28} logins/s={count / args.seconds:8.1f}  latency={latency:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+試験詳細・一覧ページの描画時間とサイズのベンチマーク
+
+データベースを一時ディレクトリにコピーし、ログインしたテストクライアントから
+試験詳細・一覧ページを繰り返し取得して、ページキャッシュなし（毎回 render_template）と
+あり（2回目以降はキャッシュから返す）の1リクエストあたりの時間とバイト数を比較する。
+
+    python benchmarks/bench_render.py --repeat 200 --email user1@keio.jp
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run(client, path: str, repeat: int) -> tuple[float, int]:
+    """(1リクエストあたりのミリ秒, バイト数) を返す"""
+    body = client.get(path).get_data()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(path).get_data()
+    return (time.perf_counter() - start) / repeat * 1000, len(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    parser.add_argument('--email', default='user1@keio.jp')
+    parser.add_argument('--password', default='keio123')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        database = os.path.join(work, 'database.db')
+        shutil.copy(args.database, database)
+        os.environ['DATABASE_PATH'] = database
+        os.environ.setdefault('METRICS_ENABLED', '0')
+        # ライブラリを取得していない開発環境でも描画できるようにする（URL を出力するだけ）
+        os.environ.setdefault('ASSET_CDN_FALLBACK', '1')
+        os.chdir(ROOT)
+        import app as app_module
+
+        con = sqlite3.connect(database)
+        exam_id = con.execute('SELECT exam_id FROM Exams ORDER BY exam_id LIMIT 1').fetchone()[0]
+        con.close()
+
+        client = app_module.app.test_client()
+        client.post('/login', data={'email': args.email, 'password': args.password})
+        with client.session_transaction() as session:
+            if 'user_id' not in session:
+                raise RuntimeError('ログインできませんでした')
+        client.get('/home')
+
+        paths = [f'/exam/{exam_id}', '/exams', '/exams?year_filter=2024']
+        cache_size = app_module.PAGE_CACHE_MAX_BYTES
+        print(f"repeat={args.repeat}")
+        for path in paths:
+            results = []
+            for label, size in (('render', 0), ('cached', cache_size or 32 * 1024 * 1024)):
+                app_module.PAGE_CACHE_MAX_BYTES = size
+                app_module.page_cache = app_module.PageCache(size)
+                results.append((label, *run(client, path, args.repeat)))
+            line = '  '.join(f"{label}={ms:7.3f}ms" for label, ms, _ in results)
+            print(f"{path:<28} {line}  bytes={results[0][2]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+全文検索インデックス（ExamSearch）と LIKE 検索の比較ベンチマーク
+
+データベースを一時ディレクトリにコピーして架空の試験を追加し、
+同じ検索語について FTS5（trigram）の MATCH と ExamListing への LIKE を計測する。
+
+    python benchmarks/bench_search.py --exams 50000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from init_db import apply_db_profile, upgrade_database
+
+WORDS = ['経済', '統計', '情報', '基礎', '応用', '理論', '演習', '概論', '特論', '数学',
+         '物理', '化学', '法学', '政治', '文学', '歴史', '哲学', '心理', '工学', '医学']
+
+
+def populate(con: sqlite3.Connection, count: int) -> None:
+    """架空の科目・試験を追加"""
+    rng = random.Random(0)
+    departments = [row[0] for row in con.execute('SELECT department_id FROM Departments')]
+    exam_type_id = con.execute('SELECT MIN(exam_type_id) FROM ExamTypes').fetchone()[0]
+    cur = con.cursor()
+    for i in range(count):
+        name = ''.join(rng.sample(WORDS, 3)) + f'{i}'
+        cur.execute('''
+            INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
+            VALUES (?, ?, '必修', '春学期', 1)
+        ''', (rng.choice(departments), name))
+        cur.execute('''
+            INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions)
+            VALUES (?, ?, ?, ?)
+        ''', (cur.lastrowid, exam_type_id, rng.randint(2000, 2030),
+              '、'.join(rng.sample(WORDS, 5)) + 'について出題します。'))
+    con.commit()
+
+
+def timed(con: sqlite3.Connection, sql: str, params: tuple, repeat: int) -> tuple[float, int]:
+    """平均実行時間（ミリ秒）と件数を返す"""
+    rows = con.execute(sql, params).fetchall()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        con.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeat * 1000, len(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    parser.add_argument('--exams', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        database = os.path.join(work, 'database.db')
+        shutil.copy(args.database, database)
+        con = sqlite3.connect(database)
+        apply_db_profile(con)
+        upgrade_database(con)
+        populate(con, args.exams)
+
+        total = con.execute('SELECT COUNT(*) FROM ExamListing').fetchone()[0]
+        print(f"exams={total}")
+        for term in ('統計情報', '応用哲学', '心理学'):
+            fts_ms, fts_rows = timed(con, '''
+                SELECT l.exam_id FROM ExamListing l
+                JOIN ExamSearch ON ExamSearch.rowid = l.exam_id
+                WHERE ExamSearch MATCH ?
+                ORDER BY ExamSearch.rank LIMIT 100
+            ''', (f'subject_name : "{term}"',), args.repeat)
+            like_ms, like_rows = timed(con, '''
+                SELECT exam_id FROM ExamListing WHERE subject_name LIKE ? LIMIT 100
+            ''', (f'%{term}%',), args.repeat)
+            print(f"{term:<6} fts={fts_ms:8.3f}ms ({fts_rows} rows)  like={like_ms:8.3f}ms ({like_rows} rows)")
+        con.close()
+
+
+if __name__ == '__main__':
+    main()
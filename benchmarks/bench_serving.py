@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+CGI 起動と常駐ワーカーの応答時間比較ベンチマーク
+
+index.cgi をリクエストごとに起動する場合（コールドスタート）と、
+serve.py で常駐させたワーカーにリクエストする場合（ウォーム）を比較する。
+
+    python benchmarks/bench_serving.py --requests 30 --path /login
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(label: str, samples: list[float]) -> None:
+    """計測結果を表示"""
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[max(0, int(len(samples_ms) * 0.95) - 1)]
+    total = sum(samples)
+    print(f"{label:<8} n={len(samples):<4} "
+          f"mean={statistics.mean(samples_ms):8.2f}ms "
+          f"median={statistics.median(samples_ms):8.2f}ms "
+          f"p95={p95:8.2f}ms "
+          f"{len(samples) / total:8.1f} req/s")
+
+
+def bench_cgi(path: str, n: int) -> list[float]:
+    """index.cgi を CGI として毎回起動して計測"""
+    env = dict(os.environ,
+               ASSET_CDN_FALLBACK=os.environ.get('ASSET_CDN_FALLBACK', '1'),
+               GATEWAY_INTERFACE='CGI/1.1',
+               REQUEST_METHOD='GET',
+               SCRIPT_NAME='/index.cgi',
+               PATH_INFO=path,
+               QUERY_STRING='',
+               SERVER_NAME='localhost',
+               SERVER_PORT='80',
+               SERVER_PROTOCOL='HTTP/1.1')
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, 'index.cgi'], cwd=ROOT, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - start)
+        if not result.stdout.startswith(b'Status:'):
+            raise RuntimeError(f'CGI の応答が不正です: {result.stdout[:200]!r}')
+    return samples
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def bench_warm(path: str, n: int, workers: int) -> list[float]:
+    """serve.py で常駐させたワーカーに対して計測"""
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, 'serve.py', '--port', str(port),
+                             '--workers', str(workers), '--quiet'],
+                            cwd=ROOT, stderr=subprocess.DEVNULL,
+                            env=dict(os.environ, ASSET_CDN_FALLBACK=os.environ.get('ASSET_CDN_FALLBACK', '1')))
+    try:
+        # 起動待ち
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('serve.py が起動しませんでした')
+                time.sleep(0.1)
+
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            conn.request('GET', path)
+            conn.getresponse().read()
+            conn.close()
+            samples.append(time.perf_counter() - start)
+        return samples
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=30)
+    parser.add_argument('--path', default='/login')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"GET {args.path} x {args.requests}")
+    summarize('cgi', bench_cgi(args.path, args.requests))
+    summarize('warm', bench_warm(args.path, args.requests, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+試験一覧の絞り込みクエリの実行計画の確認
+
+データベースを一時ディレクトリにコピーしてスキーマ移行を適用し、ID・年度・全文検索による
+絞り込みごとに、一覧ページ（1ページ目・次ページ・前ページ）と /api/exams（ページ単位）が実行する SQL の
+EXPLAIN QUERY PLAN を取得する。テーブルを全件走査する（SCAN）計画が1つでもあるか、
+1ページ目の SQL が絞り込み条件ごとに期待するインデックスを使っていなければ、その計画を
+表示して終了コード 1 で終わる。
+
+テストや CI からは自動では実行されない。スキーマ・インデックス・一覧の SQL を変更したときに
+手動で実行し、統計なしと --exams の両方で OK になることを確認する。
+
+--exams を指定すると架空の試験を追加して ANALYZE した状態（統計に基づく計画）でも確認する。
+件数の少ないデータベースで ANALYZE すると、全件走査の方が速いと判断されることがある。
+
+    python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --exams 20000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 確認する絞り込み条件と、1ページ目の SQL の実行計画に現れるべきインデックス（またはテーブル）の候補
+# （{faculty_id} などはデータベースにある最初の ID に置き換える）
+FILTER_CASES: list[tuple[dict[str, str], tuple[str, ...]]] = [
+    ({'faculty_id': '{faculty_id}'}, ('idx_exam_listing_faculty',)),
+    ({'department_id': '{department_id}'}, ('idx_exam_listing_department',)),
+    ({'subject_id': '{subject_id}'}, ('idx_exam_listing_subject',)),
+    ({'exam_type_id': '{exam_type_id}'}, ('idx_exam_listing_exam_type',)),
+    ({'professor_id': '{professor_id}'}, ('idx_exam_professors_professor',)),
+    ({'year_filter': '2024'}, ('idx_exam_listing_order',)),
+    ({'year_from': '2022', 'year_to': '2024'}, ('idx_exam_listing_order',)),
+    ({'faculty_id': '{faculty_id}', 'year_from': '2023'}, ('idx_exam_listing_faculty',)),
+    ({'department_id': '{department_id}', 'exam_type_id': '{exam_type_id}'},
+     ('idx_exam_listing_department', 'idx_exam_listing_exam_type')),
+    ({'faculty_id': '{faculty_id}', 'subject_filter': 'データベース'}, ('ExamSearch',)),
+    ({'department_id': '{department_id}', 'q': 'データベース'}, ('ExamSearch',)),
+]
+
+
+def populate(con: sqlite3.Connection, count: int) -> None:
+    """架空の科目・教員・試験を追加"""
+    rng = random.Random(0)
+    departments = [row[0] for row in con.execute('SELECT department_id FROM Departments')]
+    exam_types = [row[0] for row in con.execute('SELECT exam_type_id FROM ExamTypes')]
+    cur = con.cursor()
+    professors = []
+    for i in range(max(1, count // 20)):
+        cur.execute('INSERT INTO Professors (professor_name) VALUES (?)', (f'架空教員{i}',))
+        professors.append(cur.lastrowid)
+    for i in range(count):
+        cur.execute('''
+            INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
+            VALUES (?, ?, '必修', '春学期', 1)
+        ''', (rng.choice(departments), f'架空科目{i}'))
+        cur.execute('''
+            INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions) VALUES (?, ?, ?, '')
+        ''', (cur.lastrowid, rng.choice(exam_types), rng.randint(2000, 2030)))
+        cur.execute('INSERT INTO ExamProfessors (exam_id, professor_id) VALUES (?, ?)',
+                    (cur.lastrowid, rng.choice(professors)))
+    con.commit()
+
+
+class PlanCursor(sqlite3.Cursor):
+    """実行する SQL の実行計画を plans に記録するカーソル"""
+
+    plans: list[tuple[str, list[str]]] = []
+
+    def execute(self, sql, parameters=()):
+        plan = [row[3] for row in self.connection.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+        PlanCursor.plans.append((sql, plan))
+        return super().execute(sql, parameters)
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    """実行計画のうちテーブル（仮想テーブル・副問い合わせの結果を除く）を全件走査する行"""
+    derived = set()
+    scans = []
+    for detail in plan:
+        for prefix in ('MATERIALIZE ', 'CO-ROUTINE '):
+            if detail.startswith(prefix):
+                derived.add(detail[len(prefix):])
+        if not detail.startswith('SCAN '):
+            continue
+        name = detail[len('SCAN '):].split(' ', 1)[0]
+        if name in derived or name.startswith('(') or name == 'CONSTANT' or 'VIRTUAL TABLE' in detail:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def uses_index(plan: list[str], indexes: tuple[str, ...]) -> bool:
+    """実行計画が indexes（インデックス名またはテーブル名）のどれかを使っているか"""
+    return any(f'INDEX {index} ' in f'{detail} ' or detail.startswith(f'SCAN {index} VIRTUAL TABLE')
+               for detail in plan for index in indexes)
+
+
+def first_ids(con: sqlite3.Connection) -> dict[str, str]:
+    """FILTER_CASES に埋め込む ID"""
+    queries = {
+        'faculty_id': 'SELECT MIN(faculty_id) FROM ExamListing',
+        'department_id': 'SELECT MIN(department_id) FROM ExamListing',
+        'subject_id': 'SELECT MIN(subject_id) FROM ExamListing',
+        'exam_type_id': 'SELECT MIN(exam_type_id) FROM ExamListing',
+        'professor_id': 'SELECT MIN(professor_id) FROM ExamProfessors',
+    }
+    return {name: str(con.execute(sql).fetchone()[0] or 1) for name, sql in queries.items()}
+
+
+def collect_plans(app_module, con: sqlite3.Connection, case: dict) -> list[tuple[str, list[str]]]:
+    """絞り込み条件 case で一覧ページと /api/exams が実行する SQL とその実行計画"""
+    PlanCursor.plans = []
+    _, where, params, match, ranked = app_module.build_exam_filter(case)
+    cur = con.cursor(PlanCursor)
+    if ranked:
+        app_module.fetch_ranked_exams(cur, where, params, match)
+        return PlanCursor.plans
+
+    if match:
+        where += ' AND exam_id IN (SELECT rowid FROM ExamSearch WHERE ExamSearch MATCH ?)'
+        params.append(match)
+    rows, _, _ = app_module.fetch_exam_page(cur, where, params)
+    key = app_module.decode_cursor(app_module.encode_cursor(rows[-1])) if rows else (2024, '', '', '', 0)
+    app_module.fetch_exam_page(cur, where, params, after=key)
+    app_module.fetch_exam_page(cur, where, params, before=key)
+    # format=jsonl（件数の制限なし）は条件に合う行をすべて読むので、条件に合う行が多ければ
+    # 全件走査の方が速いと判断されうる。同じ WHERE 句のページ単位の SQL だけを確認する
+    fields = tuple(app_module.API_EXAM_FIELDS)
+    cur.execute(app_module.api_exam_query(fields, where + ' AND exam_id > ?', limit=True), [*params, 0, 10])
+    return PlanCursor.plans
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=os.path.join(ROOT, 'database.db'))
+    parser.add_argument('--exams', type=int, default=0, help='架空の試験を追加して ANALYZE してから確認する')
+    parser.add_argument('-v', '--verbose', action='store_true', help='すべての実行計画を表示する')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        database = os.path.join(work, 'database.db')
+        shutil.copy(args.database, database)
+        os.environ['DATABASE_PATH'] = database
+        os.environ.setdefault('METRICS_ENABLED', '0')
+        import app as app_module
+        from init_db import apply_db_profile, upgrade_database
+
+        con = sqlite3.connect(database)
+        apply_db_profile(con)
+        upgrade_database(con)
+        con.row_factory = sqlite3.Row
+        if args.exams:
+            populate(con, args.exams)
+            con.execute('ANALYZE')
+
+        ids = first_ids(con)
+        failures = 0
+        for template, indexes in FILTER_CASES:
+            case = {name: value.format(**ids) for name, value in template.items()}
+            label = '&'.join(f'{name}={value}' for name, value in case.items())
+            plans = collect_plans(app_module, con, case)
+            bad = [(sql, plan) for sql, plan in plans if full_scans(plan)]
+            if plans and not uses_index(plans[0][1], indexes) and plans[0] not in bad:
+                bad.insert(0, plans[0])
+            print(f"{'NG' if bad else 'OK'} {label} ({len(plans)} queries, expects {' or '.join(indexes)})")
+            for sql, plan in (plans if args.verbose else bad):
+                print('   ', ' '.join(sql.split())[:160])
+                for detail in plan:
+                    print('       ', detail)
+            failures += bool(bad)
+        con.close()
+
+    if failures:
+        print(f"{failures} case(s) fall back to full table scans or miss the expected index", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
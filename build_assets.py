@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+静的ファイル（CSS / JavaScript）のビルド
+
+static/src のファイルを束ね（BUNDLES）、コメントと余分な空白を除いて縮小し、
+内容ハッシュを含む名前（例: exam-detail.3f2a9c1b04de.js）で static/dist に書き出す。
+論理名と出力ファイルの対応は static/dist/manifest.json に記録し、テンプレートの
+asset_url はこれを参照する（内容が変わると URL も変わるので、1年間の immutable で配信できる）。
+
+Bootstrap と Font Awesome は --vendor で static/vendor に取得して自前で配信する。
+取得していなければサーバーの起動時（app.require_vendor_assets）にエラーになる
+（ASSET_CDN_FALLBACK=1 のときだけ CDN の URL を使う）。
+
+    python build_assets.py             # 束を作る
+    python build_assets.py --vendor    # ライブラリを取得してから束を作る
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import urllib.parse
+import urllib.request
+from typing import Final, Optional
+
+STATIC_FOLDER: Final[str] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+SOURCE_FOLDER_NAME: Final[str] = 'src'
+DIST_FOLDER_NAME: Final[str] = 'dist'
+VENDOR_FOLDER_NAME: Final[str] = 'vendor'
+MANIFEST_NAME: Final[str] = 'manifest.json'
+
+# 論理名 -> 束ねる static/src 以下のファイル（記載順に連結する）
+BUNDLES: Final[dict[str, list[str]]] = {
+    'base.css': ['css/base.css'],
+    'login.css': ['css/login.css'],
+    'login.js': ['js/login.js'],
+    'register.css': ['css/register.css'],
+    'register.js': ['js/register.js'],
+    'home.js': ['js/home.js'],
+    'exam-list.css': ['css/exam-list.css'],
+    'exam-list.js': ['js/exam-list.js'],
+    'exam-detail.css': ['css/exam-detail.css'],
+    'exam-detail.js': ['js/exam-detail.js'],
+    'exam-add.css': ['css/exam-add.css'],
+    'exam-add.js': ['js/exam-add.js'],
+    'exam-edit.css': ['css/exam-edit.css'],
+    'exam-edit.js': ['js/exam-edit.js'],
+}
+
+# 論理名 -> (static/vendor 以下の保存先, 取得元の URL)
+# 保存先にバージョンを含めるので、縮小済みの配布ファイルをそのまま immutable で配信する
+VENDOR_ASSETS: Final[dict[str, tuple[str, str]]] = {
+    'bootstrap.css': ('bootstrap-5.1.3/css/bootstrap.min.css',
+                      'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css'),
+    'bootstrap.js': ('bootstrap-5.1.3/js/bootstrap.bundle.min.js',
+                     'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js'),
+    'fontawesome.css': ('fontawesome-6.4.0/css/all.min.css',
+                        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css'),
+}
+
+# 出力ファイル名に含める内容ハッシュの長さ
+FINGERPRINT_LENGTH: Final[int] = 12
+
+
+# ===== 縮小 =====
+
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+def minify_css(source: str) -> str:
+    """CSS のコメントを除き、空白を詰める（文字列の中はそのまま）"""
+    parts = []
+    for chunk in re.split(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')''', source):
+        if chunk[:1] in ('"', "'"):
+            parts.append(chunk)
+            continue
+        chunk = re.sub(r'/\*.*?\*/', ' ', chunk, flags=re.S)
+        chunk = re.sub(r'\s+', ' ', chunk)
+        chunk = _CSS_PUNCTUATION.sub(r'\1', chunk)
+        # 「:」の前の空白はセレクタの区切り（a :hover）なので残し、後ろだけ詰める
+        chunk = re.sub(r':\s+', ':', chunk)
+        parts.append(chunk.replace(';}', '}'))
+    return ''.join(parts).strip() + '\n'
+
+# 直後の / を正規表現リテラルの始まりとみなす文字とキーワード
+_JS_REGEX_AFTER_CHARS: Final[str] = '(,=:[!&|?{};+-*%<>~^'
+_JS_REGEX_AFTER_WORDS: Final[frozenset[str]] = frozenset({
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw',
+    'case', 'do', 'else', 'yield', 'await'})
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c in '_$\\'
+
+def minify_js(source: str) -> str:
+    """JavaScript のコメントを除き、行頭・行末の空白と空行を詰める
+
+    改行は1つにまとめて残す（自動セミコロン挿入の結果を変えないため）。文字列・
+    テンプレートリテラル・正規表現リテラルの中はそのまま残す。
+    """
+    out: list[str] = []
+    last = ''     # 直前に出力した文字
+    word = ''     # 直前に出力したトークンが識別子・キーワードであればその内容
+    space = ''    # 出力を保留している空白（'' / ' ' / '\n'）
+    templates: list[int] = []  # 開いているテンプレートリテラルの ${ 内の { の深さ
+    i, n = 0, len(source)
+
+    def emit(token: str, is_word: bool = False) -> None:
+        nonlocal last, word, space
+        if space == '\n' and out:
+            out.append('\n')
+        elif space == ' ' and (_is_word_char(last) and _is_word_char(token[0])
+                               or last + token[0] in ('++', '--', '+-', '-+')):
+            out.append(' ')
+        space = ''
+        out.append(token)
+        last = token[-1]
+        word = token if is_word else ''
+
+    def template_end(j: int) -> int:
+        """テンプレートリテラルの文字部分を j から読み、` または ${ の直後の位置を返す"""
+        while j < n:
+            if source[j] == '\\':
+                j += 2
+            elif source[j] == '`':
+                return j + 1
+            elif source.startswith('${', j):
+                templates.append(0)
+                return j + 2
+            else:
+                j += 1
+        raise ValueError('テンプレートリテラルが閉じられていません')
+
+    while i < n:
+        c = source[i]
+        if c.isspace() or source.startswith('/*', i):
+            # 空白とブロックコメントは、改行を含めば改行1つ、含まなければ空白1つにする
+            j = i
+            while j < n:
+                if source[j].isspace():
+                    j += 1
+                elif source.startswith('/*', j):
+                    k = source.find('*/', j + 2)
+                    if k < 0:
+                        raise ValueError('コメントが閉じられていません')
+                    j = k + 2
+                else:
+                    break
+            if '\n' in source[i:j]:
+                space = '\n'
+            elif space != '\n':
+                space = ' '
+            i = j
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+        elif _is_word_char(c):
+            j = i
+            while j < n and _is_word_char(source[j]):
+                j += 1
+            emit(source[i:j], is_word=True)
+            i = j
+        elif c in ('"', "'"):
+            j = i + 1
+            while j < n and source[j] != c:
+                if source[j] == '\n':
+                    raise ValueError('文字列リテラルが閉じられていません')
+                j += 2 if source[j] == '\\' else 1
+            emit(source[i:j + 1])
+            i = j + 1
+        elif c == '`':
+            j = template_end(i + 1)
+            emit(source[i:j])
+            i = j
+        elif c == '}' and templates and templates[-1] == 0:
+            # ${ ... } の終わり: 続く文字部分までをそのまま出力する
+            templates.pop()
+            space = ''
+            j = template_end(i + 1)
+            emit(source[i:j])
+            i = j
+        elif c == '/' and (not last or last in _JS_REGEX_AFTER_CHARS or word in _JS_REGEX_AFTER_WORDS):
+            j = i + 1
+            in_class = False
+            while j < n and (in_class or source[j] != '/'):
+                if source[j] == '\n':
+                    raise ValueError('正規表現リテラルが閉じられていません')
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] == '[':
+                    in_class = True
+                elif source[j] == ']':
+                    in_class = False
+                j += 1
+            emit(source[i:j + 1])
+            i = j + 1
+        else:
+            if templates and c in '{}':
+                templates[-1] += 1 if c == '{' else -1
+            emit(c)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+# ===== ビルド =====
+
+def fingerprinted_name(name: str, content: bytes) -> str:
+    """論理名に内容ハッシュを加えた出力ファイル名"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH]}{ext}'
+
+def build_bundle(name: str, static_folder: str = STATIC_FOLDER) -> bytes:
+    """束ねて縮小した内容"""
+    texts = []
+    for source in BUNDLES[name]:
+        with open(os.path.join(static_folder, SOURCE_FOLDER_NAME, source), encoding='utf-8') as f:
+            texts.append(f.read())
+    if name.endswith('.css'):
+        return minify_css('\n'.join(texts)).encode('utf-8')
+    # 別々の <script> と同じように、前のファイルの最後の文が次のファイルに続かないよう区切る
+    return ';\n'.join(minify_js(text) for text in texts).encode('utf-8')
+
+def _write_file(path: str, content: bytes) -> None:
+    """一時ファイルに書いてから置き換える"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def build_assets(static_folder: str = STATIC_FOLDER) -> dict[str, str]:
+    """すべての束を static/dist に書き出して manifest.json を更新し、manifest の内容を返す
+
+    取得済みのライブラリ（static/vendor）も manifest に加える。以前のビルドで作った
+    ファイルのうち、新しい manifest にないものは削除する。
+    """
+    dist = os.path.join(static_folder, DIST_FOLDER_NAME)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for name in BUNDLES:
+        content = build_bundle(name, static_folder)
+        filename = fingerprinted_name(name, content)
+        path = os.path.join(dist, filename)
+        if not os.path.exists(path):
+            _write_file(path, content)
+        manifest[name] = f'{DIST_FOLDER_NAME}/{filename}'
+    for name, (path, _) in VENDOR_ASSETS.items():
+        if os.path.isfile(os.path.join(static_folder, VENDOR_FOLDER_NAME, path)):
+            manifest[name] = f'{VENDOR_FOLDER_NAME}/{path}'
+    _write_file(os.path.join(dist, MANIFEST_NAME),
+                json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode('utf-8'))
+
+    built = {os.path.basename(path) for path in manifest.values()}
+    for entry in os.scandir(dist):
+        if entry.name != MANIFEST_NAME and entry.name not in built:
+            os.remove(entry.path)
+    return manifest
+
+def load_manifest(static_folder: str = STATIC_FOLDER) -> dict[str, str]:
+    """manifest.json を読む（未ビルドなら空）"""
+    try:
+        with open(os.path.join(static_folder, DIST_FOLDER_NAME, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# ===== ライブラリの取得 =====
+
+_CSS_URL = re.compile(r'''url\(\s*['"]?([^'")]+?)['"]?\s*\)''')
+
+def _download(url: str) -> bytes:
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+def fetch_vendor(static_folder: str = STATIC_FOLDER) -> list[str]:
+    """VENDOR_ASSETS を static/vendor に取得し、保存したファイルのパスを返す
+
+    CSS から相対パスで参照されているファイル（Font Awesome の webfonts など）も
+    同じ相対位置に保存する。取得済みのファイルは取得し直さない。
+    """
+    saved = []
+    queue: list[tuple[str, str]] = [(path, url) for path, url in VENDOR_ASSETS.values()]
+    seen: set[str] = set()
+    while queue:
+        path, url = queue.pop(0)
+        if path in seen:
+            continue
+        seen.add(path)
+        target = os.path.join(static_folder, VENDOR_FOLDER_NAME, *path.split('/'))
+        if os.path.isfile(target):
+            with open(target, 'rb') as f:
+                content = f.read()
+        else:
+            content = _download(url)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write_file(target, content)
+            saved.append(target)
+        if path.endswith('.css'):
+            for ref in _CSS_URL.findall(content.decode('utf-8')):
+                ref = ref.split('#', 1)[0].split('?', 1)[0]
+                if not ref or ref.startswith(('data:', '/')) or '://' in ref:
+                    continue
+                ref_path = os.path.normpath(os.path.join(os.path.dirname(path), ref)).replace(os.sep, '/')
+                if ref_path.startswith('..'):
+                    continue
+                queue.append((ref_path, urllib.parse.urljoin(url, ref)))
+    return saved
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vendor', action='store_true', help='Bootstrap / Font Awesome を static/vendor に取得する')
+    parser.add_argument('--static-folder', default=STATIC_FOLDER)
+    args = parser.parse_args(argv)
+
+    if args.vendor:
+        for path in fetch_vendor(args.static_folder):
+            print(f"取得: {os.path.relpath(path, args.static_folder)}")
+    manifest = build_assets(args.static_folder)
+    for name, path in sorted(manifest.items()):
+        size = os.path.getsize(os.path.join(args.static_folder, path))
+        if name in BUNDLES:
+            source = sum(os.path.getsize(os.path.join(args.static_folder, SOURCE_FOLDER_NAME, s))
+                         for s in BUNDLES[name])
+            print(f"{name:<18} {path:<40} {source:>8} -> {size:>8} bytes")
+        else:
+            print(f"{name:<18} {path:<40} {size:>20} bytes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+レスポンスの圧縮
+
+app.wsgi_app を包む WSGI ミドルウェア。HTML・JSON・CSS・JavaScript などテキストの
+レスポンスを、Accept-Encoding に応じて brotli（brotli パッケージがある場合）または gzip で
+圧縮する。COMPRESS_MIN_SIZE 未満の小さいレスポンスと、Content-Length のない
+レスポンス（書き出しなどのストリーミング）はそのまま送る。
+
+圧縮したレスポンスの ETag は弱い ETag（W/"..."）にする。If-None-Match は弱い比較なので、
+圧縮の有無にかかわらず同じ ETag で 304 を返せる。
+"""
+
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Final, Optional
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    # brotli がない環境では gzip のみ使う
+    brotli = None
+
+# 圧縮の有無と、圧縮する最小のサイズ（バイト）
+COMPRESS_ENABLED: Final[bool] = os.environ.get('COMPRESS_ENABLED', '1') != '0'
+COMPRESS_MIN_SIZE: Final[int] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# 圧縮レベル（リクエストごとに圧縮するので速さを優先する）
+GZIP_LEVEL: Final[int] = 6
+BROTLI_QUALITY: Final[int] = 5
+
+# 圧縮するレスポンスの種類
+COMPRESSIBLE_TYPES: Final[frozenset[str]] = frozenset({
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson', 'image/svg+xml',
+})
+
+# 内容の変わらない（Cache-Control: immutable の）レスポンスの圧縮結果を保持する上限
+COMPRESSED_CACHE_MAX_BYTES: Final[int] = 8 * 1024 * 1024
+
+
+def available_encodings() -> tuple[str, ...]:
+    """使える圧縮方式（優先する順）"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding から圧縮方式を選ぶ（q 値の大きいもの、同じなら brotli を優先。なければ None）"""
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """body を encoding（'br' または 'gzip'）で圧縮"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime を固定して、同じ内容からは同じバイト列を作る
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """テキストのレスポンスを Accept-Encoding に応じて圧縮する WSGI ミドルウェア
+
+    ボディを読み切ってから圧縮するので、Content-Length のあるレスポンスだけを対象にする。
+    Content-Encoding が付いているもの、Cache-Control: no-transform のもの、X-Sendfile /
+    X-Accel-Redirect で送るもの、200 以外のステータス、HEAD リクエストは圧縮しない。
+    """
+
+    def __init__(self, app, min_size: int = COMPRESS_MIN_SIZE,
+                 cache_max_bytes: int = COMPRESSED_CACHE_MAX_BYTES) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.cache_max_bytes = cache_max_bytes
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str, str], bytes] = OrderedDict()
+        self._cache_size = 0
+
+    def __call__(self, environ: dict, start_response):
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured: list = []
+
+        def capture(status: str, headers: list, exc_info=None):
+            if exc_info is not None and captured:
+                raise exc_info[1].with_traceback(exc_info[2])
+            captured[:] = [status, headers]
+
+        app_iter = self.app(environ, capture)
+        status, headers = captured[0], Headers(captured[1])
+        if not self._compressible(status, headers):
+            start_response(status, headers.to_wsgi_list())
+            return app_iter
+
+        # 圧縮するかどうかで内容が変わるので、キャッシュには Accept-Encoding ごとに保持させる
+        vary = headers.get('Vary')
+        if not vary:
+            headers['Vary'] = 'Accept-Encoding'
+        elif 'accept-encoding' not in vary.lower():
+            headers['Vary'] = f'{vary}, Accept-Encoding'
+
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        length = headers.get('Content-Length', '')
+        if encoding is None or not length.isdigit() or int(length) < self.min_size:
+            start_response(status, headers.to_wsgi_list())
+            return app_iter
+
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        compressed = self._compress(environ, headers, body, encoding)
+        if len(compressed) >= len(body):
+            start_response(status, headers.to_wsgi_list())
+            return [body]
+
+        headers['Content-Encoding'] = encoding
+        headers['Content-Length'] = str(len(compressed))
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = f'W/{etag}'
+        start_response(status, headers.to_wsgi_list())
+        return [compressed]
+
+    def _compressible(self, status: str, headers: Headers) -> bool:
+        """圧縮の対象になる種類のレスポンスか（サイズは見ない）"""
+        if not status.startswith('200') or 'Content-Encoding' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        # 送信をフロントのサーバーに任せたレスポンスはボディが空
+        if 'X-Sendfile' in headers or 'X-Accel-Redirect' in headers:
+            return False
+        mimetype = headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+        return mimetype in COMPRESSIBLE_TYPES
+
+    def _compress(self, environ: dict, headers: Headers, body: bytes, encoding: str) -> bytes:
+        """圧縮する（ETag 付きの immutable なレスポンスは圧縮結果を保持して使い回す）"""
+        etag = headers.get('ETag')
+        if not etag or 'immutable' not in headers.get('Cache-Control', ''):
+            return compress(body, encoding)
+        key = (environ.get('PATH_INFO', ''), etag, encoding)
+        with self._lock:
+            compressed = self._cache.get(key)
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                return compressed
+        compressed = compress(body, encoding)
+        if len(compressed) <= self.cache_max_bytes:
+            with self._lock:
+                if key not in self._cache:
+                    self._cache[key] = compressed
+                    self._cache_size += len(compressed)
+                while self._cache_size > self.cache_max_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_size -= len(evicted)
+        return compressed
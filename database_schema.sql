@@ -14,6 +14,7 @@ CREATE TABLE IF NOT EXISTS Users (
     is_active INTEGER DEFAULT 1 CHECK (is_active IN (0, 1)),
     email_verified INTEGER DEFAULT 0 CHECK (email_verified IN (0, 1)),
     last_login_at DATETIME,
+    session_version INTEGER NOT NULL DEFAULT 1,  -- 上がると発行済みのセッションが無効になる
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -104,6 +105,7 @@ CREATE TABLE IF NOT EXISTS ExamQuestions (
     exam_id INTEGER NOT NULL,
     picture TEXT NOT NULL,
     question_order INTEGER DEFAULT 1,
+    original_filename TEXT,
     uploaded_by INTEGER,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (exam_id) REFERENCES Exams(exam_id) ON DELETE CASCADE,
@@ -141,27 +143,542 @@ CREATE INDEX IF NOT EXISTS idx_login_attempts_email ON LoginAttempts(email);
 CREATE INDEX IF NOT EXISTS idx_login_attempts_timestamp ON LoginAttempts(timestamp);
 CREATE INDEX IF NOT EXISTS idx_exams_year ON Exams(exam_year);
 CREATE INDEX IF NOT EXISTS idx_exams_subject ON Exams(subject_id);
-CREATE INDEX IF NOT EXISTS idx_subjects_department ON Subjects(department_id);
+CREATE INDEX IF NOT EXISTS idx_subjects_department ON Subjects(department_id, subject_id);
+CREATE INDEX IF NOT EXISTS idx_exam_professors_professor ON ExamProfessors(professor_id, exam_id);
+-- picture は内容ハッシュのファイル名（同じファイルを参照する行の数が参照カウント）
+CREATE INDEX IF NOT EXISTS idx_exam_questions_picture ON ExamQuestions(picture);
+CREATE INDEX IF NOT EXISTS idx_exam_questions_exam ON ExamQuestions(exam_id);
 
--- ビュー：試験詳細情報
+-- 科目・教員の一意インデックス（INSERT ... ON CONFLICT で取得または作成する）
+CREATE UNIQUE INDEX IF NOT EXISTS idx_subjects_identity
+    ON Subjects(department_id, subject_name, subject_type, semester, grade_level);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_professors_name ON Professors(professor_name);
+
+-- 試験一覧テーブル（非正規化した読み取り用テーブル、トリガーで差分更新）
+CREATE TABLE IF NOT EXISTS ExamListing (
+    exam_id INTEGER PRIMARY KEY,
+    faculty_id INTEGER NOT NULL,
+    department_id INTEGER NOT NULL,
+    subject_id INTEGER NOT NULL,
+    exam_type_id INTEGER NOT NULL,
+    faculty_name TEXT NOT NULL,
+    department_name TEXT NOT NULL,
+    subject_name TEXT NOT NULL,
+    exam_type_name TEXT NOT NULL,
+    exam_year INTEGER NOT NULL,
+    professors TEXT,
+    created_by INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_exam_listing_order
+    ON ExamListing(exam_year DESC, faculty_name, department_name, subject_name, exam_id);
+
+-- ID による絞り込み用（ID の範囲を一覧の表示順のまま読む）
+CREATE INDEX IF NOT EXISTS idx_exam_listing_faculty
+    ON ExamListing(faculty_id, exam_year DESC, faculty_name, department_name, subject_name, exam_id);
+CREATE INDEX IF NOT EXISTS idx_exam_listing_department
+    ON ExamListing(department_id, exam_year DESC, faculty_name, department_name, subject_name, exam_id);
+CREATE INDEX IF NOT EXISTS idx_exam_listing_subject
+    ON ExamListing(subject_id, exam_year DESC, faculty_name, department_name, subject_name, exam_id);
+CREATE INDEX IF NOT EXISTS idx_exam_listing_exam_type
+    ON ExamListing(exam_type_id, exam_year DESC, faculty_name, department_name, subject_name, exam_id);
+
+-- ExamListing の同期トリガー
+-- （INSERT OR REPLACE は外側の文の ON CONFLICT 指定で上書きされるため、削除してから挿入する）
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_exam_insert AFTER INSERT ON Exams
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id = NEW.exam_id;
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id = NEW.exam_id
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_exam_update AFTER UPDATE OF subject_id, exam_type_id, exam_year, created_by ON Exams
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id = NEW.exam_id;
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id = NEW.exam_id
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_exam_delete AFTER DELETE ON Exams
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id = OLD.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_professor_insert AFTER INSERT ON ExamProfessors
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id = NEW.exam_id;
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id = NEW.exam_id
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_professor_delete AFTER DELETE ON ExamProfessors
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id = OLD.exam_id;
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id = OLD.exam_id
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_professor_rename AFTER UPDATE OF professor_name ON Professors
+WHEN OLD.professor_name IS NOT NEW.professor_name
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id IN (SELECT exam_id FROM ExamProfessors WHERE professor_id = NEW.professor_id);
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id IN (SELECT exam_id FROM ExamProfessors WHERE professor_id = NEW.professor_id)
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_subject_update AFTER UPDATE OF subject_name, department_id ON Subjects
+WHEN OLD.subject_name IS NOT NEW.subject_name OR OLD.department_id IS NOT NEW.department_id
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id IN (SELECT exam_id FROM Exams WHERE subject_id = NEW.subject_id);
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id IN (SELECT exam_id FROM Exams WHERE subject_id = NEW.subject_id)
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_department_update AFTER UPDATE OF department_name, faculty_id ON Departments
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id IN (SELECT e.exam_id FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id
+                      WHERE s.department_id = NEW.department_id);
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id IN (SELECT e.exam_id FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id
+                      WHERE s.department_id = NEW.department_id)
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_faculty_update AFTER UPDATE OF faculty_name ON Faculties
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id IN (SELECT e.exam_id FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id
+                      JOIN Departments d ON s.department_id = d.department_id
+                      WHERE d.faculty_id = NEW.faculty_id);
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id IN (SELECT e.exam_id FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id
+                      JOIN Departments d ON s.department_id = d.department_id
+                      WHERE d.faculty_id = NEW.faculty_id)
+    GROUP BY e.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_listing_exam_type_update AFTER UPDATE OF exam_type_name ON ExamTypes
+BEGIN
+    DELETE FROM ExamListing WHERE exam_id IN (SELECT exam_id FROM Exams WHERE exam_type_id = NEW.exam_type_id);
+    INSERT INTO ExamListing
+    SELECT e.exam_id, d.faculty_id, s.department_id, e.subject_id, e.exam_type_id,
+           f.faculty_name, d.department_name, s.subject_name, et.exam_type_name, e.exam_year,
+           GROUP_CONCAT(p.professor_name, ', '), e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+    WHERE e.exam_id IN (SELECT exam_id FROM Exams WHERE exam_type_id = NEW.exam_type_id)
+    GROUP BY e.exam_id;
+END;
+
+-- ビュー：試験詳細情報（結合済みの ExamListing を参照）
 CREATE VIEW IF NOT EXISTS ExamDetailView AS
 SELECT 
-    e.exam_id,
-    f.faculty_name AS 学部名,
-    d.department_name AS 学科名,
-    s.subject_name AS 科目名,
-    et.exam_type_name AS 試験種別,
-    e.exam_year AS 年度,
+    l.exam_id,
+    l.faculty_name AS 学部名,
+    l.department_name AS 学科名,
+    l.subject_name AS 科目名,
+    l.exam_type_name AS 試験種別,
+    l.exam_year AS 年度,
     e.instructions AS 注意事項,
-    GROUP_CONCAT(p.professor_name, ', ') AS 担当者,
+    l.professors AS 担当者,
     e.created_at,
     e.updated_at
-FROM Exams e
-JOIN Subjects s ON e.subject_id = s.subject_id
-JOIN Departments d ON s.department_id = d.department_id
-JOIN Faculties f ON d.faculty_id = f.faculty_id
-JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
-LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
-LEFT JOIN Professors p ON ep.professor_id = p.professor_id
-GROUP BY e.exam_id, f.faculty_name, d.department_name, s.subject_name, 
-         et.exam_type_name, e.exam_year, e.instructions, e.created_at, e.updated_at;
\ No newline at end of file
+FROM ExamListing l
+JOIN Exams e ON l.exam_id = e.exam_id;
+
+-- 全文検索インデックス（FTS5・trigram、rowid は exam_id と一致）
+CREATE VIRTUAL TABLE IF NOT EXISTS ExamSearch USING fts5(
+    faculty_name,
+    department_name,
+    subject_name,
+    professors,
+    instructions,
+    tokenize = 'trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_search_listing_insert AFTER INSERT ON ExamListing
+BEGIN
+    DELETE FROM ExamSearch WHERE rowid = NEW.exam_id;
+    INSERT INTO ExamSearch (rowid, faculty_name, department_name, subject_name, professors, instructions)
+    SELECT NEW.exam_id, NEW.faculty_name, NEW.department_name, NEW.subject_name, NEW.professors,
+           (SELECT instructions FROM Exams WHERE exam_id = NEW.exam_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_search_listing_delete AFTER DELETE ON ExamListing
+BEGIN
+    DELETE FROM ExamSearch WHERE rowid = OLD.exam_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_search_instructions_update AFTER UPDATE OF instructions ON Exams
+BEGIN
+    UPDATE ExamSearch SET instructions = NEW.instructions WHERE rowid = NEW.exam_id;
+END;
+
+-- ホーム画面の統計カウンター（scope: total は各テーブルの件数、faculty は学部別・year は年度別の試験数）
+CREATE TABLE IF NOT EXISTS Statistics (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_exam_insert AFTER INSERT ON Exams
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'year', NEW.exam_year, 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', d.faculty_id, 1 FROM Subjects s JOIN Departments d ON s.department_id = d.department_id WHERE s.subject_id = NEW.subject_id
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_exam_delete AFTER DELETE ON Exams
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'exams', -1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'year', OLD.exam_year, -1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', d.faculty_id, -1 FROM Subjects s JOIN Departments d ON s.department_id = d.department_id WHERE s.subject_id = OLD.subject_id
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_exam_update AFTER UPDATE OF subject_id, exam_year ON Exams WHEN OLD.subject_id IS NOT NEW.subject_id OR OLD.exam_year IS NOT NEW.exam_year
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'year', OLD.exam_year, -1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'year', NEW.exam_year, 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', d.faculty_id, -1 FROM Subjects s JOIN Departments d ON s.department_id = d.department_id WHERE s.subject_id = OLD.subject_id
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', d.faculty_id, 1 FROM Subjects s JOIN Departments d ON s.department_id = d.department_id WHERE s.subject_id = NEW.subject_id
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_subject_insert AFTER INSERT ON Subjects
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'subjects', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_subject_delete AFTER DELETE ON Subjects
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'subjects', -1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_subject_move AFTER UPDATE OF department_id ON Subjects WHEN OLD.department_id IS NOT NEW.department_id
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', (SELECT faculty_id FROM Departments WHERE department_id = OLD.department_id), -(SELECT COUNT(*) FROM Exams WHERE subject_id = NEW.subject_id) WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', (SELECT faculty_id FROM Departments WHERE department_id = NEW.department_id), (SELECT COUNT(*) FROM Exams WHERE subject_id = NEW.subject_id) WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_department_move AFTER UPDATE OF faculty_id ON Departments WHEN OLD.faculty_id IS NOT NEW.faculty_id
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', OLD.faculty_id, -(SELECT COUNT(*) FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id WHERE s.department_id = NEW.department_id) WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'faculty', NEW.faculty_id, (SELECT COUNT(*) FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id WHERE s.department_id = NEW.department_id) WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_professor_insert AFTER INSERT ON Professors
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'professors', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_professor_delete AFTER DELETE ON Professors
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'professors', -1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_faculty_insert AFTER INSERT ON Faculties
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'faculties', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stats_faculty_delete AFTER DELETE ON Faculties
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'faculties', -1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+    DELETE FROM Statistics WHERE scope = 'faculty' AND key = OLD.faculty_id;
+END;
+
+-- 参照データ（学部・学科・試験種別・教員）の版。/api/reference の ETag と URL に使う
+INSERT OR IGNORE INTO Statistics (scope, key, value) VALUES ('version', 'reference', 1);
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_faculties_insert AFTER INSERT ON Faculties
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_faculties_update AFTER UPDATE ON Faculties
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_faculties_delete AFTER DELETE ON Faculties
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_departments_insert AFTER INSERT ON Departments
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_departments_update AFTER UPDATE ON Departments
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_departments_delete AFTER DELETE ON Departments
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_examtypes_insert AFTER INSERT ON ExamTypes
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_examtypes_update AFTER UPDATE ON ExamTypes
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_examtypes_delete AFTER DELETE ON ExamTypes
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_professors_insert AFTER INSERT ON Professors
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_professors_update AFTER UPDATE ON Professors
+WHEN OLD.professor_name IS NOT NEW.professor_name
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_reference_version_professors_delete AFTER DELETE ON Professors
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'reference', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+-- アップロードファイルの削除待ちキュー（参照がなくなったファイルをトリガーで登録し、コミット後に削除する）
+CREATE TABLE IF NOT EXISTS PendingFileDeletions (
+    filename TEXT PRIMARY KEY,
+    queued_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_pending_file_deletions_question_delete AFTER DELETE ON ExamQuestions
+WHEN OLD.picture IS NOT NULL AND NOT EXISTS (SELECT 1 FROM ExamQuestions WHERE picture = OLD.picture)
+BEGIN
+    INSERT INTO PendingFileDeletions (filename) VALUES (OLD.picture) ON CONFLICT DO NOTHING;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_pending_file_deletions_question_update AFTER UPDATE OF picture ON ExamQuestions
+WHEN OLD.picture IS NOT NEW.picture
+ AND OLD.picture IS NOT NULL AND NOT EXISTS (SELECT 1 FROM ExamQuestions WHERE picture = OLD.picture)
+BEGIN
+    INSERT INTO PendingFileDeletions (filename) VALUES (OLD.picture) ON CONFLICT DO NOTHING;
+END;
+
+-- 無効化・再有効化したユーザーの発行済みセッションを無効にする
+CREATE TRIGGER IF NOT EXISTS trg_users_session_version AFTER UPDATE OF is_active ON Users
+WHEN OLD.is_active IS NOT NEW.is_active
+BEGIN
+    UPDATE Users SET session_version = session_version + 1 WHERE user_id = NEW.user_id;
+END;
+
+-- 試験データの版。試験詳細・一覧ページのキャッシュのキーに使う
+INSERT OR IGNORE INTO Statistics (scope, key, value) VALUES ('version', 'exams', 1);
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_examlisting_insert AFTER INSERT ON ExamListing
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_examlisting_update AFTER UPDATE ON ExamListing
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_examlisting_delete AFTER DELETE ON ExamListing
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_examquestions_insert AFTER INSERT ON ExamQuestions
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_examquestions_update AFTER UPDATE ON ExamQuestions
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_examquestions_delete AFTER DELETE ON ExamQuestions
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_exam_version_exams_update AFTER UPDATE ON Exams
+BEGIN
+    INSERT INTO Statistics (scope, key, value)
+        SELECT 'version', 'exams', 1 WHERE true
+        ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;
+END;
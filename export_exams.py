@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+試験の一括書き出しスクリプト
+
+試験の一覧を CSV または JSON Lines で、問題ファイルを ZIP で書き出す。
+行はカーソルから1件ずつ読み、出力も少しずつ書き出すので、件数やファイルの
+大きさによらずメモリ使用量は一定。ZIP は manifest.csv と
+<試験ID>/<ファイル名> の問題ファイルを含み、そのまま import_exams.py に渡せる。
+app.py の /exams/export.<形式> と /exam/<試験ID>/export.zip も同じ処理を使う。
+
+    python export_exams.py --format zip -o exams.zip --year 2024
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import zipfile
+from typing import Iterable, Iterator, Optional
+
+from app import UPLOAD_CHUNK_SIZE, app, build_exam_filter
+from init_db import DATABASE, apply_db_profile, upgrade_database
+
+# 書き出す列（import_exams.py の manifest の列に試験 ID を加えたもの）
+EXPORT_COLUMNS: tuple[str, ...] = (
+    'exam_id', 'faculty_name', 'department_name', 'subject_name', 'subject_type', 'semester', 'grade_level',
+    'professor_name', 'exam_type_name', 'exam_year', 'instructions', 'files',
+)
+
+# CSV / JSON Lines をまとめて送る大きさ
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# 形式ごとの MIME タイプ（text/* の charset は Werkzeug が付ける）
+EXPORT_MIMETYPES: dict[str, str] = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'zip': 'application/zip',
+}
+
+
+def iter_export_rows(cur: sqlite3.Cursor, where: str = '1=1', params: Iterable = (),
+                     match: str = '') -> Iterator[dict]:
+    """絞り込み条件（build_exam_filter の WHERE 句と MATCH 式）に合う試験を試験 ID 順に1件ずつ返す"""
+    params = list(params)
+    if match:
+        where += ' AND exam_id IN (SELECT rowid FROM ExamSearch WHERE ExamSearch MATCH ?)'
+        params.append(match)
+    rows = cur.execute(f'''
+        SELECT
+            l.exam_id, l.faculty_name, l.department_name, l.subject_name,
+            s.subject_type, s.semester, s.grade_level,
+            (SELECT json_group_array(p.professor_name)
+             FROM (SELECT p.professor_name FROM ExamProfessors ep
+                   JOIN Professors p ON p.professor_id = ep.professor_id
+                   WHERE ep.exam_id = l.exam_id
+                   ORDER BY ep.rowid) p) AS professor_name,
+            l.exam_type_name, l.exam_year, e.instructions,
+            (SELECT json_group_array(json_array(q.question_id, q.picture, q.original_filename))
+             FROM (SELECT question_id, picture, original_filename FROM ExamQuestions
+                   WHERE exam_id = l.exam_id AND picture IS NOT NULL
+                   ORDER BY question_id) q) AS questions
+        FROM (SELECT * FROM ExamListing WHERE {where}) l
+        JOIN Exams e ON e.exam_id = l.exam_id
+        JOIN Subjects s ON s.subject_id = l.subject_id
+        ORDER BY l.exam_id
+    ''', params)
+    for row in rows:
+        exam = dict(row)
+        exam['professor_name'] = json.loads(exam['professor_name'])
+        exam['questions'] = question_entries(exam['exam_id'], json.loads(exam['questions']))
+        exam['files'] = [entry for entry, _ in exam['questions']]
+        yield exam
+
+
+def question_entries(exam_id: int, questions: list) -> list[tuple[str, str]]:
+    """問題ファイルの ZIP 内のパスと保存名の組を返す（元のファイル名が重複したら問題 ID を付ける）"""
+    entries = []
+    used = set()
+    for question_id, picture, original_filename in questions:
+        name = (original_filename or picture).replace('/', '_').replace('\\', '_')
+        if name in used:
+            name = f'{question_id}_{name}'
+        used.add(name)
+        entries.append((f'{exam_id}/{name}', picture))
+    return entries
+
+
+def iter_csv(exams: Iterable[dict]) -> Iterator[bytes]:
+    """試験を CSV（BOM 付き UTF-8、professor_name と files は ; 区切り）にして少しずつ返す"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_COLUMNS)
+    for exam in exams:
+        writer.writerow([';'.join(exam[column]) if column in ('professor_name', 'files') else exam[column]
+                         for column in EXPORT_COLUMNS])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_jsonl(exams: Iterable[dict], columns: Iterable[str] = EXPORT_COLUMNS) -> Iterator[bytes]:
+    """試験（columns の列）を JSON Lines にして少しずつ返す"""
+    columns = tuple(columns)
+    lines = []
+    size = 0
+    for exam in exams:
+        line = json.dumps({column: exam[column] for column in columns}, ensure_ascii=False) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield ''.join(lines).encode('utf-8')
+            lines.clear()
+            size = 0
+    if lines:
+        yield ''.join(lines).encode('utf-8')
+
+
+class _ZipStream(io.RawIOBase):
+    """ZipFile の書き込み先（シークできないので zipfile はデータディスクリプタ付きで書く）"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> Iterator[bytes]:
+        """書き込まれた分があれば取り出す（空のチャンクはレスポンスの終わりと誤解されうるので返さない）"""
+        if self.chunks:
+            data = b''.join(self.chunks)
+            self.chunks.clear()
+            yield data
+
+
+def iter_zip(make_exams, upload_folder: Optional[str] = None) -> Iterator[bytes]:
+    """manifest.csv と問題ファイルを含む ZIP を少しずつ返す
+
+    make_exams は試験のイテレータを返す関数で、manifest と問題ファイルのために2回呼ぶ。
+    画像・PDF は既に圧縮されているので無圧縮（ZIP_STORED）で格納する。
+    """
+    upload_folder = upload_folder or app.config['UPLOAD_FOLDER']
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+        info = zipfile.ZipInfo('manifest.csv', time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with archive.open(info, 'w') as manifest:
+            for chunk in iter_csv(make_exams()):
+                manifest.write(chunk)
+                yield from stream.drain()
+
+        for exam in make_exams():
+            for entry, picture in exam['questions']:
+                path = os.path.join(upload_folder, picture)
+                try:
+                    source = open(path, 'rb')
+                except OSError:
+                    # ファイルが削除済みの問題は飛ばす
+                    continue
+                with source:
+                    stat = os.fstat(source.fileno())
+                    # ZIP に記録できるのは1980年以降の日時
+                    info = zipfile.ZipInfo(entry, max(time.localtime(stat.st_mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+                    info.file_size = stat.st_size
+                    with archive.open(info, 'w') as target:
+                        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''):
+                            target.write(chunk)
+                            yield from stream.drain()
+                yield from stream.drain()
+    yield from stream.drain()
+
+
+def iter_export(cur: sqlite3.Cursor, export_format: str, where: str = '1=1', params: Iterable = (),
+                match: str = '', upload_folder: Optional[str] = None) -> Iterator[bytes]:
+    """指定した形式（csv / jsonl / zip）で試験を書き出す"""
+    params = list(params)
+    if export_format == 'csv':
+        return iter_csv(iter_export_rows(cur, where, params, match))
+    if export_format == 'jsonl':
+        return iter_jsonl(iter_export_rows(cur, where, params, match))
+    if export_format == 'zip':
+        return iter_zip(lambda: iter_export_rows(cur.connection.cursor(), where, params, match), upload_folder)
+    raise ValueError(f'未対応の形式です: {export_format}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=sorted(EXPORT_MIMETYPES), default='csv')
+    parser.add_argument('-o', '--output', help='出力先（省略時は標準出力）')
+    parser.add_argument('--faculty', default='', help='学部名で絞り込む')
+    parser.add_argument('--department', default='', help='学科名で絞り込む')
+    parser.add_argument('--subject', default='', help='科目名で絞り込む')
+    parser.add_argument('--year', default='', help='年度で絞り込む')
+    parser.add_argument('-q', '--keyword', default='', help='キーワードで絞り込む')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(DATABASE)
+    apply_db_profile(con)
+    upgrade_database(con)
+    con.row_factory = sqlite3.Row
+
+    _, where, params, match, _ = build_exam_filter({
+        'faculty_filter': args.faculty, 'department_filter': args.department,
+        'subject_filter': args.subject, 'year_filter': args.year, 'q': args.keyword,
+    })
+    start = time.perf_counter()
+    size = 0
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(con.cursor(), args.format, where, params, match):
+            out.write(chunk)
+            size += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    con.close()
+    print(f"{size} bytes, {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
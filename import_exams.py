@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+試験の一括登録スクリプト
+
+manifest（CSV または JSON）に書かれた試験をまとめて登録し、問題ファイルを
+アーカイブ（ZIP）またはディレクトリから読み込んで保存する。
+
+manifest の列（JSON の場合は各オブジェクトのキー）:
+    faculty_name, department_name, subject_name, subject_type, semester, grade_level,
+    professor_name, exam_type_name, exam_year, instructions, files
+professor_name は担当教員の名前、files はアーカイブ内のパスで、どちらも複数あれば ; で
+区切る（JSON では配列でもよい）。どちらも空でもよい（担当教員・問題ファイルのない試験）。export_exams.py の書き出しもこの形式になっている。
+学部・学科・試験種別は名前で指定し、科目と教員はなければ作成する。
+同じ科目・試験種別・年度の試験が既にある行は登録しない。
+
+    python import_exams.py manifest.csv --archive scans.zip --email user1@keio.jp
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional, Union
+
+from werkzeug.security import safe_join
+
+from app import (MAX_UPLOAD_SIZE, Image, allowed_file, build_derivative, commit_upload, discard_staged_upload,
+                 matches_signature, parse_exam_form, stage_upload)
+from init_db import DATABASE, apply_db_profile, upgrade_database
+
+# 1つのトランザクションで登録する試験の数
+DEFAULT_BATCH_SIZE = 200
+
+# 問題ファイルを並列に処理するスレッド数
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class ScanArchive:
+    """問題ファイルの読み込み元（ZIP ファイル・ディレクトリ、または ZIP のファイルオブジェクト）"""
+
+    def __init__(self, source: Union[str, BinaryIO, None]) -> None:
+        self.directory = source if isinstance(source, str) and os.path.isdir(source) else None
+        self.zip = zipfile.ZipFile(source) if source is not None and self.directory is None else None
+
+    def open(self, name: str) -> BinaryIO:
+        """アーカイブ内のファイルを開く"""
+        if self.zip is not None:
+            return self.zip.open(name)
+        path = safe_join(self.directory, name) if self.directory else None
+        if path is None:
+            raise FileNotFoundError(name)
+        return open(path, 'rb')
+
+    def size(self, name: str) -> int:
+        """アーカイブ内のファイルの大きさ（展開後のバイト数）"""
+        if self.zip is not None:
+            return self.zip.getinfo(name).file_size
+        path = safe_join(self.directory, name) if self.directory else None
+        if path is None:
+            raise FileNotFoundError(name)
+        return os.path.getsize(path)
+
+    def close(self) -> None:
+        if self.zip is not None:
+            self.zip.close()
+
+    def __enter__(self) -> 'ScanArchive':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def read_manifest(stream: BinaryIO, filename: str) -> list[dict]:
+    """manifest を読み込む（拡張子が .json なら JSON、それ以外は CSV として扱う）"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if filename.lower().endswith('.json'):
+        rows = json.load(text)
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('JSON の manifest は試験のオブジェクトの配列にしてください')
+        return rows
+    return list(csv.DictReader(text))
+
+
+def resolve_row(row: dict, faculties: dict, departments: dict,
+                exam_types: dict) -> tuple[Optional[dict], Optional[str]]:
+    """manifest の1行を名前から ID に解決して検証し、(値, エラーメッセージ) を返す"""
+    def text(key: str) -> str:
+        value = row.get(key)
+        return '' if value is None else str(value).strip()
+
+    faculty_id = faculties.get(text('faculty_name'))
+    if faculty_id is None:
+        return None, f"学部「{text('faculty_name')}」が見つかりません"
+    department_id = departments.get((faculty_id, text('department_name')))
+    if department_id is None:
+        return None, f"学科「{text('department_name')}」が見つかりません"
+    exam_type_id = exam_types.get(text('exam_type_name'))
+    if exam_type_id is None:
+        return None, f"試験種別「{text('exam_type_name')}」が見つかりません"
+    professor_names = split_list(row.get('professor_name'))
+
+    values, error = parse_exam_form({
+        'faculty_id': str(faculty_id),
+        'department_id': str(department_id),
+        'subject_name': text('subject_name'),
+        'subject_type': text('subject_type'),
+        'semester': text('semester'),
+        'grade_level': text('grade_level'),
+        # 教員名は1つずつ登録するが、制御文字の検証はまとめて行う
+        'professor_name': ';'.join(professor_names),
+        'exam_type_id': str(exam_type_id),
+        'exam_year': text('exam_year'),
+        'instructions': text('instructions'),
+    }, require_professor=False)
+    if error:
+        return None, error
+    values['professor_names'] = professor_names
+    values['files'] = split_list(row.get('files'))
+    return values, None
+
+
+def split_list(value) -> list[str]:
+    """; 区切りの文字列（JSON では配列でもよい）を重複のない値のリストにする"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    elif not isinstance(value, list):
+        value = [value]
+    return list(dict.fromkeys(str(item).strip() for item in value if str(item).strip()))
+
+
+def stage_file(archive: ScanArchive, name: str) -> tuple[str, str]:
+    """アーカイブ内のファイルを検証して一時ファイルに書き出し、(一時ファイルのパス, 保存名) を返す"""
+    if not allowed_file(name):
+        raise ValueError('許可されていない形式です')
+    if archive.size(name) > MAX_UPLOAD_SIZE:
+        raise ValueError(f'ファイルサイズが大きすぎます（最大{MAX_UPLOAD_SIZE // (1024 * 1024)}MB）')
+    with archive.open(name) as f:
+        if not matches_signature(name, f.peek(16)[:16]):
+            raise ValueError('内容が拡張子と一致しません')
+        return stage_upload(f, os.path.basename(name))
+
+
+def _select_json_keys(cur: sqlite3.Cursor, sql: str, keys: list) -> list[sqlite3.Row]:
+    """キーの一覧を JSON 配列として1つのパラメータで渡して SELECT する"""
+    return cur.execute(sql, (json.dumps(keys, ensure_ascii=False),)).fetchall()
+
+
+def _insert_batch(cur: sqlite3.Cursor, batch: list[tuple[int, dict]], staged: dict,
+                  user_id: Optional[int], result: dict) -> list[str]:
+    """1バッチ分の試験を登録し、保存した問題ファイル名のリストを返す（トランザクション内で呼ぶ）"""
+    # 科目と教員をまとめて作成してから ID をまとめて引く
+    subject_keys = list({(v['department_id'], v['subject_name'], v['subject_type'], v['semester'],
+                          v['grade_level']) for _, v in batch})
+    cur.executemany('''
+        INSERT INTO Subjects (department_id, subject_name, subject_type, semester, grade_level)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', subject_keys)
+    subject_ids = {tuple(row[1:]): row[0] for row in _select_json_keys(cur, '''
+        SELECT s.subject_id, s.department_id, s.subject_name, s.subject_type, s.semester, s.grade_level
+        FROM json_each(?) j
+        JOIN Subjects s
+          ON s.department_id = json_extract(j.value, '$[0]') AND s.subject_name = json_extract(j.value, '$[1]')
+         AND s.subject_type = json_extract(j.value, '$[2]') AND s.semester = json_extract(j.value, '$[3]')
+         AND s.grade_level = json_extract(j.value, '$[4]')
+    ''', subject_keys)}
+
+    professor_names = list({name for _, v in batch for name in v['professor_names']})
+    cur.executemany('INSERT INTO Professors (professor_name) VALUES (?) ON CONFLICT DO NOTHING',
+                    [(name,) for name in professor_names])
+    professor_ids = {row[1]: row[0] for row in _select_json_keys(cur, '''
+        SELECT professor_id, professor_name FROM Professors
+        WHERE professor_name IN (SELECT value FROM json_each(?))
+    ''', professor_names)}
+
+    # 既にある試験と、manifest 内で重複した試験は登録しない
+    exam_sql = '''
+        SELECT e.exam_id, e.subject_id, e.exam_type_id, e.exam_year
+        FROM json_each(?) j
+        JOIN Exams e
+          ON e.subject_id = json_extract(j.value, '$[0]') AND e.exam_type_id = json_extract(j.value, '$[1]')
+         AND e.exam_year = json_extract(j.value, '$[2]')
+    '''
+    candidates = {}
+    for number, v in batch:
+        v['subject_id'] = subject_ids[(v['department_id'], v['subject_name'], v['subject_type'],
+                                       v['semester'], v['grade_level'])]
+        v['professor_ids'] = [professor_ids[name] for name in v['professor_names']]
+        key = (v['subject_id'], v['exam_type_id'], v['exam_year'])
+        if key in candidates:
+            result['errors'].append((number, '同じ科目・試験種別・年度の試験が manifest 内で重複しています'))
+            result['skipped'] += 1
+        else:
+            candidates[key] = (number, v)
+    for row in _select_json_keys(cur, exam_sql, list(candidates)):
+        number, _ = candidates.pop(tuple(row[1:]))
+        result['errors'].append((number, '同じ科目・試験種別・年度の試験が既に存在します'))
+        result['skipped'] += 1
+
+    cur.executemany('''
+        INSERT INTO Exams (subject_id, exam_type_id, exam_year, instructions, created_by)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(v['subject_id'], v['exam_type_id'], v['exam_year'], v['instructions'], user_id)
+          for _, v in candidates.values()])
+    exam_ids = {tuple(row[1:]): row[0] for row in _select_json_keys(cur, exam_sql, list(candidates))}
+
+    questions = []
+    stored = []
+    for key, (number, v) in candidates.items():
+        exam_id = exam_ids[key]
+        for name in v['files']:
+            temp_path, filename = staged.pop((number, name))
+            commit_upload(temp_path, filename)
+            questions.append((exam_id, filename, os.path.basename(name)))
+            stored.append(filename)
+    cur.executemany('INSERT INTO ExamProfessors (exam_id, professor_id) VALUES (?, ?) ON CONFLICT DO NOTHING',
+                    [(exam_ids[key], professor_id) for key, (_, v) in candidates.items()
+                     for professor_id in v['professor_ids']])
+    cur.executemany('''
+        INSERT INTO SubjectProfessors (subject_id, professor_id, assignment_year, assignment_semester)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', {(v['subject_id'], professor_id, v['exam_year'], v['semester'])
+          for _, v in candidates.values() for professor_id in v['professor_ids']})
+    cur.executemany('INSERT INTO ExamQuestions (exam_id, picture, original_filename) VALUES (?, ?, ?)',
+                    questions)
+    result['inserted'] += len(candidates)
+    result['files'] += len(questions)
+    return stored
+
+
+def import_exams(con: sqlite3.Connection, rows: list[dict], archive: ScanArchive,
+                 user_id: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 workers: int = DEFAULT_WORKERS, thumbnails: bool = True) -> dict:
+    """manifest の行を batch_size 件ずつのトランザクションで登録し、結果を返す
+
+    問題ファイルの読み込み・検証・ハッシュ計算はスレッドプールで並列に行い、
+    書き込みロックを取るのは一時ファイルの移動と INSERT の間だけにする。
+    thumbnails が True なら登録した画像のサムネイルも並列に作成しておく。
+    """
+    cur = con.cursor()
+    faculties = {row[1]: row[0] for row in cur.execute('SELECT faculty_id, faculty_name FROM Faculties')}
+    departments = {(row[1], row[2]): row[0] for row in cur.execute(
+        'SELECT department_id, faculty_id, department_name FROM Departments')}
+    exam_types = {row[1]: row[0] for row in cur.execute('SELECT exam_type_id, exam_type_name FROM ExamTypes')}
+
+    result = {'rows': len(rows), 'inserted': 0, 'skipped': 0, 'files': 0, 'errors': []}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for offset in range(0, len(rows), batch_size):
+            batch = []
+            for number, row in enumerate(rows[offset:offset + batch_size], start=offset + 1):
+                values, error = resolve_row(row, faculties, departments, exam_types)
+                if error:
+                    result['errors'].append((number, error))
+                    result['skipped'] += 1
+                else:
+                    batch.append((number, values))
+
+            # 問題ファイルを並列に一時ファイルへ書き出す（失敗したファイルは登録しない）
+            futures = {(number, name): pool.submit(stage_file, archive, name)
+                       for number, values in batch for name in values['files']}
+            staged = {}
+            for (number, name), future in futures.items():
+                try:
+                    staged[(number, name)] = future.result()
+                except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                    result['errors'].append((number, f"ファイル '{name}' を読み込めません: {e}"))
+            for number, values in batch:
+                values['files'] = [name for name in values['files'] if (number, name) in staged]
+
+            stored = []
+            try:
+                if batch:
+                    con.execute('BEGIN IMMEDIATE')
+                    stored = _insert_batch(cur, batch, staged, user_id, result)
+                    con.commit()
+            except BaseException:
+                if con.in_transaction:
+                    con.rollback()
+                raise
+            finally:
+                # 登録しなかった行の一時ファイルを削除
+                for temp_path, _ in staged.values():
+                    discard_staged_upload(temp_path)
+
+            if thumbnails and Image is not None:
+                images = [name for name in dict.fromkeys(stored) if not name.endswith('.pdf')]
+                list(pool.map(lambda name: build_derivative(name, 'thumb'), images))
+
+    result['seconds'] = time.perf_counter() - start
+    result['errors'].sort(key=lambda error: error[0])
+    result['errors'] = [f'{number}件目: {message}' for number, message in result['errors']]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('manifest', help='manifest ファイル（.csv または .json）')
+    parser.add_argument('--archive', help='問題ファイルの ZIP またはディレクトリ')
+    parser.add_argument('--email', help='作成者として記録するユーザーのメールアドレス')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--no-thumbnails', action='store_true', help='サムネイルを作成しない')
+    args = parser.parse_args()
+
+    con = sqlite3.connect(DATABASE)
+    apply_db_profile(con)
+    upgrade_database(con)
+    con.row_factory = sqlite3.Row
+
+    user_id = None
+    if args.email:
+        user = con.execute('SELECT user_id FROM Users WHERE email = ?', (args.email,)).fetchone()
+        if user is None:
+            sys.exit(f'ユーザー {args.email} が見つかりません')
+        user_id = user['user_id']
+
+    with open(args.manifest, 'rb') as f:
+        rows = read_manifest(f, args.manifest)
+    with ScanArchive(args.archive) as archive:
+        result = import_exams(con, rows, archive, user_id, args.batch_size, args.workers,
+                              thumbnails=not args.no_thumbnails)
+    con.close()
+
+    for error in result['errors']:
+        print(error, file=sys.stderr)
+    seconds = max(result['seconds'], 1e-9)
+    print(f"rows={result['rows']} inserted={result['inserted']} skipped={result['skipped']} "
+          f"files={result['files']} seconds={result['seconds']:.2f} "
+          f"rows/s={result['inserted'] / seconds:.1f} files/s={result['files'] / seconds:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,8 @@ import os
 os.environ['SCRIPT_NAME'] = \
     os.environ['SCRIPT_NAME'].removesuffix('/index.cgi')
 
-from app import app
+from app import app, require_vendor_assets
+
+require_vendor_assets()
 
 CGIHandler().run(app)
\ No newline at end of file
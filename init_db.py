@@ -4,16 +4,512 @@
 試験問題管理システム用
 """
 
+import os
 import sqlite3
 
+from passwords import hash_password
+
+# データベースのファイル名（app.py と同じ環境変数を参照）
+DATABASE = os.environ.get('DATABASE_PATH', 'database.db')
+
+# 同時アクセス向けの SQLite チューニングプロファイル
+# journal_mode はデータベースファイルに保存され、それ以外は接続ごとの設定
+# （WAL はネットワークファイルシステム上では使えないため、その場合は
+#   SQLITE_JOURNAL_MODE=DELETE を指定する）
+DB_PROFILE: dict[str, object] = {
+    'busy_timeout': 5000,               # ロック待ちの上限（ミリ秒）
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': 'NORMAL',            # WAL ではコミットごとの fsync を省略しても安全
+    'cache_size': -16000,               # ページキャッシュ（負の値は KiB 指定、約16MB）
+    'mmap_size': 64 * 1024 * 1024,      # 読み込みにメモリマップを使う（64MB）
+    'foreign_keys': 'ON',
+}
+
+def apply_db_profile(conn: sqlite3.Connection, profile: dict[str, object] = DB_PROFILE) -> None:
+    """接続にチューニングプロファイルを適用"""
+    for name, value in profile.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+# 試験一覧の1行分を組み立てる SELECT（ExamListing の列順と一致させる）
+EXAM_LISTING_SELECT = '''
+    SELECT
+        e.exam_id,
+        d.faculty_id,
+        s.department_id,
+        e.subject_id,
+        e.exam_type_id,
+        f.faculty_name,
+        d.department_name,
+        s.subject_name,
+        et.exam_type_name,
+        e.exam_year,
+        GROUP_CONCAT(p.professor_name, ', ') AS professors,
+        e.created_by
+    FROM Exams e
+    JOIN Subjects s ON e.subject_id = s.subject_id
+    JOIN Departments d ON s.department_id = d.department_id
+    JOIN Faculties f ON d.faculty_id = f.faculty_id
+    JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
+    LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
+    LEFT JOIN Professors p ON ep.professor_id = p.professor_id
+'''
+
+def _refresh_listing_sql(match: str) -> str:
+    """exam_id が match に一致する試験の ExamListing 行を作り直す SQL
+
+    INSERT OR REPLACE は外側の文の ON CONFLICT 指定（INSERT OR IGNORE など）で
+    上書きされてしまうため、削除してから挿入し直す。
+    """
+    return (f'DELETE FROM ExamListing WHERE exam_id {match}; '
+            f'INSERT INTO ExamListing {EXAM_LISTING_SELECT} WHERE e.exam_id {match} GROUP BY e.exam_id;')
+
+def _migrate_exam_listing(cursor: sqlite3.Cursor) -> None:
+    """試験一覧用の非正規化テーブル ExamListing を作成し、トリガーで差分更新する"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExamListing (
+            exam_id INTEGER PRIMARY KEY,
+            faculty_id INTEGER NOT NULL,
+            department_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            exam_type_id INTEGER NOT NULL,
+            faculty_name TEXT NOT NULL,
+            department_name TEXT NOT NULL,
+            subject_name TEXT NOT NULL,
+            exam_type_name TEXT NOT NULL,
+            exam_year INTEGER NOT NULL,
+            professors TEXT,
+            created_by INTEGER
+        )
+    ''')
+    # 一覧の表示順そのままのインデックス（一覧はこのインデックスを順に読むだけになる）
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_exam_listing_order
+        ON ExamListing(exam_year DESC, faculty_name, department_name, subject_name, exam_id)
+    ''')
+
+    triggers = {
+        'trg_exam_listing_exam_insert': ('AFTER INSERT ON Exams',
+                                         _refresh_listing_sql('= NEW.exam_id')),
+        'trg_exam_listing_exam_update': ('AFTER UPDATE OF subject_id, exam_type_id, exam_year, created_by ON Exams',
+                                         _refresh_listing_sql('= NEW.exam_id')),
+        'trg_exam_listing_exam_delete': ('AFTER DELETE ON Exams',
+                                         'DELETE FROM ExamListing WHERE exam_id = OLD.exam_id;'),
+        'trg_exam_listing_professor_insert': ('AFTER INSERT ON ExamProfessors',
+                                              _refresh_listing_sql('= NEW.exam_id')),
+        'trg_exam_listing_professor_delete': ('AFTER DELETE ON ExamProfessors',
+                                              _refresh_listing_sql('= OLD.exam_id')),
+        'trg_exam_listing_professor_rename': ('AFTER UPDATE OF professor_name ON Professors',
+                                              _refresh_listing_sql('IN (SELECT exam_id FROM ExamProfessors '
+                                                                   'WHERE professor_id = NEW.professor_id)')),
+        'trg_exam_listing_subject_update': ('AFTER UPDATE OF subject_name, department_id ON Subjects',
+                                            _refresh_listing_sql('IN (SELECT exam_id FROM Exams WHERE subject_id = NEW.subject_id)')),
+        'trg_exam_listing_department_update': ('AFTER UPDATE OF department_name, faculty_id ON Departments',
+                                               _refresh_listing_sql('IN (SELECT e.exam_id FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id '
+                                                                   'WHERE s.department_id = NEW.department_id)')),
+        'trg_exam_listing_faculty_update': ('AFTER UPDATE OF faculty_name ON Faculties',
+                                            _refresh_listing_sql('IN (SELECT e.exam_id FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id '
+                                                                 'JOIN Departments d ON s.department_id = d.department_id '
+                                                                 'WHERE d.faculty_id = NEW.faculty_id)')),
+        'trg_exam_listing_exam_type_update': ('AFTER UPDATE OF exam_type_name ON ExamTypes',
+                                              _refresh_listing_sql('IN (SELECT exam_id FROM Exams WHERE exam_type_id = NEW.exam_type_id)')),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+    # 既存データを取り込む
+    cursor.execute(f'INSERT OR REPLACE INTO ExamListing {EXAM_LISTING_SELECT} GROUP BY e.exam_id')
+
+    # 試験詳細ビューも同じ結合を繰り返さないよう ExamListing を参照する
+    cursor.execute('DROP VIEW IF EXISTS ExamDetailView')
+    cursor.execute('''
+        CREATE VIEW ExamDetailView AS
+        SELECT
+            l.exam_id,
+            l.faculty_name AS 学部名,
+            l.department_name AS 学科名,
+            l.subject_name AS 科目名,
+            l.exam_type_name AS 試験種別,
+            l.exam_year AS 年度,
+            e.instructions AS 注意事項,
+            l.professors AS 担当者
+        FROM ExamListing l
+        JOIN Exams e ON l.exam_id = e.exam_id
+    ''')
+
+def _migrate_exam_search(cursor: sqlite3.Cursor) -> None:
+    """試験の全文検索インデックス ExamSearch（FTS5・trigram）を作成する
+
+    trigram トークナイザは分かち書きを必要としないため日本語の部分一致検索に使える。
+    rowid を exam_id と一致させ、ExamListing と Exams.instructions の変更に追従する。
+    """
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS ExamSearch USING fts5(
+            faculty_name,
+            department_name,
+            subject_name,
+            professors,
+            instructions,
+            tokenize = 'trigram'
+        )
+    ''')
+
+    triggers = {
+        'trg_exam_search_listing_insert': ('AFTER INSERT ON ExamListing', '''
+            DELETE FROM ExamSearch WHERE rowid = NEW.exam_id;
+            INSERT INTO ExamSearch (rowid, faculty_name, department_name, subject_name, professors, instructions)
+            SELECT NEW.exam_id, NEW.faculty_name, NEW.department_name, NEW.subject_name, NEW.professors,
+                   (SELECT instructions FROM Exams WHERE exam_id = NEW.exam_id);
+        '''),
+        'trg_exam_search_listing_delete': ('AFTER DELETE ON ExamListing', '''
+            DELETE FROM ExamSearch WHERE rowid = OLD.exam_id;
+        '''),
+        'trg_exam_search_instructions_update': ('AFTER UPDATE OF instructions ON Exams', '''
+            UPDATE ExamSearch SET instructions = NEW.instructions WHERE rowid = NEW.exam_id;
+        '''),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+    # 既存データを取り込む
+    cursor.execute('DELETE FROM ExamSearch')
+    cursor.execute('''
+        INSERT INTO ExamSearch (rowid, faculty_name, department_name, subject_name, professors, instructions)
+        SELECT l.exam_id, l.faculty_name, l.department_name, l.subject_name, l.professors, e.instructions
+        FROM ExamListing l
+        JOIN Exams e ON l.exam_id = e.exam_id
+    ''')
+
+def _migrate_upload_references(cursor: sqlite3.Cursor) -> None:
+    """内容ハッシュで保存するアップロードファイルの参照数を数えるための列・インデックスを追加"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(ExamQuestions)')]
+    if 'original_filename' not in columns:
+        cursor.execute('ALTER TABLE ExamQuestions ADD COLUMN original_filename TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_exam_questions_picture ON ExamQuestions(picture)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_exam_questions_exam ON ExamQuestions(exam_id)')
+
+def _bump_statistics_sql(select: str) -> str:
+    """Statistics のカウンターに加算する SQL（select は scope, key, 増減値を返す SELECT）
+
+    UPSERT と結合の ON を区別できるよう select には必ず WHERE 句を付ける。
+    """
+    return (f'INSERT INTO Statistics (scope, key, value) {select} '
+            'ON CONFLICT (scope, key) DO UPDATE SET value = value + excluded.value;')
+
+def _faculty_exam_count_sql(sign: str, faculty_id: str, exams: str) -> str:
+    """学部別の試験数に exams（試験を返す FROM 句以降）の件数を加算・減算する SQL"""
+    return _bump_statistics_sql(f"SELECT 'faculty', {faculty_id}, {sign}(SELECT COUNT(*) {exams}) WHERE true")
+
+def _migrate_statistics(cursor: sqlite3.Cursor) -> None:
+    """ホーム画面の統計用カウンター Statistics を作成し、トリガーで増減する
+
+    scope が 'total' の行は各テーブルの件数、'faculty' は学部（key は faculty_id）別、
+    'year' は年度別の試験数を持つ。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Statistics (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    ''')
+
+    exam_faculty = ("SELECT 'faculty', d.faculty_id, {} FROM Subjects s "
+                    "JOIN Departments d ON s.department_id = d.department_id WHERE s.subject_id = {}")
+    triggers = {
+        'trg_stats_exam_insert': ('AFTER INSERT ON Exams',
+                                  _bump_statistics_sql("SELECT 'total', 'exams', 1 WHERE true")
+                                  + _bump_statistics_sql("SELECT 'year', NEW.exam_year, 1 WHERE true")
+                                  + _bump_statistics_sql(exam_faculty.format('1', 'NEW.subject_id'))),
+        'trg_stats_exam_delete': ('AFTER DELETE ON Exams',
+                                  _bump_statistics_sql("SELECT 'total', 'exams', -1 WHERE true")
+                                  + _bump_statistics_sql("SELECT 'year', OLD.exam_year, -1 WHERE true")
+                                  + _bump_statistics_sql(exam_faculty.format('-1', 'OLD.subject_id'))),
+        'trg_stats_exam_update': ('AFTER UPDATE OF subject_id, exam_year ON Exams '
+                                  'WHEN OLD.subject_id IS NOT NEW.subject_id OR OLD.exam_year IS NOT NEW.exam_year',
+                                  _bump_statistics_sql("SELECT 'year', OLD.exam_year, -1 WHERE true")
+                                  + _bump_statistics_sql("SELECT 'year', NEW.exam_year, 1 WHERE true")
+                                  + _bump_statistics_sql(exam_faculty.format('-1', 'OLD.subject_id'))
+                                  + _bump_statistics_sql(exam_faculty.format('1', 'NEW.subject_id'))),
+        'trg_stats_subject_insert': ('AFTER INSERT ON Subjects',
+                                     _bump_statistics_sql("SELECT 'total', 'subjects', 1 WHERE true")),
+        'trg_stats_subject_delete': ('AFTER DELETE ON Subjects',
+                                     _bump_statistics_sql("SELECT 'total', 'subjects', -1 WHERE true")),
+        'trg_stats_subject_move': ('AFTER UPDATE OF department_id ON Subjects '
+                                   'WHEN OLD.department_id IS NOT NEW.department_id',
+                                   _faculty_exam_count_sql('-', '(SELECT faculty_id FROM Departments WHERE department_id = OLD.department_id)',
+                                                           'FROM Exams WHERE subject_id = NEW.subject_id')
+                                   + _faculty_exam_count_sql('', '(SELECT faculty_id FROM Departments WHERE department_id = NEW.department_id)',
+                                                             'FROM Exams WHERE subject_id = NEW.subject_id')),
+        'trg_stats_department_move': ('AFTER UPDATE OF faculty_id ON Departments '
+                                      'WHEN OLD.faculty_id IS NOT NEW.faculty_id',
+                                      _faculty_exam_count_sql('-', 'OLD.faculty_id',
+                                                              'FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id '
+                                                              'WHERE s.department_id = NEW.department_id')
+                                      + _faculty_exam_count_sql('', 'NEW.faculty_id',
+                                                                'FROM Exams e JOIN Subjects s ON e.subject_id = s.subject_id '
+                                                                'WHERE s.department_id = NEW.department_id')),
+        'trg_stats_professor_insert': ('AFTER INSERT ON Professors',
+                                       _bump_statistics_sql("SELECT 'total', 'professors', 1 WHERE true")),
+        'trg_stats_professor_delete': ('AFTER DELETE ON Professors',
+                                       _bump_statistics_sql("SELECT 'total', 'professors', -1 WHERE true")),
+        'trg_stats_faculty_insert': ('AFTER INSERT ON Faculties',
+                                     _bump_statistics_sql("SELECT 'total', 'faculties', 1 WHERE true")),
+        'trg_stats_faculty_delete': ('AFTER DELETE ON Faculties',
+                                     _bump_statistics_sql("SELECT 'total', 'faculties', -1 WHERE true")
+                                     + "DELETE FROM Statistics WHERE scope = 'faculty' AND key = OLD.faculty_id;"),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+    # 既存データから数え直す
+    cursor.execute('DELETE FROM Statistics')
+    cursor.execute('''
+        INSERT INTO Statistics (scope, key, value)
+        SELECT 'total', 'exams', COUNT(*) FROM Exams
+        UNION ALL SELECT 'total', 'subjects', COUNT(*) FROM Subjects
+        UNION ALL SELECT 'total', 'professors', COUNT(*) FROM Professors
+        UNION ALL SELECT 'total', 'faculties', COUNT(*) FROM Faculties
+        UNION ALL SELECT 'year', exam_year, COUNT(*) FROM Exams GROUP BY exam_year
+        UNION ALL
+        SELECT 'faculty', d.faculty_id, COUNT(*)
+        FROM Exams e
+        JOIN Subjects s ON e.subject_id = s.subject_id
+        JOIN Departments d ON s.department_id = d.department_id
+        GROUP BY d.faculty_id
+    ''')
+
+def _migrate_reference_version(cursor: sqlite3.Cursor) -> None:
+    """学部・学科・試験種別・教員が変更されるたびに参照データの版を上げるトリガーを作成
+
+    版は Statistics の ('version', 'reference') 行に持ち、/api/reference の ETag と URL に使う。
+    """
+    bump = _bump_statistics_sql("SELECT 'version', 'reference', 1 WHERE true")
+    for table in ('Faculties', 'Departments', 'ExamTypes', 'Professors'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            name = f'trg_reference_version_{table.lower()}_{event.lower()}'
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN {bump} END')
+    cursor.execute("INSERT OR IGNORE INTO Statistics (scope, key, value) VALUES ('version', 'reference', 1)")
+
+def _migrate_upsert_keys(cursor: sqlite3.Cursor) -> None:
+    """科目・教員の一意インデックスを作成し、INSERT ... ON CONFLICT で取得または作成できるようにする
+
+    既存の重複は最も古い行にまとめる。UPSERT の DO UPDATE は値を変えずに行を更新するため、
+    その更新で一覧の作り直しや参照データの版上げが起きないようトリガーに WHEN を付け直す。
+    """
+    # 重複した教員を最も小さい professor_id にまとめる
+    cursor.execute('''
+        CREATE TEMP TABLE professor_merge AS
+        SELECT p.professor_id AS old_id, k.keep_id
+        FROM Professors p
+        JOIN (SELECT professor_name, MIN(professor_id) AS keep_id
+              FROM Professors GROUP BY professor_name HAVING COUNT(*) > 1) k
+          ON p.professor_name = k.professor_name AND p.professor_id <> k.keep_id
+    ''')
+    for table in ('ExamProfessors', 'SubjectProfessors'):
+        cursor.execute(f'''
+            UPDATE OR IGNORE {table}
+            SET professor_id = (SELECT keep_id FROM professor_merge WHERE old_id = professor_id)
+            WHERE professor_id IN (SELECT old_id FROM professor_merge)
+        ''')
+        cursor.execute(f'DELETE FROM {table} WHERE professor_id IN (SELECT old_id FROM professor_merge)')
+    cursor.execute('DELETE FROM Professors WHERE professor_id IN (SELECT old_id FROM professor_merge)')
+    cursor.execute('DROP TABLE professor_merge')
+
+    # 重複した科目を最も小さい subject_id にまとめる（試験が衝突して移せない科目は残る）
+    cursor.execute('''
+        CREATE TEMP TABLE subject_merge AS
+        SELECT s.subject_id AS old_id, k.keep_id
+        FROM Subjects s
+        JOIN (SELECT department_id, subject_name, subject_type, semester, grade_level,
+                     MIN(subject_id) AS keep_id
+              FROM Subjects
+              GROUP BY department_id, subject_name, subject_type, semester, grade_level
+              HAVING COUNT(*) > 1) k
+          ON s.department_id = k.department_id AND s.subject_name = k.subject_name
+         AND s.subject_type IS k.subject_type AND s.semester IS k.semester
+         AND s.grade_level IS k.grade_level AND s.subject_id <> k.keep_id
+    ''')
+    for table in ('Exams', 'SubjectProfessors'):
+        cursor.execute(f'''
+            UPDATE OR IGNORE {table}
+            SET subject_id = (SELECT keep_id FROM subject_merge WHERE old_id = subject_id)
+            WHERE subject_id IN (SELECT old_id FROM subject_merge)
+        ''')
+    cursor.execute('DELETE FROM SubjectProfessors WHERE subject_id IN (SELECT old_id FROM subject_merge)')
+    cursor.execute('''
+        DELETE FROM Subjects
+        WHERE subject_id IN (SELECT old_id FROM subject_merge)
+          AND NOT EXISTS (SELECT 1 FROM Exams WHERE Exams.subject_id = Subjects.subject_id)
+    ''')
+    cursor.execute('DROP TABLE subject_merge')
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_subjects_identity
+        ON Subjects(department_id, subject_name, subject_type, semester, grade_level)
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_professors_name ON Professors(professor_name)')
+
+    triggers = {
+        'trg_exam_listing_professor_rename': ('AFTER UPDATE OF professor_name ON Professors '
+                                              'WHEN OLD.professor_name IS NOT NEW.professor_name',
+                                              _refresh_listing_sql('IN (SELECT exam_id FROM ExamProfessors '
+                                                                   'WHERE professor_id = NEW.professor_id)')),
+        'trg_exam_listing_subject_update': ('AFTER UPDATE OF subject_name, department_id ON Subjects '
+                                            'WHEN OLD.subject_name IS NOT NEW.subject_name '
+                                            'OR OLD.department_id IS NOT NEW.department_id',
+                                            _refresh_listing_sql('IN (SELECT exam_id FROM Exams WHERE subject_id = NEW.subject_id)')),
+        'trg_reference_version_professors_update': ('AFTER UPDATE ON Professors '
+                                                    'WHEN OLD.professor_name IS NOT NEW.professor_name',
+                                                    _bump_statistics_sql("SELECT 'version', 'reference', 1 WHERE true")),
+    }
+    for name, (event, body) in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {body} END')
+
+def _migrate_pending_file_deletions(cursor: sqlite3.Cursor) -> None:
+    """どの ExamQuestions からも参照されなくなったアップロードファイルの削除待ちキューを作成
+
+    行の削除・ファイル名の変更と同じトランザクションでトリガーが登録するので、
+    コミット後に削除する前にプロセスが止まっても削除待ちは失われない。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS PendingFileDeletions (
+            filename TEXT PRIMARY KEY,
+            queued_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    enqueue = 'INSERT INTO PendingFileDeletions (filename) VALUES (OLD.picture) ON CONFLICT DO NOTHING;'
+    unreferenced = ('OLD.picture IS NOT NULL '
+                    'AND NOT EXISTS (SELECT 1 FROM ExamQuestions WHERE picture = OLD.picture)')
+    triggers = {
+        'trg_pending_file_deletions_question_delete': f'AFTER DELETE ON ExamQuestions WHEN {unreferenced}',
+        'trg_pending_file_deletions_question_update': ('AFTER UPDATE OF picture ON ExamQuestions '
+                                                       f'WHEN OLD.picture IS NOT NEW.picture AND {unreferenced}'),
+    }
+    for name, event in triggers.items():
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} {event} BEGIN {enqueue} END')
+
+def _migrate_login_attempts(cursor: sqlite3.Cursor) -> None:
+    """ログイン試行履歴 LoginAttempts を作成（database_schema.sql と同じ定義）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS LoginAttempts (
+            attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            success INTEGER NOT NULL CHECK (success IN (0, 1)),
+            user_id INTEGER,
+            failure_reason TEXT,
+            ip_address TEXT,
+            user_agent TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE SET NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_email ON LoginAttempts(email)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_login_attempts_timestamp ON LoginAttempts(timestamp)')
+
+def _migrate_user_sessions(cursor: sqlite3.Cursor) -> None:
+    """ユーザーの有効・無効、最終ログイン日時、セッションの版の列を追加
+
+    session_version はセッションに記録し、値が変わると発行済みのセッションが無効になる。
+    is_active を変更したときはトリガーで上げる。
+    """
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(Users)')]
+    if 'is_active' not in columns:
+        cursor.execute('ALTER TABLE Users ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1 CHECK (is_active IN (0, 1))')
+    if 'last_login_at' not in columns:
+        cursor.execute('ALTER TABLE Users ADD COLUMN last_login_at DATETIME')
+    if 'session_version' not in columns:
+        cursor.execute('ALTER TABLE Users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 1')
+    cursor.execute('DROP TRIGGER IF EXISTS trg_users_session_version')
+    cursor.execute('''
+        CREATE TRIGGER trg_users_session_version AFTER UPDATE OF is_active ON Users
+        WHEN OLD.is_active IS NOT NEW.is_active
+        BEGIN
+            UPDATE Users SET session_version = session_version + 1 WHERE user_id = NEW.user_id;
+        END
+    ''')
+
+def _migrate_exam_version(cursor: sqlite3.Cursor) -> None:
+    """試験の内容（一覧・注意事項・問題ファイル）が変更されるたびに試験データの版を上げるトリガーを作成
+
+    版は Statistics の ('version', 'exams') 行に持ち、試験詳細・一覧ページのキャッシュのキーに使う。
+    ExamListing は学部・学科・科目・教員の変更にも追従して作り直されるので、それらの変更も含まれる。
+    """
+    bump = _bump_statistics_sql("SELECT 'version', 'exams', 1 WHERE true")
+    targets = [(table, event) for table in ('ExamListing', 'ExamQuestions') for event in ('INSERT', 'UPDATE', 'DELETE')]
+    targets.append(('Exams', 'UPDATE'))
+    for table, event in targets:
+        name = f'trg_exam_version_{table.lower()}_{event.lower()}'
+        cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN {bump} END')
+    cursor.execute("INSERT OR IGNORE INTO Statistics (scope, key, value) VALUES ('version', 'exams', 1)")
+
+def _migrate_filter_indexes(cursor: sqlite3.Cursor) -> None:
+    """試験一覧を学部・学科・科目・試験種別・教員の ID で絞り込むためのインデックスを作成
+
+    ExamListing のインデックスは ID の後ろに一覧の表示順の列を並べ、絞り込んだ範囲を
+    表示順のまま読めるようにする（並べ替えずに LIMIT 件で止まる）。年度の範囲は
+    idx_exam_listing_order で検索する。
+    """
+    order = 'exam_year DESC, faculty_name, department_name, subject_name, exam_id'
+    for column in ('faculty_id', 'department_id', 'subject_id', 'exam_type_id'):
+        name = column.removesuffix('_id')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_exam_listing_{name} ON ExamListing({column}, {order})')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_exam_professors_professor ON ExamProfessors(professor_id, exam_id)')
+    # 学科から試験を引く（学科名の変更で一覧を作り直すトリガーなど）ときに Subjects の行を読まずに済ませる
+    cursor.execute('DROP INDEX IF EXISTS idx_subjects_department')
+    cursor.execute('CREATE INDEX idx_subjects_department ON Subjects(department_id, subject_id)')
+
+# スキーマ移行の一覧（PRAGMA user_version に適用済みの件数を記録する）
+MIGRATIONS = [
+    _migrate_exam_listing,
+    _migrate_exam_search,
+    _migrate_upload_references,
+    _migrate_statistics,
+    _migrate_reference_version,
+    _migrate_upsert_keys,
+    _migrate_pending_file_deletions,
+    _migrate_login_attempts,
+    _migrate_user_sessions,
+    _migrate_exam_version,
+    _migrate_filter_indexes,
+]
+
+def upgrade_database(conn: sqlite3.Connection) -> None:
+    """未適用のスキーマ移行を1つのトランザクションで適用"""
+    if conn.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+        return
+    # 基本テーブルが未作成（init_database の実行前）であれば何もしない
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Exams'").fetchone() is None:
+        return
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # 他のプロセスが先に移行を済ませている場合があるため取り直す
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        cursor = conn.cursor()
+        for migration in MIGRATIONS[version:]:
+            migration(cursor)
+        conn.execute(f'PRAGMA user_version = {max(version, len(MIGRATIONS))}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
 def init_database():
     """データベースを初期化"""
-    conn = sqlite3.connect('database.db')
+    conn = sqlite3.connect(DATABASE)
     cursor = conn.cursor()
     
     try:
-        # 外部キー制約を有効化
-        cursor.execute('PRAGMA foreign_keys = ON')
+        # チューニングプロファイル（外部キー制約の有効化を含む）を適用
+        apply_db_profile(conn)
         
         print("テーブルを作成中...")
         
@@ -130,27 +626,8 @@ def init_database():
             )
         ''')
         
-        # 試験詳細ビュー
-        cursor.execute('''
-            CREATE VIEW IF NOT EXISTS ExamDetailView AS
-            SELECT 
-                e.exam_id,
-                f.faculty_name AS 学部名,
-                d.department_name AS 学科名,
-                s.subject_name AS 科目名,
-                et.exam_type_name AS 試験種別,
-                e.exam_year AS 年度,
-                e.instructions AS 注意事項,
-                GROUP_CONCAT(p.professor_name, ', ') AS 担当者
-            FROM Exams e
-            JOIN Subjects s ON e.subject_id = s.subject_id
-            JOIN Departments d ON s.department_id = d.department_id
-            JOIN Faculties f ON d.faculty_id = f.faculty_id
-            JOIN ExamTypes et ON e.exam_type_id = et.exam_type_id
-            LEFT JOIN ExamProfessors ep ON e.exam_id = ep.exam_id
-            LEFT JOIN Professors p ON ep.professor_id = p.professor_id
-            GROUP BY e.exam_id
-        ''')
+        # 試験一覧テーブル・試験詳細ビューなどの追加スキーマ
+        upgrade_database(conn)
         
         print("初期データを投入中...")
         
@@ -163,11 +640,11 @@ def init_database():
             ('user5@keio.jp', 'keio123', 'user', '高橋 一郎')
         ]
         
-        for email, password_hash, user_type, full_name in users:
+        for email, password, user_type, full_name in users:
             cursor.execute('''
                 INSERT OR IGNORE INTO Users (email, password_hash, user_type, full_name)
                 VALUES (?, ?, ?, ?)
-            ''', (email, password_hash, user_type, full_name))
+            ''', (email, hash_password(password), user_type, full_name))
         
         # 慶應義塾大学の全学部データ
         faculties = [
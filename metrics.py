@@ -0,0 +1,451 @@
+"""
+リクエスト・テンプレート・SQL の計測
+
+カウンターとヒストグラムをプロセスのメモリに集計し、Prometheus のテキスト形式
+（/metrics）で出力する。SQL は InstrumentedConnection（sqlite3.connect の factory）を
+通して文の種類と主なテーブル（statement_label）ごとに回数と時間を数え、
+SLOW_QUERY_THRESHOLD を超えた文はログに出力する。
+
+serve.py のように複数のワーカープロセスで動かす場合、集計はプロセスごとになる。
+METRICS_DIR を指定すると各プロセスが集計を定期的にそのディレクトリへ書き出し、
+/metrics は全プロセス分を合計して返す。
+"""
+
+import functools
+import json
+import logging
+import math
+import os
+import re
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Final, Iterable, Optional
+
+# 計測の有無と、遅いとみなす時間（秒）
+METRICS_ENABLED: Final[bool] = os.environ.get('METRICS_ENABLED', '1') != '0'
+SLOW_QUERY_THRESHOLD: Final[float] = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.1))
+SLOW_REQUEST_THRESHOLD: Final[float] = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 1.0))
+
+# 各プロセスの集計を書き出すディレクトリ（空なら書き出さない）と書き出す間隔（秒）
+METRICS_DIR: Final[str] = os.environ.get('METRICS_DIR', '')
+METRICS_DUMP_INTERVAL: Final[float] = 5.0
+
+# ヒストグラムの区切り（秒）
+REQUEST_BUCKETS: Final[tuple[float, ...]] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS: Final[tuple[float, ...]] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# 遅い SQL のログに出す SQL の最大長
+MAX_SLOW_QUERY_LOG: Final[int] = 500
+
+# SQL 文のラベルの種類の上限（超えた分は 'other' にまとめる）
+MAX_STATEMENT_LABELS: Final[int] = 200
+
+slow_query_logger = logging.getLogger('metrics.slow_query')
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """カウンターとヒストグラムの集計（スレッドセーフ）
+
+    メトリクスは名前とラベルの組ごとに保持する。ヒストグラムの値は
+    [区切りごとの件数..., 合計, 件数] のリストで、区切りの件数は累積しない。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._buckets: dict[str, tuple[float, ...]] = {}
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], list[float]] = {}
+
+    def counter(self, name: str, help_text: str) -> None:
+        """カウンターを登録"""
+        self._help[name] = ('counter', help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...]) -> None:
+        """ヒストグラムを登録"""
+        self._help[name] = ('histogram', help_text)
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1.0) -> None:
+        """カウンターを増やす"""
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        """ヒストグラムに値を1件加える"""
+        buckets = self._buckets[name]
+        key = (name, labels)
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self._lock:
+            values = self._histograms.get(key)
+            if values is None:
+                values = self._histograms[key] = [0.0] * (len(buckets) + 3)
+            values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def snapshot(self) -> dict:
+        """集計の写し（JSON に書き出せる形）"""
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(labels), list(values)]
+                               for (name, labels), values in self._histograms.items()],
+            }
+
+    def render(self, snapshots: Iterable[dict]) -> str:
+        """snapshot() の結果を合計して Prometheus のテキスト形式にする"""
+        counters: dict[tuple[str, Labels], float] = {}
+        histograms: dict[tuple[str, Labels], list[float]] = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                total = histograms.get(key)
+                if total is None or len(total) != len(values):
+                    histograms[key] = list(values)
+                else:
+                    histograms[key] = [a + b for a, b in zip(total, values)]
+
+        lines = []
+        for name, (kind, help_text) in self._help.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                continue
+            buckets = self._buckets[name]
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name or len(values) != len(buckets) + 3:
+                    continue
+                cumulative = 0.0
+                for bound, count in zip((*buckets, math.inf), values):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {_format_value(cumulative)}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(values[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {_format_value(values[-1])}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+registry = MetricsRegistry()
+registry.histogram('http_request_duration_seconds', 'リクエストの処理時間（レスポンス本体の送信を除く）', REQUEST_BUCKETS)
+registry.histogram('template_render_duration_seconds', 'テンプレートの描画時間', REQUEST_BUCKETS)
+registry.histogram('sqlite_query_duration_seconds', 'SQL 文の実行時間（結果の取り出しを含む）', QUERY_BUCKETS)
+registry.counter('sqlite_slow_queries_total', 'SLOW_QUERY_THRESHOLD を超えた SQL 文の数')
+registry.counter('http_request_queries_total', 'リクエストの処理中に実行した SQL 文の数')
+registry.counter('http_request_query_seconds_total', 'リクエストの処理中に SQL 文の実行にかかった時間')
+
+
+# ===== SQL の計測 =====
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/", re.DOTALL)
+_TOKENS = re.compile(r'"[^"]*"|`[^`]*`|\[[^\]]*\]|\w+|[()]')
+_TARGET = re.compile(r'^(?:INSERT|REPLACE)\s+(?:OR\s+\w+\s+)?INTO\s+([\w"`\[\]]+)'
+                     r'|^UPDATE\s+(?:OR\s+\w+\s+)?([\w"`\[\]]+)|^DELETE\s+FROM\s+([\w"`\[\]]+)', re.IGNORECASE)
+_QUOTES = '"`[]'
+_DML = frozenset({'select', 'insert', 'replace', 'update', 'delete'})
+_DDL = frozenset({'create', 'drop', 'alter', 'reindex', 'vacuum', 'analyze'})
+
+_statement_labels: set[str] = set()
+_statement_labels_lock = threading.Lock()
+
+def _source_table(tokens: list[tuple[str, int]]) -> Optional[str]:
+    """SELECT の主な読み込み元のテーブル（最も浅い FROM の直後。副問い合わせならその中を探す）"""
+    froms = [(depth, i) for i, (token, depth) in enumerate(tokens) if token.lower() == 'from']
+    if not froms:
+        return None
+    depth, index = min(froms)
+    if index + 1 >= len(tokens):
+        return None
+    token, _ = tokens[index + 1]
+    if token != '(':
+        return token
+    end = next((i for i in range(index + 2, len(tokens)) if tokens[i][1] <= depth), len(tokens))
+    return _source_table(tokens[index + 2:end])
+
+def _tokenize(sql: str) -> list[tuple[str, int]]:
+    """識別子と括弧を (字句, 括弧の深さ) のリストにする"""
+    tokens = []
+    depth = 0
+    for token in _TOKENS.findall(sql):
+        if token == ')':
+            depth -= 1
+        tokens.append((token.strip(_QUOTES) if token not in '()' else token, depth))
+        if token == '(':
+            depth += 1
+    return tokens
+
+def _statement_kind(sql: str) -> str:
+    """SQL 文を「文の種類 テーブル名」のラベルにする（DDL などは種類のみ）"""
+    sql = _WHITESPACE.sub(' ', _LITERALS.sub("''", sql)).strip()
+    if not sql:
+        return 'other'
+    tokens = _tokenize(sql)
+    kind = tokens[0][0].lower() if tokens else 'other'
+    if kind == 'with':
+        # 共通テーブル式の後の本体の文の種類
+        kind = next((token.lower() for token, depth in tokens if depth == 0 and token.lower() in _DML), 'with')
+        body = next((i for i, (token, depth) in enumerate(tokens) if depth == 0 and token.lower() == kind), 0)
+        sql = ' '.join(token for token, _ in tokens[body:])
+        tokens = tokens[body:]
+    if kind == 'select':
+        table = _source_table(tokens)
+        return f'select {table}' if table else 'select'
+    if kind in _DML:
+        match = _TARGET.match(sql)
+        table = next((group for group in match.groups() if group), None) if match else None
+        return f'{kind} {table.strip(_QUOTES)}' if table else kind
+    if kind == 'pragma' and len(tokens) > 1:
+        return f'pragma {tokens[1][0].lower()}'
+    if kind in _DDL:
+        return 'ddl'
+    if kind in ('begin', 'commit', 'end', 'rollback', 'savepoint', 'release', 'explain', 'attach', 'detach'):
+        return kind
+    return 'other'
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """SQL 文をラベルにまとめる（「select ExamListing」のように文の種類と主なテーブル）
+
+    絞り込み条件によって WHERE 句が変わる文も同じラベルになる。CREATE などの DDL は 'ddl'、
+    ラベルの種類が MAX_STATEMENT_LABELS に達した後の新しいラベルは 'other' にまとめる。
+    """
+    label = _statement_kind(sql)
+    with _statement_labels_lock:
+        if label in _statement_labels:
+            return label
+        if len(_statement_labels) >= MAX_STATEMENT_LABELS:
+            return 'other'
+        _statement_labels.add(label)
+    return label
+
+def _log_text(sql: str) -> str:
+    """遅い SQL のログに出す形（空白を詰めて MAX_SLOW_QUERY_LOG 文字まで）"""
+    text = _WHITESPACE.sub(' ', sql).strip()
+    return text if len(text) <= MAX_SLOW_QUERY_LOG else text[:MAX_SLOW_QUERY_LOG - 3] + '...'
+
+
+class QueryStats(threading.local):
+    """スレッドごとの SQL の実行数と時間（リクエストの始めに reset する）"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+    def reset(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+query_stats = QueryStats()
+
+def record_query(sql: str, seconds: float) -> None:
+    """SQL 文1件の実行を記録"""
+    label = statement_label(sql)
+    registry.observe('sqlite_query_duration_seconds', seconds, (('statement', label),))
+    query_stats.count += 1
+    query_stats.seconds += seconds
+    if seconds >= SLOW_QUERY_THRESHOLD:
+        registry.inc('sqlite_slow_queries_total', (('statement', label),))
+        slow_query_logger.warning('slow query (%.1fms): %s', seconds * 1000, _log_text(sql))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """実行と結果の取り出しにかかった時間を SQL 文ごとに記録するカーソル
+
+    SELECT の時間には最初の fetchone / fetchall / fetchmany までを含める。
+    for 文で行を読む場合は最初の行までの時間になる。
+    """
+
+    _pending: Optional[tuple[str, float]] = None
+
+    def _finish(self, extra: float = 0.0) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            record_query(pending[0], pending[1] + extra)
+
+    def _timed(self, method, sql: str, *args):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = method(self, sql, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._pending = (sql, elapsed)
+        if self.description is None:
+            self._finish()
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._timed(sqlite3.Cursor.executescript, sql_script)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._finish(time.perf_counter() - start)
+        return row
+
+    def fetchmany(self, size: int = -1):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size < 0 else size)
+        self._finish(time.perf_counter() - start)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._finish(time.perf_counter() - start)
+        return rows
+
+    def __iter__(self):
+        self._finish()
+        return self
+
+    def close(self) -> None:
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """InstrumentedCursor を使う接続（sqlite3.connect の factory に指定する）"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+# ===== プロセスごとの集計の書き出し =====
+#
+# 各プロセスは METRICS_DIR/<pid>-<プロセスごとの乱数>.json に集計を書き出す。乱数を付けるのは、
+# 終了したワーカーと同じ pid が再利用されても別のプロセスのファイルとして区別するため。
+# 終了したプロセスのファイルは render_metrics が削除し、serve.py は起動時に前回の分を消す。
+
+_dump_lock = threading.Lock()
+_last_dump = 0.0
+_snapshot_name: Optional[tuple[int, str]] = None
+
+def _snapshot_filename() -> str:
+    """自プロセスの集計のファイル名（fork 後は作り直す）"""
+    global _snapshot_name
+    pid = os.getpid()
+    if _snapshot_name is None or _snapshot_name[0] != pid:
+        _snapshot_name = (pid, f'{pid}-{secrets.token_hex(4)}.json')
+    return _snapshot_name[1]
+
+def _snapshot_pid(filename: str) -> Optional[int]:
+    """集計のファイル名の pid（集計のファイルでなければ None）"""
+    stem, ext = os.path.splitext(filename)
+    pid = stem.split('-', 1)[0]
+    return int(pid) if ext == '.json' and pid.isdigit() else None
+
+def _process_alive(pid: int) -> bool:
+    """pid のプロセスが動いているか"""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def clear_snapshots() -> None:
+    """METRICS_DIR の集計をすべて削除する（serve.py がワーカーを起動する前に呼ぶ）"""
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return
+    for entry in os.scandir(METRICS_DIR):
+        if _snapshot_pid(entry.name) is not None or entry.name.endswith('.tmp'):
+            _remove(entry.path)
+
+def dump_snapshot(force: bool = False) -> None:
+    """METRICS_DIR に自プロセスの集計を書き出す（前回から METRICS_DUMP_INTERVAL 経っていなければ何もしない）"""
+    global _last_dump
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    with _dump_lock:
+        if not force and now - _last_dump < METRICS_DUMP_INTERVAL:
+            return
+        first = _last_dump == 0.0 or _snapshot_name is None or _snapshot_name[0] != os.getpid()
+        _last_dump = now
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    filename = _snapshot_filename()
+    if first:
+        # 同じ pid だった終了済みのプロセスのファイルは、このプロセスの集計と取り違えないよう消す
+        for entry in os.scandir(METRICS_DIR):
+            if entry.name != filename and _snapshot_pid(entry.name) == os.getpid():
+                _remove(entry.path)
+    fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(registry.snapshot(), f)
+        os.replace(tmp, os.path.join(METRICS_DIR, filename))
+    except BaseException:
+        _remove(tmp)
+        raise
+
+def render_metrics() -> str:
+    """全プロセス分（METRICS_DIR がなければ自プロセス分）の集計を Prometheus のテキスト形式で返す
+
+    終了したプロセスのファイルは合計に含めず削除する。
+    """
+    if not METRICS_DIR:
+        return registry.render([registry.snapshot()])
+    dump_snapshot(force=True)
+    snapshots = []
+    for entry in os.scandir(METRICS_DIR):
+        pid = _snapshot_pid(entry.name)
+        if pid is None:
+            continue
+        if not _process_alive(pid):
+            _remove(entry.path)
+            continue
+        try:
+            with open(entry.path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return registry.render(snapshots)
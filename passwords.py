@@ -0,0 +1,114 @@
+"""
+パスワードのハッシュ化
+
+ハッシュは「方式$パラメータ…$salt$hash」の形式で保存する（salt と hash は base64）。
+    scrypt$16384$8$1$<salt>$<hash>
+    pbkdf2_sha256$600000$<salt>$<hash>
+使う方式とコストは環境変数で指定し、変更した場合はログイン時に新しい設定でハッシュし直す
+（needs_rehash）。この形式でない値は以前の平文として照合する。
+
+鍵導出は CPU とメモリ（scrypt）を使うので、run_password_task で上限付きの
+ワーカースレッドに回して同時に実行する数を PASSWORD_HASH_WORKERS までに抑える。
+リクエストのスレッドは結果を待つ間ブロックするが、ログインが集中しても CPU と
+メモリを使い切らない（hashlib の scrypt と pbkdf2_hmac は計算中に GIL を解放するため、
+上限までは他のリクエストと並列に動く）。
+"""
+
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Callable, Final, Optional, TypeVar
+
+# 新しく保存するハッシュの方式とパラメータ
+PASSWORD_HASH_SCHEME: Final[str] = os.environ.get('PASSWORD_HASH_SCHEME', 'scrypt')
+PASSWORD_HASH_PARAMS: Final[dict[str, tuple[int, ...]]] = {
+    # (N, r, p)。1回あたり 128 * N * r バイトのメモリを使う（既定値で 16MB）
+    'scrypt': (int(os.environ.get('SCRYPT_N', 2 ** 14)),
+               int(os.environ.get('SCRYPT_R', 8)),
+               int(os.environ.get('SCRYPT_P', 1))),
+    # (繰り返し回数,)
+    'pbkdf2_sha256': (int(os.environ.get('PBKDF2_ITERATIONS', 600000)),),
+}
+
+SALT_SIZE: Final[int] = 16
+HASH_SIZE: Final[int] = 32
+
+# 鍵導出を同時に実行する数（scrypt はメモリも使うので CPU 数までに抑える）
+PASSWORD_HASH_WORKERS: Final[int] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
+password_executor = concurrent.futures.ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                                          thread_name_prefix='password-hash')
+
+T = TypeVar('T')
+
+
+def derive_key(scheme: str, params: tuple[int, ...], password: str, salt: bytes) -> bytes:
+    """方式とパラメータに従ってパスワードから鍵を導出"""
+    data = password.encode('utf-8')
+    if scheme == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(data, salt=salt, n=n, r=r, p=p, dklen=HASH_SIZE,
+                              maxmem=128 * n * r * (p + 1) + 1024 * 1024)
+    if scheme == 'pbkdf2_sha256':
+        iterations, = params
+        return hashlib.pbkdf2_hmac('sha256', data, salt, iterations, dklen=HASH_SIZE)
+    raise ValueError(f'未対応のハッシュ方式です: {scheme}')
+
+
+def _encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _decode(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def parse_password_hash(password_hash: str) -> Optional[tuple[str, tuple[int, ...], bytes, bytes]]:
+    """保存されたハッシュを (方式, パラメータ, salt, hash) に分解（この形式でなければ None）"""
+    scheme, _, rest = password_hash.partition('$')
+    if scheme not in PASSWORD_HASH_PARAMS:
+        return None
+    fields = rest.split('$')
+    if len(fields) != len(PASSWORD_HASH_PARAMS[scheme]) + 2:
+        return None
+    try:
+        params = tuple(int(value) for value in fields[:-2])
+        return scheme, params, _decode(fields[-2]), _decode(fields[-1])
+    except ValueError:
+        return None
+
+
+def hash_password(password: str, scheme: str = PASSWORD_HASH_SCHEME,
+                  params: Optional[tuple[int, ...]] = None) -> str:
+    """パスワードをハッシュ化（salt はランダムに生成）"""
+    params = params or PASSWORD_HASH_PARAMS[scheme]
+    salt = secrets.token_bytes(SALT_SIZE)
+    key = derive_key(scheme, params, password, salt)
+    return '$'.join([scheme, *map(str, params), _encode(salt), _encode(key)])
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """パスワードを検証（以前の平文で保存された値とも照合する）"""
+    parsed = parse_password_hash(password_hash)
+    if parsed is None:
+        return hmac.compare_digest(password.encode('utf-8'), password_hash.encode('utf-8'))
+    scheme, params, salt, expected = parsed
+    return hmac.compare_digest(derive_key(scheme, params, password, salt), expected)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """保存されたハッシュが現在の方式・パラメータと異なるか（平文も含む）"""
+    parsed = parse_password_hash(password_hash)
+    return (parsed is None or parsed[0] != PASSWORD_HASH_SCHEME
+            or parsed[1] != PASSWORD_HASH_PARAMS[PASSWORD_HASH_SCHEME])
+
+
+def run_password_task(func: Callable[..., T], *args) -> T:
+    """hash_password / verify_password を同時実行数に上限のあるワーカースレッドで実行する
+
+    呼び出したスレッドは結果が出るまでブロックする（空きがなければ実行を待つ時間も含む）。
+    """
+    return password_executor.submit(func, *args).result()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+常駐型 WSGI サーバー起動スクリプト
+
+CGI のようにリクエストごとにインタプリタを起動し直すのではなく、
+app を読み込んだ状態のプロセスを事前に fork して待機させる（プリフォーク方式）。
+標準ライブラリのみで動作するため、Apache の ProxyPass などの背後に置いて利用する。
+
+    python serve.py --host 127.0.0.1 --port 8000 --workers 4
+"""
+
+import argparse
+import os
+import signal
+import sys
+from typing import NoReturn
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+from app import app, require_vendor_assets, shutdown
+from metrics import clear_snapshots
+
+
+# ワーカーが終了シグナルを確認する間隔（秒）
+WORKER_POLL_INTERVAL = 0.5
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """アクセスログを出力しないリクエストハンドラ"""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_worker(server) -> NoReturn:
+    """ワーカープロセスの処理
+
+    終了シグナルを受けたら処理中のリクエストを終えてから待ち受けをやめ、
+    app の後始末（未書き込みのログイン試行の書き出しと接続の close）をして終了する。
+    """
+    stopping = False
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        while not stopping:
+            server.handle_request()
+    finally:
+        try:
+            shutdown()
+        finally:
+            os._exit(0)
+
+
+def serve(host: str, port: int, workers: int, quiet: bool = False) -> None:
+    """ワーカープロセスを起動し、終了シグナルを受けるまで監視する"""
+    handler_class = QuietRequestHandler if quiet else WSGIRequestHandler
+    # 待ち受けソケットは親プロセスで作成し、全ワーカーで共有する
+    server = make_server(host, port, app, handler_class=handler_class)
+
+    if workers <= 1 or not hasattr(os, 'fork'):
+        # fork できない環境（Windows など）では単一プロセスで動作
+        print(f"Serving on http://{host}:{server.server_port} (single process)", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    # 他のワーカーが先に accept した場合に accept で待ち続けないようにし、
+    # 終了シグナルを WORKER_POLL_INTERVAL ごとに確認する（socket.setblocking(False) にすると
+    # handle_request の待ち時間が 0 になるので、ファイル記述子だけを非ブロッキングにする）
+    os.set_blocking(server.socket.fileno(), False)
+    server.timeout = WORKER_POLL_INTERVAL
+
+    children: set[int] = set()
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(server)
+        children.add(pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on http://{host}:{server.server_port} ({workers} workers)", file=sys.stderr)
+
+    # 異常終了したワーカーは再起動して常に workers 個を維持する
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            spawn()
+
+    server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='試験問題管理システムを常駐プロセスで起動します')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WORKERS', '4')))
+    parser.add_argument('--quiet', action='store_true', help='アクセスログを出力しない')
+    args = parser.parse_args()
+    require_vendor_assets()
+    # 前回の起動で終了したワーカーの集計を合計に含めない
+    clear_snapshots()
+    serve(args.host, args.port, args.workers, args.quiet)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,419 @@
+// 学部・学科のマッピング
+// 学部別の学科一覧（参照データから作成）
+let departmentsByFaculty = {};
+
+// サンプル科目データ（既存データベースから取得する想定）
+let subjectSuggestions = [];
+
+// サンプル教員データ（既存データベースから取得する想定）
+let professorSuggestions = [];
+
+// 選択されたファイルを管理する配列
+let selectedFiles = [];
+// サーバー側の設定（.container の data 属性）
+const container = document.querySelector('.container');
+const maxUploadSize = parseInt(container.dataset.maxUploadSize);
+
+// 学部・学科・試験種別・教員の参照データを読み込む
+// （URL に版が含まれるため、データが変わるまではブラウザのキャッシュが使われる）
+const referenceData = fetch(container.dataset.referenceUrl)
+    .then(response => response.json())
+    .then(data => {
+        data.departments.forEach(dept => {
+            (departmentsByFaculty[dept.faculty_id] ||= []).push({ id: dept.id, name: dept.name });
+        });
+        replaceOptions('faculty', data.faculties, null);
+        replaceOptions('exam_type', data.exam_types, null);
+        professorSuggestions.push(...data.professors);
+        setupAutocomplete('professor_name', 'professor-suggestions', professorSuggestions);
+        return data;
+    })
+    .catch(error => {
+        alert('学部・学科の一覧を読み込めませんでした。ページを再読み込みしてください。');
+    });
+
+// 参照データの項目を選択肢に追加する（先頭の「選択してください」の後に並べる）
+function replaceOptions(selectId, items, selectedId) {
+    const select = document.getElementById(selectId);
+    items.forEach(item => {
+        const option = document.createElement('option');
+        option.value = item.id;
+        option.textContent = item.name;
+        option.selected = item.id === selectedId;
+        select.appendChild(option);
+    });
+}
+
+// 学部選択時の処理
+document.getElementById('faculty').addEventListener('change', function() {
+    const facultyId = parseInt(this.value);
+    const departmentSelect = document.getElementById('department');
+
+    // 学科選択肢をリセット
+    departmentSelect.innerHTML = '<option value="">学科を選択してください</option>';
+
+    if (facultyId && departmentsByFaculty[facultyId]) {
+        // 対応する学科を追加
+        departmentsByFaculty[facultyId].forEach(dept => {
+            const option = document.createElement('option');
+            option.value = dept.id;
+            option.textContent = dept.name;
+            departmentSelect.appendChild(option);
+        });
+
+        departmentSelect.disabled = false;
+    } else {
+        departmentSelect.disabled = true;
+    }
+});
+
+// 自動補完機能（データがある場合のみ）
+function setupAutocomplete(inputId, suggestionsId, suggestions) {
+    const input = document.getElementById(inputId);
+    const suggestionsList = document.getElementById(suggestionsId);
+
+    // データが空の場合は自動補完を無効化
+    if (!suggestions || suggestions.length === 0) {
+        return;
+    }
+
+    input.addEventListener('input', function() {
+        const value = this.value.toLowerCase();
+        suggestionsList.innerHTML = '';
+
+        if (value.length < 1) {
+            suggestionsList.style.display = 'none';
+            return;
+        }
+
+        const filtered = suggestions.filter(item => 
+            item.toLowerCase().includes(value)
+        );
+
+        if (filtered.length > 0) {
+            filtered.forEach(item => {
+                const div = document.createElement('div');
+                div.className = 'autocomplete-suggestion';
+                div.textContent = item;
+                div.addEventListener('click', function() {
+                    input.value = item;
+                    suggestionsList.style.display = 'none';
+                });
+                suggestionsList.appendChild(div);
+            });
+            suggestionsList.style.display = 'block';
+        } else {
+            suggestionsList.style.display = 'none';
+        }
+    });
+
+    // 他の場所をクリックしたら候補を隠す
+    document.addEventListener('click', function(e) {
+        if (!input.contains(e.target) && !suggestionsList.contains(e.target)) {
+            suggestionsList.style.display = 'none';
+        }
+    });
+}
+
+// 自動補完の初期化
+setupAutocomplete('subject_name', 'subject-suggestions', subjectSuggestions);
+
+// ファイルアップロード関連の処理
+const fileUploadArea = document.getElementById('file-upload-area');
+const fileInput = document.getElementById('exam_files');
+const filePreview = document.getElementById('file-preview');
+
+// ドラッグ&ドロップ機能
+fileUploadArea.addEventListener('dragover', function(e) {
+    e.preventDefault();
+    fileUploadArea.classList.add('drag-over');
+});
+
+fileUploadArea.addEventListener('dragleave', function(e) {
+    e.preventDefault();
+    fileUploadArea.classList.remove('drag-over');
+});
+
+fileUploadArea.addEventListener('drop', function(e) {
+    e.preventDefault();
+    fileUploadArea.classList.remove('drag-over');
+    const files = Array.from(e.dataTransfer.files);
+    addFilesToSelection(files);
+});
+
+// ファイル選択時の処理
+fileInput.addEventListener('change', function(e) {
+    const files = Array.from(e.target.files);
+    addFilesToSelection(files);
+});
+
+// ファイルを選択リストに追加
+function addFilesToSelection(newFiles) {
+    newFiles.forEach(file => {
+        // 同じ名前のファイルがすでに選択されていないかチェック
+        const existingFile = selectedFiles.find(f => f.name === file.name && f.size === file.size);
+        if (!existingFile) {
+            selectedFiles.push(file);
+        }
+    });
+    updateFilePreview();
+    updateFileInput();
+}
+
+// ファイルを選択リストから削除
+function removeFileFromSelection(index) {
+    selectedFiles.splice(index, 1);
+    updateFilePreview();
+    updateFileInput();
+}
+
+// ファイル入力を更新（selectedFilesの内容でFileListを再構築）
+function updateFileInput() {
+    const dt = new DataTransfer();
+    selectedFiles.forEach(file => {
+        dt.items.add(file);
+    });
+    fileInput.files = dt.files;
+}
+
+// ファイルプレビュー表示を更新
+function updateFilePreview() {
+    filePreview.innerHTML = '';
+
+    if (selectedFiles.length === 0) return;
+
+    const fileList = document.createElement('div');
+    fileList.style.border = '1px solid #ddd';
+    fileList.style.borderRadius = '4px';
+    fileList.style.padding = '10px';
+    fileList.style.backgroundColor = '#f9f9f9';
+    fileList.style.marginTop = '10px';
+
+    const title = document.createElement('h4');
+    title.textContent = `選択されたファイル (${selectedFiles.length}件)`;
+    title.style.margin = '0 0 10px 0';
+    title.style.fontSize = '0.9em';
+    title.style.color = '#495057';
+    fileList.appendChild(title);
+
+    selectedFiles.forEach((file, index) => {
+        const fileItem = document.createElement('div');
+        fileItem.className = 'file-item';
+        fileItem.style.display = 'flex';
+        fileItem.style.alignItems = 'center';
+        fileItem.style.justifyContent = 'space-between';
+        fileItem.style.padding = '8px';
+        fileItem.style.background = 'white';
+        fileItem.style.borderRadius = '4px';
+        fileItem.style.marginBottom = '5px';
+        fileItem.style.boxShadow = '0 1px 3px rgba(0,0,0,0.1)';
+
+        // ファイル情報部分
+        const fileInfo = document.createElement('div');
+        fileInfo.style.display = 'flex';
+        fileInfo.style.alignItems = 'center';
+        fileInfo.style.flex = '1';
+
+        // ファイルアイコン
+        const icon = document.createElement('i');
+        icon.style.marginRight = '10px';
+        icon.style.fontSize = '1.2em';
+
+        if (file.type.startsWith('image/')) {
+            icon.className = 'fas fa-image';
+            icon.style.color = '#28a745';
+        } else if (file.type === 'application/pdf') {
+            icon.className = 'fas fa-file-pdf';
+            icon.style.color = '#dc3545';
+        } else {
+            icon.className = 'fas fa-file';
+            icon.style.color = '#6c757d';
+        }
+
+        // ファイル名とサイズ
+        const fileDetails = document.createElement('div');
+
+        const fileName = document.createElement('div');
+        fileName.style.fontWeight = '500';
+        fileName.style.color = '#495057';
+        fileName.textContent = file.name;
+
+        const fileSize = document.createElement('div');
+        fileSize.style.fontSize = '0.8em';
+        fileSize.style.color = '#6c757d';
+        const sizeInMB = (file.size / (1024 * 1024)).toFixed(2);
+        fileSize.textContent = `${sizeInMB} MB`;
+
+        // サイズ警告
+        if (file.size > maxUploadSize) {
+            fileSize.style.color = '#dc3545';
+            fileSize.textContent += ' ⚠️ サイズオーバー';
+        }
+
+        fileDetails.appendChild(fileName);
+        fileDetails.appendChild(fileSize);
+
+        fileInfo.appendChild(icon);
+        fileInfo.appendChild(fileDetails);
+
+        // 削除ボタン
+        const deleteBtn = document.createElement('button');
+        deleteBtn.type = 'button';
+        deleteBtn.className = 'btn btn-sm btn-danger';
+        deleteBtn.style.padding = '4px 8px';
+        deleteBtn.style.fontSize = '0.8em';
+        deleteBtn.style.backgroundColor = '#dc3545';
+        deleteBtn.style.color = 'white';
+        deleteBtn.style.border = '1px solid #dc3545';
+        deleteBtn.style.borderRadius = '4px';
+        deleteBtn.style.cursor = 'pointer';
+        deleteBtn.innerHTML = '<i class="fas fa-trash"></i> 削除';
+        deleteBtn.addEventListener('click', () => removeFileFromSelection(index));
+
+        fileItem.appendChild(fileInfo);
+        fileItem.appendChild(deleteBtn);
+
+        fileList.appendChild(fileItem);
+    });
+
+    filePreview.appendChild(fileList);
+}
+
+// フォーム送信時の処理
+document.getElementById('examForm').addEventListener('submit', function(e) {
+    let hasLargeFile = false;
+
+    // ファイルサイズチェック
+    selectedFiles.forEach(file => {
+        if (file.size > maxUploadSize) {
+            hasLargeFile = true;
+        }
+    });
+
+    if (hasLargeFile) {
+        e.preventDefault();
+        alert(`${maxUploadSize / (1024 * 1024)}MBを超えるファイルが含まれています。ファイルサイズを確認してください。`);
+        return;
+    }
+
+    // 基本的なバリデーション
+    const requiredFields = ['faculty', 'department', 'subject_name', 'subject_type', 
+                          'semester', 'grade_level', 'professor_name', 'exam_type', 'exam_year'];
+
+    let isValid = true;
+    requiredFields.forEach(fieldId => {
+        const field = document.getElementById(fieldId);
+        if (!field.value.trim()) {
+            field.style.borderColor = '#dc3545';
+            isValid = false;
+        } else {
+            field.style.borderColor = '#ced4da';
+        }
+    });
+
+    if (!isValid) {
+        e.preventDefault();
+        alert('必須項目をすべて入力してください。');
+        return;
+    }
+
+    // 送信中の表示
+    const submitBtn = document.querySelector('button[type="submit"]');
+    submitBtn.innerHTML = '📤 送信中...';
+    submitBtn.disabled = true;
+
+    if (selectedFiles.length === 0) {
+        return;
+    }
+
+    // ファイルは先に分割アップロードし、フォームには upload_ids だけを含めて送信
+    e.preventDefault();
+    const form = this;
+    (async () => {
+        try {
+            for (const [index, file] of selectedFiles.entries()) {
+                const uploadId = await uploadInParts(file, ratio => {
+                    submitBtn.innerHTML = `📤 アップロード中 (${index + 1}/${selectedFiles.length}) ${Math.floor(ratio * 100)}%`;
+                });
+                const input = document.createElement('input');
+                input.type = 'hidden';
+                input.name = 'upload_ids';
+                input.value = uploadId;
+                form.appendChild(input);
+            }
+            fileInput.files = new DataTransfer().files;
+            submitBtn.innerHTML = '📤 送信中...';
+            form.submit();
+        } catch (error) {
+            form.querySelectorAll('input[name="upload_ids"]').forEach(input => input.remove());
+            submitBtn.innerHTML = originalSubmitLabel;
+            submitBtn.disabled = false;
+            alert('ファイルのアップロードに失敗しました: ' + error.message);
+        }
+    })();
+});
+const originalSubmitLabel = document.querySelector('button[type="submit"]').innerHTML;
+
+// サーバー側で拒否されたなど、再送しても成功しないエラー
+class UploadError extends Error {}
+
+// ファイルを part_size ごとに PUT で送信し、upload_id を返す
+// 通信が途切れた場合は受信済みの位置を問い合わせて続きから再送する
+async function uploadInParts(file, onProgress) {
+    const response = await fetch(container.dataset.uploadSessionsUrl, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({filename: file.name, size: file.size})
+    });
+    const created = await response.json();
+    if (!created.success) {
+        throw new UploadError(created.message);
+    }
+    const sessionUrl = `${container.dataset.uploadSessionsUrl}/${created.upload_id}`;
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        let part;
+        try {
+            const partResponse = await fetch(sessionUrl, {
+                method: 'PUT',
+                headers: {'Upload-Offset': String(offset)},
+                body: file.slice(offset, offset + created.part_size)
+            });
+            part = await partResponse.json();
+            if (!part.success && partResponse.status !== 409) {
+                throw new UploadError(part.message);
+            }
+            retries = 0;
+        } catch (error) {
+            if (error instanceof UploadError || ++retries > 3) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            part = await (await fetch(sessionUrl)).json();
+            if (!part.success) {
+                throw new UploadError(part.message);
+            }
+        }
+        offset = part.offset;
+        onProgress(offset / file.size);
+    }
+    return created.upload_id;
+}
+
+// 初期化時にFont Awesomeアイコンが利用できない場合の対策
+document.addEventListener('DOMContentLoaded', function() {
+    // Font Awesomeが読み込まれていない場合のフォールバック
+    const testIcon = document.createElement('i');
+    testIcon.className = 'fas fa-test';
+    document.body.appendChild(testIcon);
+
+    const hasFA = window.getComputedStyle(testIcon, ':before').getPropertyValue('font-family').includes('Font Awesome');
+    document.body.removeChild(testIcon);
+
+    if (!hasFA) {
+        console.warn('Font Awesome not loaded, using text fallbacks');
+        // Font Awesomeが利用できない場合はテキストで代替
+        window.faFallback = true;
+    }
+});
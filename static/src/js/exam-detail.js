@@ -0,0 +1,418 @@
+// 試験データを取得（変数名を変更）
+const examDetailData = JSON.parse(document.getElementById('exam-data').textContent);
+
+// 画像拡大モーダル
+function openImageModal(imageSrc, title, originalSrc) {
+    const modalImage = document.getElementById('modalImage');
+    modalImage.src = imageSrc;
+    // ダウンロードは縮小版ではなく元のファイルを対象にする
+    modalImage.dataset.original = originalSrc || imageSrc;
+    document.getElementById('imageModalLabel').textContent = title;
+    const modal = new bootstrap.Modal(document.getElementById('imageModal'));
+    modal.show();
+}
+
+// 画像ダウンロード
+function downloadImage() {
+    const img = document.getElementById('modalImage');
+    const link = document.createElement('a');
+    link.href = img.dataset.original || img.src;
+    link.download = img.alt + '.jpg';
+    link.click();
+}
+
+// 試験問題画像のみを印刷
+function printExamQuestions() {
+    if (examDetailData.questions.length === 0) {
+        alert('印刷可能な試験問題が見つかりません。');
+        return;
+    }
+
+    // 印刷用のウィンドウを作成
+    const printWindow = window.open('', '_blank');
+
+    // 印刷用HTMLを構築
+    let printContent = `
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <title>${examDetailData.title} - ${examDetailData.examType} (${examDetailData.year}年度)</title>
+            <style>
+                @page {
+                    margin: 20mm;
+                    size: A4;
+                }
+
+                body {
+                    font-family: 'MS Gothic', monospace;
+                    margin: 0;
+                    padding: 0;
+                    background: white;
+                }
+
+                .print-header {
+                    text-align: center;
+                    margin-bottom: 20px;
+                    padding-bottom: 10px;
+                    border-bottom: 2px solid #000;
+                }
+
+                .print-header h1 {
+                    font-size: 18px;
+                    margin: 0;
+                    font-weight: bold;
+                }
+
+                .print-header p {
+                    font-size: 12px;
+                    margin: 5px 0 0 0;
+                    color: #333;
+                }
+
+                .question-container {
+                    page-break-inside: avoid;
+                    margin-bottom: 30px;
+                }
+
+                .question-title {
+                    font-size: 14px;
+                    font-weight: bold;
+                    margin-bottom: 10px;
+                    padding: 5px 10px;
+                    background-color: #f0f0f0;
+                    border-left: 4px solid #333;
+                }
+
+                .question-image {
+                    max-width: 100%;
+                    height: auto;
+                    border: 1px solid #ddd;
+                    margin-bottom: 10px;
+                }
+
+                .pdf-placeholder {
+                    border: 2px dashed #ccc;
+                    padding: 40px;
+                    text-align: center;
+                    font-size: 14px;
+                    color: #666;
+                    margin-bottom: 10px;
+                }
+
+                .file-info {
+                    font-size: 10px;
+                    color: #666;
+                    margin-bottom: 15px;
+                }
+            </style>
+        </head>
+        <body>
+            <div class="print-header">
+                <h1>${examDetailData.title}</h1>
+                <p>${examDetailData.faculty} ${examDetailData.department} - ${examDetailData.examType} (${examDetailData.year}年度)</p>`;
+
+    if (examDetailData.professor) {
+        printContent += `<p>担当: ${examDetailData.professor}</p>`;
+    }
+
+    if (examDetailData.instructions) {
+        printContent += `<p style="font-size: 11px; margin-top: 10px;">${examDetailData.instructions}</p>`;
+    }
+
+    printContent += `</div>`;
+
+    // 各問題を印刷用に追加
+    examDetailData.questions.forEach((question, index) => {
+        printContent += `<div class="question-container">`;
+        printContent += `<div class="question-title">問題 ${question.id}</div>`;
+
+        if (['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'].includes(question.extension)) {
+            // 画像ファイルの場合
+            printContent += `<img src="${question.path}" class="question-image" alt="問題${question.id}">`;
+        } else if (question.extension === 'pdf') {
+            // PDFファイルの場合
+            printContent += `
+                <div class="pdf-placeholder">
+                    <strong>📄 PDFファイル</strong><br>
+                    ファイル名: ${question.filename}<br>
+                    <small>※ PDFファイルは別途開いて印刷してください</small>
+                </div>
+            `;
+        }
+
+        printContent += `<div class="file-info">ファイル名: ${question.filename}</div>`;
+        printContent += `</div>`;
+    });
+
+    printContent += `
+            <div style="margin-top: 40px; text-align: center; font-size: 10px; color: #666;">
+                印刷日時: ${new Date().toLocaleString('ja-JP')}
+            </div>
+        </body>
+        </html>
+    `;
+
+    // 印刷ウィンドウにコンテンツを書き込み
+    printWindow.document.write(printContent);
+    printWindow.document.close();
+
+    // 画像の読み込みを待ってから印刷
+    printWindow.onload = function() {
+        setTimeout(() => {
+            printWindow.print();
+            printWindow.onafterprint = function() {
+                printWindow.close();
+            };
+        }, 500);
+    };
+}
+
+// 試験情報共有
+function shareExam() {
+    const url = window.location.href;
+    const title = `${examDetailData.title}(${examDetailData.examType}, ${examDetailData.year}年度)`;
+
+    if (navigator.share) {
+        navigator.share({
+            title: title,
+            url: url
+        });
+    } else {
+        navigator.clipboard.writeText(url).then(() => {
+            alert('URLがクリップボードにコピーされました');
+        });
+    }
+}
+
+// 問題報告
+function reportIssue() {
+    const examInfo = `${examDetailData.title}(${examDetailData.examType}, ${examDetailData.year}年度)`;
+    const message = `以下の試験について問題を報告します:\n\n試験: ${examInfo}\nURL: ${window.location.href}\n\n問題の詳細:\n`;
+
+    const mailtoLink = `mailto:admin@example.com?subject=試験問題の報告&body=${encodeURIComponent(message)}`;
+    window.location.href = mailtoLink;
+}
+
+// キーボードショートカット
+document.addEventListener('keydown', function(e) {
+    if (e.key === 'Escape') {
+        const modal = bootstrap.Modal.getInstance(document.getElementById('imageModal'));
+        if (modal) modal.hide();
+    }
+
+    if (e.ctrlKey && e.key === 'p') {
+        e.preventDefault();
+        printExamQuestions();
+    }
+});
+
+// 画像の遅延読み込み対応
+document.addEventListener('DOMContentLoaded', function() {
+    const images = document.querySelectorAll('img');
+    images.forEach(img => {
+        img.addEventListener('error', function() {
+            this.src = 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjIwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMTAwJSIgaGVpZ2h0PSIxMDAlIiBmaWxsPSIjZGRkIi8+PHRleHQgeD0iNTAlIiB5PSI1MCUiIGZvbnQtc2l6ZT0iMTgiIHRleHQtYW5jaG9yPSJtaWRkbGUiIGR5PSIuM2VtIj7nlLvlg4/jgYzopovjgaTjgYvjgorjgb7jgZvjgpM8L3RleHQ+PC9zdmc+';
+            this.alt = '画像が見つかりません';
+        });
+    });
+});
+
+// 詳細削除モーダルを開く
+function openDetailDeleteModal() {
+    const modal = new bootstrap.Modal(document.getElementById('detailDeleteModal'));
+    modal.show();
+}
+
+// 削除モーダルを開く（ボタンクリック時）
+function openDeleteModal(button) {
+    // ボタンからexam_idを取得
+    const examId = button.getAttribute('data-exam-id');
+
+    // グローバル変数に保存
+    window.currentExamData = {
+        id: examId,
+        subjectName: button.getAttribute('data-subject-name'),
+        examType: button.getAttribute('data-exam-type'),
+        examYear: button.getAttribute('data-exam-year'),
+        faculty: button.getAttribute('data-faculty'),
+        department: button.getAttribute('data-department'),
+        professor: button.getAttribute('data-professor'),
+        instructions: button.getAttribute('data-instructions')
+    };
+
+    // モーダルを開く
+    const modal = new bootstrap.Modal(document.getElementById('detailDeleteModal'));
+    modal.show();
+}
+
+// 削除ボタンの有効/無効を切り替え
+function toggleDeleteButton() {
+    const checkbox = document.getElementById('confirmDelete');
+    const button = document.getElementById('detailDeleteBtn');
+
+    if (checkbox.checked) {
+        button.disabled = false;
+        button.innerHTML = '<i class="fas fa-trash"></i> 削除実行';
+    } else {
+        button.disabled = true;
+        button.innerHTML = '<i class="fas fa-trash"></i> 削除実行';
+    }
+}
+
+// 詳細削除実行
+function executeDetailDelete() {
+    const examId = window.currentExamData.id;
+
+    // 確認モーダルを閉じる
+    const confirmModal = bootstrap.Modal.getInstance(document.getElementById('detailDeleteModal'));
+    confirmModal.hide();
+
+    // 進行状況モーダルを表示
+    const progressModal = new bootstrap.Modal(document.getElementById('detailDeleteProgressModal'));
+    progressModal.show();
+
+    // プログレスバーアニメーション
+    let progress = 0;
+    const progressBar = document.querySelector('#detailDeleteProgressModal .progress-bar');
+    const progressInterval = setInterval(() => {
+        progress += Math.random() * 30;
+        if (progress > 90) progress = 90;
+        progressBar.style.width = progress + '%';
+    }, 200);
+
+    // Ajax で削除実行
+    fetch(`/exam-delete-ajax/${examId}`, {
+        method: 'DELETE',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        clearInterval(progressInterval);
+
+        if (data.success) {
+            // 成功時は100%にしてから閉じる
+            progressBar.style.width = '100%';
+
+            setTimeout(() => {
+                progressModal.hide();
+
+                // 成功メッセージを表示してから一覧ページに遷移
+                showSuccessModalAndRedirect(data.message);
+            }, 500);
+        } else {
+            progressModal.hide();
+            showErrorModal(data.message);
+        }
+    })
+    .catch(error => {
+        clearInterval(progressInterval);
+        console.error('Error:', error);
+        progressModal.hide();
+        showErrorModal('削除中にエラーが発生しました');
+    });
+}
+
+// 成功モーダルを表示して一覧ページに遷移
+function showSuccessModalAndRedirect(message) {
+    const successModalHtml = `
+        <div class="modal fade" id="successModal" tabindex="-1" aria-hidden="true" data-bs-backdrop="static">
+            <div class="modal-dialog modal-dialog-centered">
+                <div class="modal-content">
+                    <div class="modal-header bg-success text-white">
+                        <h5 class="modal-title">
+                            <i class="fas fa-check-circle"></i> 削除完了
+                        </h5>
+                    </div>
+                    <div class="modal-body text-center py-4">
+                        <i class="fas fa-check-circle text-success mb-3" style="font-size: 3rem;"></i>
+                        <h6 class="fw-bold">${message}</h6>
+                        <p class="text-muted">3秒後に試験一覧ページに移動します...</p>
+                        <div class="progress mt-3" style="height: 4px;">
+                            <div class="progress-bar bg-success" role="progressbar" style="width: 0%"></div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+    `;
+
+    document.body.insertAdjacentHTML('beforeend', successModalHtml);
+    const successModal = new bootstrap.Modal(document.getElementById('successModal'));
+    successModal.show();
+
+    // 3秒のカウントダウン
+    let countdown = 3;
+    const progressBar = document.querySelector('#successModal .progress-bar');
+    const countdownInterval = setInterval(() => {
+        countdown--;
+        progressBar.style.width = ((3 - countdown) / 3 * 100) + '%';
+
+        if (countdown <= 0) {
+            clearInterval(countdownInterval);
+            window.location.href = JSON.parse(document.getElementById('url-data').textContent).exams_list;
+        }
+    }, 1000);
+}
+
+// エラーモーダルを表示
+function showErrorModal(message) {
+    const errorModalHtml = `
+        <div class="modal fade" id="errorModal" tabindex="-1" aria-hidden="true">
+            <div class="modal-dialog modal-dialog-centered">
+                <div class="modal-content">
+                    <div class="modal-header bg-danger text-white">
+                        <h5 class="modal-title">
+                            <i class="fas fa-exclamation-circle"></i> 削除エラー
+                        </h5>
+                        <button type="button" class="btn-close btn-close-white" data-bs-dismiss="modal"></button>
+                    </div>
+                    <div class="modal-body text-center py-4">
+                        <i class="fas fa-exclamation-triangle text-danger mb-3" style="font-size: 3rem;"></i>
+                        <h6 class="fw-bold text-danger">削除に失敗しました</h6>
+                        <p class="text-muted">${message}</p>
+                    </div>
+                    <div class="modal-footer">
+                        <button type="button" class="btn btn-secondary" data-bs-dismiss="modal">
+                            <i class="fas fa-times"></i> 閉じる
+                        </button>
+                        <button type="button" class="btn btn-primary" onclick="openDetailDeleteModal(); bootstrap.Modal.getInstance(document.getElementById('errorModal')).hide();">
+                            <i class="fas fa-redo"></i> 再試行
+                        </button>
+                    </div>
+                </div>
+            </div>
+        </div>
+    `;
+
+    document.body.insertAdjacentHTML('beforeend', errorModalHtml);
+    const errorModal = new bootstrap.Modal(document.getElementById('errorModal'));
+    errorModal.show();
+
+    // モーダルが閉じられたらHTML要素を削除
+    document.getElementById('errorModal').addEventListener('hidden.bs.modal', function() {
+        this.remove();
+    });
+}
+
+// モーダルのキーボード操作
+document.addEventListener('keydown', function(e) {
+    const modal = document.getElementById('detailDeleteModal');
+    if (modal && modal.classList.contains('show')) {
+        if (e.key === 'Enter' && e.ctrlKey) {
+            e.preventDefault();
+            const deleteBtn = document.getElementById('detailDeleteBtn');
+            if (!deleteBtn.disabled) {
+                executeDetailDelete();
+            }
+        }
+    }
+});
+
+// モーダルが閉じられたらチェックボックスをリセット
+document.getElementById('detailDeleteModal').addEventListener('hidden.bs.modal', function() {
+    document.getElementById('confirmDelete').checked = false;
+    toggleDeleteButton();
+});
@@ -0,0 +1,260 @@
+// ユーザー情報を安全に取得
+function getCurrentUserId() {
+    const userDataElement = document.getElementById('user-data');
+    const userId = userDataElement.dataset.userId;
+    return userId ? parseInt(userId) : null;
+}
+
+function filterByYear(year) {
+    document.getElementById('year_from').value = year;
+    document.getElementById('year_to').value = year;
+    document.querySelector('form').submit();
+}
+
+function filterByFaculty(faculty) {
+    const select = document.getElementById('faculty_id');
+    const option = Array.from(select.options).find(item => item.text === faculty);
+    if (!option) {
+        return;
+    }
+    select.value = option.value;
+    document.getElementById('department_id').value = '';
+    document.querySelector('form').submit();
+}
+
+// 自分の試験のみ表示するフィルター
+let showOnlyMyExams = false;
+
+function toggleMyExams() {
+    const currentUserId = getCurrentUserId();
+    const rows = document.querySelectorAll('tbody tr');
+    const button = document.querySelector('button[onclick="toggleMyExams()"]');
+    const status = document.getElementById('filter-status');
+
+    if (!currentUserId) {
+        alert('ログインが必要です');
+        return;
+    }
+
+    showOnlyMyExams = !showOnlyMyExams;
+
+    let visibleCount = 0;
+    rows.forEach(row => {
+        const createdBy = getCreatedByFromRow(row);
+
+        if (showOnlyMyExams) {
+            if (createdBy === currentUserId) {
+                row.style.display = '';
+                visibleCount++;
+            } else {
+                row.style.display = 'none';
+            }
+        } else {
+            row.style.display = '';
+            visibleCount++;
+        }
+    });
+
+    if (showOnlyMyExams) {
+        button.innerHTML = '<i class="fas fa-users"></i> すべての試験を表示';
+        button.className = 'btn btn-success btn-sm';
+        status.textContent = `あなたの試験: ${visibleCount}件`;
+    } else {
+        button.innerHTML = '<i class="fas fa-user"></i> 自分の試験のみ表示';
+        button.className = 'btn btn-outline-success btn-sm';
+        status.textContent = '';
+    }
+
+    // 試験数バッジを更新
+    const badge = document.querySelector('.badge.bg-primary');
+    if (badge) {
+        badge.textContent = `${visibleCount}件`;
+    }
+}
+
+// 行から作成者IDを安全に取得する関数
+function getCreatedByFromRow(row) {
+    const createdBy = row.dataset.createdBy;
+    return createdBy ? parseInt(createdBy) : null;
+}
+
+// テーブルの行ホバー効果
+document.addEventListener('DOMContentLoaded', function() {
+    const rows = document.querySelectorAll('tbody tr');
+    rows.forEach(row => {
+        // 行全体のクリックは詳細ページに飛ばず、ボタンのみで操作
+        row.style.cursor = 'default';
+    });
+
+    // 作成者マークにツールチップ効果
+    const creationMarks = document.querySelectorAll('.my-creation-mark');
+    creationMarks.forEach(mark => {
+        mark.title = 'あなたが作成した試験です。編集権限があります。';
+    });
+});
+
+let currentExamId = null;
+let currentExamData = {};
+
+// 削除モーダルを開く
+function openDeleteModal(button) {
+    // ボタンからデータを取得
+    const examId = button.getAttribute('data-exam-id');
+    const subjectName = button.getAttribute('data-subject-name');
+    const examType = button.getAttribute('data-exam-type');
+    const examYear = button.getAttribute('data-exam-year');
+    const faculty = button.getAttribute('data-faculty');
+    const department = button.getAttribute('data-department');
+    const professor = button.getAttribute('data-professor');
+
+    currentExamId = examId;
+    currentExamData = {
+        id: examId,
+        subject: subjectName,
+        examType: examType,
+        year: examYear,
+        faculty: faculty,
+        department: department,
+        professor: professor
+    };
+
+    // モーダルを表示
+    const modal = new bootstrap.Modal(document.getElementById('deleteConfirmModal'));
+    modal.show();
+}
+
+// 削除実行
+function executeDelete() {
+    if (!currentExamId) return;
+
+    // 確認モーダルを閉じる
+    const confirmModal = bootstrap.Modal.getInstance(document.getElementById('deleteConfirmModal'));
+    confirmModal.hide();
+
+    // Ajax で削除実行
+    fetch(`/exam-delete-ajax/${currentExamId}`, {
+        method: 'DELETE',
+        headers: {
+            'Content-Type': 'application/json',
+        }
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        if (data.success) {
+            // 成功時は行をアニメーションで削除
+            const row = document.querySelector(`button[data-exam-id="${currentExamId}"]`).closest('tr');
+
+            if (row) {
+                // 成功アニメーション
+                row.style.transition = 'all 0.5s ease-out';
+                row.style.backgroundColor = '#d4edda';
+                row.style.transform = 'scale(0.95)';
+
+                setTimeout(() => {
+                    row.style.opacity = '0';
+                    row.style.transform = 'translateX(-100%)';
+
+                    setTimeout(() => {
+                        row.remove();
+                        updateExamCount();
+                        showSuccessToast(data.message);
+                    }, 500);
+                }, 300);
+            } else {
+                // 行が見つからない場合はページをリロード
+                showSuccessToast(data.message);
+                setTimeout(() => {
+                    window.location.reload();
+                }, 1000);
+            }
+        } else {
+            showErrorAlert(data.message || '削除に失敗しました');
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showErrorAlert('削除中にエラーが発生しました: ' + error.message);
+    });
+}
+
+// 成功トーストを表示
+function showSuccessToast(message) {
+    const toastHtml = `
+        <div class="toast align-items-center text-white bg-success border-0" role="alert" aria-live="assertive" aria-atomic="true">
+            <div class="d-flex">
+                <div class="toast-body">
+                    <i class="fas fa-check-circle me-2"></i>${message}
+                </div>
+                <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
+            </div>
+        </div>
+    `;
+
+    // トーストコンテナがなければ作成
+    let toastContainer = document.querySelector('.toast-container');
+    if (!toastContainer) {
+        toastContainer = document.createElement('div');
+        toastContainer.className = 'toast-container position-fixed top-0 end-0 p-3';
+        document.body.appendChild(toastContainer);
+    }
+
+    toastContainer.insertAdjacentHTML('beforeend', toastHtml);
+    const toastElement = toastContainer.lastElementChild;
+    const toast = new bootstrap.Toast(toastElement);
+    toast.show();
+
+    // 5秒後に自動削除
+    setTimeout(() => {
+        if (toastElement && toastElement.parentNode) {
+            toastElement.remove();
+        }
+    }, 5000);
+}
+
+// エラーアラートを表示
+function showErrorAlert(message) {
+    const alertHtml = `
+        <div class="alert alert-danger alert-dismissible fade show" role="alert">
+            <i class="fas fa-exclamation-circle me-2"></i>
+            <strong>エラー:</strong> ${message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+        </div>
+    `;
+
+    // ページの最初に挿入
+    const firstCard = document.querySelector('.card');
+    firstCard.insertAdjacentHTML('beforebegin', alertHtml);
+
+    // 5秒後に自動削除
+    setTimeout(() => {
+        const alert = document.querySelector('.alert-danger');
+        if (alert) {
+            alert.remove();
+        }
+    }, 5000);
+}
+
+// 試験数カウントを更新
+function updateExamCount() {
+    const visibleRows = document.querySelectorAll('tbody tr:not([style*="display: none"])');
+    const badge = document.querySelector('.badge.bg-primary');
+    if (badge) {
+        badge.textContent = `${visibleRows.length}件`;
+    }
+}
+
+// モーダルのキーボード操作
+document.addEventListener('keydown', function(e) {
+    const modal = document.getElementById('deleteConfirmModal');
+    if (modal.classList.contains('show')) {
+        if (e.key === 'Enter' && e.ctrlKey) {
+            e.preventDefault();
+            executeDelete();
+        }
+    }
+});
@@ -0,0 +1,31 @@
+// 統計数字のカウントアップアニメーション
+document.addEventListener('DOMContentLoaded', function() {
+    const badges = document.querySelectorAll('.badge');
+    badges.forEach(badge => {
+        const finalValue = parseInt(badge.textContent);
+        if (finalValue > 0 && finalValue < 100) {
+            badge.textContent = '0';
+            let current = 0;
+            const increment = 1;
+            const timer = setInterval(() => {
+                current += increment;
+                if (current >= finalValue) {
+                    current = finalValue;
+                    clearInterval(timer);
+                }
+                badge.textContent = current;
+            }, 100);
+        }
+    });
+
+    // カードのホバー効果を強化
+    const cards = document.querySelectorAll('.card');
+    cards.forEach(card => {
+        card.addEventListener('mouseenter', function() {
+            this.style.transform = 'translateY(-5px)';
+        });
+        card.addEventListener('mouseleave', function() {
+            this.style.transform = 'translateY(0)';
+        });
+    });
+});
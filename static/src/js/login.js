@@ -0,0 +1,96 @@
+// パスワード表示/非表示切り替え
+document.getElementById('togglePassword').addEventListener('click', function() {
+    const passwordInput = document.getElementById('password');
+    const toggleIcon = document.getElementById('toggleIcon');
+
+    if (passwordInput.type === 'password') {
+        passwordInput.type = 'text';
+        toggleIcon.classList.remove('fa-eye');
+        toggleIcon.classList.add('fa-eye-slash');
+    } else {
+        passwordInput.type = 'password';
+        toggleIcon.classList.remove('fa-eye-slash');
+        toggleIcon.classList.add('fa-eye');
+    }
+});
+
+// フォーム送信時のローディング状態
+document.getElementById('loginForm').addEventListener('submit', function() {
+    const loginBtn = document.getElementById('loginBtn');
+    loginBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>ログイン中...';
+    loginBtn.disabled = true;
+});
+
+// メールアドレス入力時のkeio.jpドメインチェック
+document.getElementById('email').addEventListener('blur', function() {
+    const email = this.value.toLowerCase();
+    if (email && !email.endsWith('@keio.jp')) {
+        this.setCustomValidity('keio.jpドメインのメールアドレスを入力してください');
+        this.reportValidity();
+    } else {
+        this.setCustomValidity('');
+    }
+});
+
+// ページロード時のアニメーション
+document.addEventListener('DOMContentLoaded', function() {
+    // フェードインアニメーション
+    const loginCard = document.querySelector('.login-card');
+    const featuresCard = document.querySelector('.login-features');
+
+    loginCard.style.opacity = '0';
+    loginCard.style.transform = 'translateY(30px)';
+    featuresCard.style.opacity = '0';
+    featuresCard.style.transform = 'translateY(30px)';
+
+    setTimeout(() => {
+        loginCard.style.transition = 'all 0.6s ease';
+        featuresCard.style.transition = 'all 0.6s ease';
+        loginCard.style.opacity = '1';
+        loginCard.style.transform = 'translateY(0)';
+
+        setTimeout(() => {
+            featuresCard.style.opacity = '1';
+            featuresCard.style.transform = 'translateY(0)';
+        }, 200);
+    }, 100);
+
+    // 統計数字のカウントアップ
+    const stats = document.querySelectorAll('.fw-bold');
+    stats.forEach(stat => {
+        const text = stat.textContent;
+        const number = parseInt(text);
+        if (number && number < 10) {
+            stat.textContent = '0';
+            let current = 0;
+            const timer = setInterval(() => {
+                current++;
+                stat.textContent = current + text.replace(number.toString(), '');
+                if (current >= number) {
+                    clearInterval(timer);
+                }
+            }, 200);
+        }
+    });
+});
+
+// デモアカウントのクリック機能
+document.querySelectorAll('.demo-account').forEach(demo => {
+    demo.style.cursor = 'pointer';
+    demo.addEventListener('click', function() {
+        const text = this.textContent;
+        const emailMatch = text.match(/(\w+@keio\.jp)/);
+        const passwordMatch = text.match(/(\w+123)/);
+
+        if (emailMatch && passwordMatch) {
+            document.getElementById('email').value = emailMatch[1];
+            document.getElementById('password').value = passwordMatch[1];
+
+            // 視覚的フィードバック
+            this.style.background = '#e3f2fd';
+            setTimeout(() => {
+                this.style.background = '';
+            }, 500);
+        }
+    });
+});
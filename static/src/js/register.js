@@ -0,0 +1,25 @@
+// パスワード確認チェック
+function checkPasswordMatch() {
+    const password = document.getElementById('password').value;
+    const confirmPassword = document.getElementById('confirm_password').value;
+
+    if (confirmPassword && password !== confirmPassword) {
+        document.getElementById('confirm_password').setCustomValidity('パスワードが一致しません');
+    } else {
+        document.getElementById('confirm_password').setCustomValidity('');
+    }
+}
+
+document.getElementById('password').addEventListener('input', checkPasswordMatch);
+document.getElementById('confirm_password').addEventListener('input', checkPasswordMatch);
+
+// メールアドレスドメインチェック
+document.getElementById('email').addEventListener('blur', function() {
+    const email = this.value.toLowerCase();
+    if (email && !email.endsWith('@keio.jp')) {
+        this.setCustomValidity('keio.jpドメインのメールアドレスを入力してください');
+        this.reportValidity();
+    } else {
+        this.setCustomValidity('');
+    }
+});
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+WSGI エントリポイント
+
+mod_wsgi や gunicorn などの常駐型 WSGI サーバーから読み込むためのモジュール
+（例: gunicorn -w 4 wsgi:application）
+"""
+
+from app import app as application, require_vendor_assets
+
+require_vendor_assets()